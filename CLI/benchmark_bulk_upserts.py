@@ -0,0 +1,160 @@
+"""
+Benchmark de los upserts bulk de database/videos.py contra una BD sintética.
+Compara el bucle fila a fila (una ida y vuelta al hilo de aiosqlite por fila)
+con los db_bulk_* basados en executemany, en filas/segundo.
+
+Uso:
+    python CLI/benchmark_bulk_upserts.py --rows 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database.connection as db_connection
+from database.connection import get_db, close_pool
+from database.videos import (
+    UPSERT_VIDEO_SQL,
+    UPSERT_VIDEO_MESSAGE_SQL,
+    ADD_VIDEO_FILE_ID_SQL,
+    video_params,
+    video_message_params,
+    ensure_video_messages_table,
+    db_bulk_upsert_videos,
+    db_bulk_upsert_video_messages,
+    db_bulk_add_video_file_ids,
+)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS videos_telegram (
+        id TEXT PRIMARY KEY,
+        chat_id INTEGER,
+        message_id INTEGER,
+        file_id TEXT,
+        file_unique_id TEXT,
+        nombre TEXT,
+        caption TEXT,
+        tamano_bytes INTEGER,
+        fecha_mensaje TEXT,
+        duracion INTEGER,
+        ancho INTEGER,
+        alto INTEGER,
+        es_vertical INTEGER,
+        mime_type TEXT,
+        views INTEGER,
+        outgoing INTEGER,
+        has_thumb INTEGER DEFAULT 0,
+        UNIQUE (chat_id, message_id)
+    );
+    CREATE TABLE IF NOT EXISTS video_file_ids (
+        video_id TEXT,
+        file_id TEXT,
+        file_unique_id TEXT,
+        origen TEXT,
+        fecha_detectado TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (video_id, file_id)
+    );
+"""
+
+
+def generar_datos(n: int, chat_id: int) -> tuple[list[dict], list[dict], list[tuple]]:
+    videos, mensajes, file_ids = [], [], []
+    for i in range(n):
+        uid = f"bench_{chat_id}_{i}"
+        videos.append({
+            "file_unique_id": uid,
+            "chat_id": chat_id,
+            "message_id": i,
+            "file_id": f"file_{uid}",
+            "nombre": f"video_{i}.mp4",
+            "caption": f"caption {i}",
+            "tamano_bytes": 1_000_000 + i,
+            "fecha_mensaje": "2024-01-01T00:00:00",
+            "duracion": i % 3600,
+            "ancho": 1280,
+            "alto": 720,
+            "mime_type": "video/mp4",
+            "views": i,
+            "outgoing": False,
+        })
+        mensajes.append({
+            "video_id": uid,
+            "chat_id": chat_id,
+            "message_id": i,
+            "date": "2024-01-01T00:00:00",
+            "from_user": {"id": 1, "username": "bench", "is_bot": False},
+            "media": "video",
+            "views": i,
+            "forwards": 0,
+            "outgoing": False,
+            "caption": f"caption {i}",
+        })
+        file_ids.append((uid, f"file_{uid}", uid, "bench"))
+    return videos, mensajes, file_ids
+
+
+async def bucle_fila_a_fila(videos, mensajes, file_ids) -> None:
+    """Comportamiento anterior: un execute por fila dentro de la misma transacción."""
+    async with get_db() as db:
+        await ensure_video_messages_table(db)
+        for video in videos:
+            await db.execute(UPSERT_VIDEO_SQL, video_params(video))
+        for row in file_ids:
+            await db.execute(ADD_VIDEO_FILE_ID_SQL, row)
+        for mensaje in mensajes:
+            await db.execute(UPSERT_VIDEO_MESSAGE_SQL, video_message_params(mensaje))
+        await db.commit()
+
+
+async def bulk_executemany(videos, mensajes, file_ids) -> dict:
+    return {
+        "videos": await db_bulk_upsert_videos(videos),
+        "file_ids": await db_bulk_add_video_file_ids(file_ids),
+        "mensajes": await db_bulk_upsert_video_messages(mensajes),
+    }
+
+
+async def medir(nombre: str, n: int, coro) -> float:
+    inicio = time.perf_counter()
+    resultado = await coro
+    segundos = time.perf_counter() - inicio
+    filas = n * 3
+    detalle = f"  {resultado}" if resultado else ""
+    print(f"   {nombre:<22} {segundos:8.3f}s  {filas / segundos:12,.0f} filas/s{detalle}")
+    return segundos
+
+
+async def run(sizes: list[int]) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_connection.DB_PATH = os.path.join(tmp, "bench.db")
+        async with get_db() as db:
+            await db.executescript(SCHEMA)
+            await db.commit()
+
+        for idx, n in enumerate(sizes):
+            print(f"📊 {n:,} videos ({n * 3:,} filas: videos + file_ids + mensajes)")
+            # Chats distintos para que cada pasada empiece insertando
+            videos, mensajes, file_ids = generar_datos(n, chat_id=idx * 10 + 1)
+            t_loop = await medir("fila a fila (insert)", n, bucle_fila_a_fila(videos, mensajes, file_ids))
+
+            videos, mensajes, file_ids = generar_datos(n, chat_id=idx * 10 + 2)
+            t_bulk = await medir("executemany (insert)", n, bulk_executemany(videos, mensajes, file_ids))
+            await medir("executemany (update)", n, bulk_executemany(videos, mensajes, file_ids))
+            print(f"   ⚡ speedup insert: x{t_loop / t_bulk:.1f}")
+
+        await close_pool()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de upserts bulk (executemany vs fila a fila)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Tamaños a medir")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(run(args.rows))
@@ -0,0 +1,109 @@
+"""
+Benchmark del pipeline de thumbs (sin la descarga de Telegram).
+- antes: escribir el JPEG en _tmp, to_thread(save_image_as_webp) con method=6 y borrar el temporal
+- después: bytes en memoria -> pool de procesos (utils.thumb_encoder) -> solo se escribe el .webp
+Reporta thumbs/segundo y el tamaño medio del WebP para cada esfuerzo (method).
+
+Uso:
+    python CLI/benchmark_thumb_encode.py --thumbs 300 --methods 6 4 2 0 --concurrency 16
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import save_image_as_webp
+from utils.thumb_encoder import save_thumb_as_webp, shutdown_thumb_encoder
+from config import THUMB_WEBP_QUALITY, THUMB_ENCODE_WORKERS
+
+
+def generar_thumbs(n: int, width: int = 320, height: int = 180) -> list[bytes]:
+    """JPEGs sintéticos parecidos a los thumbs de Telegram (ruido + formas)."""
+    thumbs = []
+    for i in range(n):
+        img = Image.effect_noise((width, height), 40 + i % 60).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((i % width, 10, (i * 7) % width + 40, height - 10), fill=(i % 255, 80, 160))
+        draw.ellipse((20, 20, 120, 120), fill=(200, (i * 3) % 255, 40))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        thumbs.append(buf.getvalue())
+    return thumbs
+
+
+async def antes(thumbs: list[bytes], out_dir: str, concurrency: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+    tmp_dir = os.path.join(out_dir, "_tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    async def uno(i: int, data: bytes):
+        async with sem:
+            tmp_path = os.path.join(tmp_dir, f"{i}.jpg")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            await asyncio.to_thread(save_image_as_webp, tmp_path, os.path.join(out_dir, f"{i}.webp"), 90, 6)
+            os.remove(tmp_path)
+
+    await asyncio.gather(*(uno(i, d) for i, d in enumerate(thumbs)))
+
+
+async def despues(thumbs: list[bytes], out_dir: str, concurrency: int, method: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def uno(i: int, data: bytes):
+        async with sem:
+            await save_thumb_as_webp(data, os.path.join(out_dir, f"{i}.webp"), THUMB_WEBP_QUALITY, method)
+
+    await asyncio.gather(*(uno(i, d) for i, d in enumerate(thumbs)))
+
+
+def tamano_medio(out_dir: str) -> float:
+    sizes = [e.stat().st_size for e in os.scandir(out_dir) if e.name.endswith(".webp")]
+    return sum(sizes) / len(sizes) / 1024 if sizes else 0.0
+
+
+async def medir(nombre: str, coro, n: int, out_dir: str) -> float:
+    inicio = time.perf_counter()
+    await coro
+    segundos = time.perf_counter() - inicio
+    print(f"   {nombre:<34} {n / segundos:9.1f} thumbs/s  ({tamano_medio(out_dir):5.1f} KB/webp)")
+    return n / segundos
+
+
+async def run(n: int, methods: list[int], concurrency: int) -> None:
+    thumbs = generar_thumbs(n)
+    print(f"📊 {n} thumbs JPEG ({sum(map(len, thumbs)) / n / 1024:.1f} KB medio), concurrencia {concurrency}, "
+          f"{THUMB_ENCODE_WORKERS} procesos")
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = os.path.join(tmp, "antes")
+        os.makedirs(base_dir)
+        base = await medir("temp file + hilo, method=6 (antes)", antes(thumbs, base_dir, concurrency), n, base_dir)
+
+        # Calentar el pool (el arranque de procesos no cuenta)
+        await despues(thumbs[:THUMB_ENCODE_WORKERS or 1], os.path.join(tmp, "warmup"), concurrency, 0)
+        for method in methods:
+            out_dir = os.path.join(tmp, f"m{method}")
+            os.makedirs(out_dir)
+            rate = await medir(f"memoria + procesos, method={method}", despues(thumbs, out_dir, concurrency, method), n, out_dir)
+            print(f"      ⚡ x{rate / base:.1f}")
+    shutdown_thumb_encoder()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de thumbs (temp file + hilo vs memoria + pool de procesos)")
+    parser.add_argument("--thumbs", type=int, default=300, help="Cantidad de thumbs sintéticos")
+    parser.add_argument("--methods", type=int, nargs="+", default=[6, 4, 2, 0], help="Esfuerzos WebP a medir")
+    parser.add_argument("--concurrency", type=int, default=16, help="Thumbs procesándose a la vez")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(run(args.thumbs, args.methods, args.concurrency))
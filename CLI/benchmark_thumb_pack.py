@@ -0,0 +1,110 @@
+"""
+Benchmark de latencia al servir thumbs: un .webp por video vs almacén empaquetado.
+- archivos: os.path.exists + abrir + leer (lo que hace /api/photo con FileResponse)
+- pack: consulta al índice + slice del mmap (services/thumb_pack.py)
+"Frío" = primera lectura tras sacar los archivos de la page cache (posix_fadvise,
+si el sistema lo soporta) y con el almacén recién abierto; "caliente" = segunda pasada.
+
+Uso:
+    python CLI/benchmark_thumb_pack.py --thumbs 20000 --chats 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.thumb_pack import ThumbPackStore, pack_path
+
+
+def generar(root: str, n: int, chats: int) -> list[tuple[int, str, str]]:
+    thumbs = []
+    for i in range(n):
+        chat_id = -1000000000000 - (i % chats)
+        uid = f"AgAD{i:010d}"
+        folder = os.path.join(root, str(chat_id))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{uid}.webp")
+        with open(path, "wb") as f:
+            f.write(os.urandom(random.randint(8 * 1024, 30 * 1024)))
+        thumbs.append((chat_id, uid, path))
+    return thumbs
+
+
+def desalojar_page_cache(paths: list[str]) -> bool:
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def leer_archivo(path: str) -> bytes | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def medir(nombre: str, fn, claves: list) -> None:
+    tiempos = []
+    for clave in claves:
+        t0 = time.perf_counter()
+        data = fn(clave)
+        tiempos.append(time.perf_counter() - t0)
+        assert data
+    tiempos.sort()
+    p50 = statistics.median(tiempos) * 1e6
+    p99 = tiempos[int(len(tiempos) * 0.99) - 1] * 1e6
+    print(f"   {nombre:<22} p50 {p50:8.1f} µs  p99 {p99:8.1f} µs  {len(claves) / sum(tiempos):10,.0f} thumbs/s")
+
+
+def run(n: int, chats: int, muestras: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "videos")
+        packs = os.path.join(tmp, "packs")
+        print(f"🛠️ Generando {n} thumbs en {chats} carpetas...")
+        thumbs = generar(root, n, chats)
+
+        store = ThumbPackStore(packs)
+        inicio = time.perf_counter()
+        for pos in range(0, n, 1000):
+            store.put_many([(c, u, leer_archivo(p)) for c, u, p in thumbs[pos:pos + 1000]])
+        print(f"📦 Empaquetado en {time.perf_counter() - inicio:.2f}s: {store.get_stats()}")
+        store.close()
+
+        muestra = random.sample(thumbs, min(muestras, n))
+        archivos = [p for _, _, p in muestra]
+        packs_files = [pack_path(p, packs) for p in ThumbPackStore(packs).list_packs()]
+
+        for fase in ("frío", "caliente"):
+            if fase == "frío":
+                if not desalojar_page_cache(archivos + packs_files):
+                    print("⚠️ posix_fadvise no disponible: la pasada 'fría' solo abre el almacén de cero")
+                store = ThumbPackStore(packs)
+            print(f"📊 {fase} ({len(muestra)} lecturas aleatorias)")
+            medir("archivo por thumb", leer_archivo, archivos)
+            medir("pack + mmap", lambda k: store.get(k[0], k[1]), [(c, u) for c, u, _ in muestra])
+        store.close()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de thumbs: archivo por video vs almacén empaquetado")
+    parser.add_argument("--thumbs", type=int, default=20_000, help="Cantidad de thumbs sintéticos")
+    parser.add_argument("--chats", type=int, default=50, help="Carpetas de chat")
+    parser.add_argument("--muestras", type=int, default=5_000, help="Lecturas aleatorias por pasada")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(args.thumbs, args.chats, args.muestras)
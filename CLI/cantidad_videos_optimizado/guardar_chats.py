@@ -1,4 +1,3 @@
-import asyncio
 import os
 import sys
 import json
@@ -18,6 +17,7 @@ if str(ROOT_DIR) not in sys.path:
 from services.telegram_client import get_client
 from services.unigram import obtener_fechas_y_ids
 from database.chats import db_bulk_upsert_chats
+from database.connection import run_with_pool
 from config import DB_PATH
 from utils import log_timing
 """
@@ -147,4 +147,4 @@ async def guardar_chats(limit: Optional[int] = None) -> None:
 
 if __name__ == "__main__":
     # Siempre recorre todos los diálogos (sin límite)
-    asyncio.run(guardar_chats(limit=None))
+    run_with_pool(guardar_chats(limit=None))
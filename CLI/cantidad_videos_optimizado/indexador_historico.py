@@ -17,6 +17,7 @@ try:
     # Importamos la versión BATCH del procesador
     from services.video_processor import procesar_mensajes_video_batch 
     from database.chats import db_get_chat
+    from database.connection import run_with_pool
     from utils.database_helpers import ensure_column
     from utils import log_timing
 except ImportError as e:
@@ -214,6 +215,6 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        run_with_pool(main())
     except KeyboardInterrupt:
         print("\n🛑 Detenido.")
\ No newline at end of file
@@ -18,6 +18,7 @@ from config import DB_PATH  # noqa: E402
 from database import (  # noqa: E402
     db_count_videos_by_chat,
     db_upsert_chat_video_count,
+    run_with_pool,
 )
 from services.telegram_client import get_client  # noqa: E402
 from services.video_processor import procesar_mensaje_video  # noqa: E402
@@ -149,7 +150,7 @@ def _parse_args():
 
 if __name__ == "__main__":
     args = _parse_args()
-    asyncio.run(
+    run_with_pool(
         indexar_primeros_videos(
             max_videos_por_chat=args.limit_per_chat,
             max_chats=args.max_chats,
@@ -17,6 +17,7 @@ from database import (  # noqa: E402
     db_add_video_file_id,
     db_upsert_video,
     db_upsert_video_message,
+    run_with_pool,
 )
 from utils import log_timing  # noqa: E402
 DIAS_ATRAS=1
@@ -154,4 +155,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_with_pool(main())
@@ -13,8 +13,9 @@ if str(ROOT_DIR) not in sys.path:
 from pyrogram import enums
 from config import DB_PATH
 from services.telegram_client import get_client
-from services.video_processor import procesar_mensajes_video_batch
+from services.video_processor import encolar_mensajes_video
 from database.connection import get_db, get_db_connection  # Conexión async optimizada
+from database.write_queue import db_flush_writes
 from utils import log_timing
 
 # Configuración de logging para ver detalles
@@ -148,14 +149,16 @@ async def worker_guardado(queue: asyncio.Queue):
             msg = await queue.get()
             if msg is None:  # Señal de parada
                 if batch: 
-                    await procesar_mensajes_video_batch(batch, origen="sincronizador")
+                    await encolar_mensajes_video(batch, origen="sincronizador")
+                # Esperar a que la cola de escritura confirme todo antes de salir
+                await db_flush_writes()
                 queue.task_done()
                 break
             
             batch.append(msg)
             if len(batch) >= BATCH_SIZE:
                 try:
-                    await procesar_mensajes_video_batch(batch, origen="sincronizador")
+                    await encolar_mensajes_video(batch, origen="sincronizador")
                 except Exception as e:
                     logger.error(f"❌ Error guardando batch en background: {e}")
                 finally:
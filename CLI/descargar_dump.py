@@ -2,26 +2,26 @@ import os
 import time
 import asyncio
 import aiosqlite
-import random
 import logging 
 import re
 from datetime import datetime
 import sys
-from pyrogram import Client
 from pyrogram.errors import FloodWait, RPCError, Timeout, ServiceUnavailable 
-from PIL import Image
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importamos configuración central
 from config import (
-    DB_PATH, THUMB_FOLDER, API_ID, API_HASH, 
-    BOT_POOL_TOKENS, FOLDER_SESSIONS,
+    DB_PATH, THUMB_FOLDER,
+    BOT_POOL_TOKENS, MESSAGE_BATCH_MAX,
     CACHE_DUMP_VIDEOS_CHANNEL_ID, JSON_FOLDER,
     BOT_BATCH_LIMIT, BOT_BATCH_COOLDOWN,
-    BOT_WAIT_MIN, BOT_WAIT_MAX
 )
-from utils import save_image_as_webp, log_timing
+from utils import log_timing
+from services.bot_rate import bot_rates, bot_rate_key
+from services.bot_pool import BotClientPool
+from services.message_batcher import message_batcher
+from utils.thumb_encoder import save_thumb_as_webp, shutdown_thumb_encoder
 
 # --- CONFIGURACIÓN DE LOGGING (Restaurada LogCapture) ---
 logging.basicConfig(level=logging.ERROR)
@@ -49,8 +49,11 @@ tareas_totales = 0
 bot_analytics = {} 
 flood_incidents = []
 
-# Diccionario de control de sueño global
-floodwait_until = {}
+# Ritmo por bot: services/bot_rate.py (aprende de los FloodWait y persiste entre corridas)
+fin_cola = asyncio.Event()
+# Clientes bot conectados entre corridas de main() (flujo_reenviar_descargar la llama en bucle).
+# Prefijo de sesión propio: el servidor usa las suyas y no se pisan los locks de SQLite
+cli_bots = BotClientPool(session_prefix="cli_bot")
 
 # --- CONFIGURACIÓN DE CONCURRENCIA ---
 MAX_CAJEROS = 8        
@@ -74,11 +77,13 @@ def generar_informe_calibracion():
     lines.append(f"  ✅ Exitosos: {exitos_total} | 🖼️ f=2: {sin_thumb_total} | 🗑️ f=3: {borrados_total}")
     lines.append("-" * 60)
     
-    lines.append(f"{'BOT ID':<8} | {'DLs':<6} | {'FLOODs':<8} | {'BOXES':<6} | {'PROM (a/m)':<10}")
+    lines.append(f"{'BOT ID':<8} | {'DLs':<6} | {'FLOODs':<8} | {'BOXES':<6} | {'PROM (a/m)':<10} | {'RITMO (a/m)':<11}")
+    por_bot = bot_rates.get_stats()["per_bot"]
     for b_id, s in sorted(bot_analytics.items()):
         active_t = time.time() - s['start_ts']
         prom = (s['dl'] / max(1, active_t)) * 60
-        lines.append(f"Bot {b_id:<4} | {s['dl']:<6} | {s['floods']:<8} | {s['boxes']:<6} | {prom:.2f}")
+        ritmo = por_bot.get(s['key'], {}).get("rate_per_min", 0)
+        lines.append(f"Bot {b_id:<4} | {s['dl']:<6} | {s['floods']:<8} | {s['boxes']:<6} | {prom:<10.2f} | {ritmo:.2f}")
 
     os.makedirs(JSON_FOLDER, exist_ok=True)
     with open(os.path.join(JSON_FOLDER, "reporte_calibracion.txt"), "w", encoding="utf-8") as f:
@@ -87,7 +92,7 @@ def generar_informe_calibracion():
 
 # --- LÓGICA ---
 
-async def procesar_descarga(app, bot_id, tarea):
+async def procesar_descarga(app, bot_id, tarea, siguientes=()):
     """Lógica de descarga con verificación de integridad"""
     vid_id, unique_id, msg_id, chat_origin = tarea
     final_path = os.path.join(THUMB_FOLDER, str(chat_origin), f"{unique_id}.webp")
@@ -95,7 +100,8 @@ async def procesar_descarga(app, bot_id, tarea):
     # Reiniciamos captura de errores para esta tarea
     log_capture.last_error_msg = ""
 
-    msg = await app.get_messages(CACHE_DUMP_VIDEOS_CHANNEL_ID, msg_id)
+    # Un solo get_messages para este mensaje y los del resto del lote del bot (siguientes)
+    msg = await message_batcher.get(app, CACHE_DUMP_VIDEOS_CHANNEL_ID, msg_id, siguientes)
     if not msg or msg.empty:
         async with aiosqlite.connect(DB_PATH) as db:
             await db.execute("UPDATE videos_telegram SET dump_fail = 3 WHERE id = ?", (vid_id,))
@@ -111,8 +117,8 @@ async def procesar_descarga(app, bot_id, tarea):
             await db.commit()
         return "ERR_NO_THUMB"
 
-    tmp_path = os.path.join(THUMB_FOLDER, "_tmp", f"b{bot_id}_{unique_id}")
-    path = await app.download_media(file_id, file_name=tmp_path)
+    # Descarga en memoria: sin archivo temporal en THUMB_FOLDER/_tmp
+    buffer = await app.download_media(file_id, in_memory=True)
     
     # Verificamos si hubo un error silencioso capturado por LogCapture
     err_log = log_capture.last_error_msg.upper()
@@ -121,104 +127,121 @@ async def procesar_descarga(app, bot_id, tarea):
         wait_s = int(match.group(1)) if match else 600
         raise FloodWait(wait_s)
 
-    # Verificación de imagen (Evita error PIL cannot identify)
-    if path and os.path.exists(path) and os.path.getsize(path) > 100:
+    # Decodificar/codificar en el pool de procesos (una imagen inválida lanza y se reintenta)
+    data = buffer.getvalue() if buffer else b""
+    if len(data) > 100:
         try:
-            with Image.open(path) as img: img.verify()
-            await asyncio.to_thread(save_image_as_webp, path, final_path)
+            await save_thumb_as_webp(data, final_path)
             async with aiosqlite.connect(DB_PATH) as db:
                 await db.execute("UPDATE videos_telegram SET has_thumb = 1, dump_fail = 0 WHERE id = ?", (vid_id,))
                 await db.commit()
-            if os.path.exists(path): os.remove(path)
             return "SUCCESS"
         except:
-            if os.path.exists(path): os.remove(path)
             return "RETRY"
     
-    if path and os.path.exists(path): os.remove(path)
     return "RETRY"
 
+async def tomar_lote(queue, key):
+    """
+    Tareas para este bot: la siguiente de la cola más las que haya disponibles hasta
+    cubrir ~1 minuto de su ritmo aprendido (máx. MESSAGE_BATCH_MAX, un get_messages).
+    """
+    n = max(1, min(MESSAGE_BATCH_MAX, int(bot_rates.rate(key) * 60)))
+    lote = [await queue.get()]
+    while len(lote) < n and lote[-1] is not None and not queue.empty():
+        lote.append(queue.get_nowait())
+    return lote
+
+async def devolver_lote(queue, lote):
+    """Devuelve a la cola las tareas no procesadas (p. ej. el bot entró en FloodWait)."""
+    for tarea in lote:
+        await queue.put(tarea)
+        queue.task_done()
+    lote.clear()
+
 async def worker_bot(queue, bot_token, bot_id):
-    """Bucle principal con memoria de Flood"""
-    global exitos_total, borrados_total, sin_thumb_total, procesados_total, floodwait_until
-    session_path = os.path.join(FOLDER_SESSIONS, f"bot_worker_{bot_id}")
-    app = Client(session_path, api_id=API_ID, api_hash=API_HASH, bot_token=bot_token)
+    """Bucle principal: cada tarea espera un token del bot en bot_rates (ritmo aprendido)"""
+    global exitos_total, borrados_total, sin_thumb_total, procesados_total
+    key = bot_rate_key(bot_token)
     
-    bot_analytics[bot_id] = {'dl': 0, 'floods': 0, 'boxes': 0, 'start_ts': time.time()}
+    bot_analytics[bot_id] = {'dl': 0, 'floods': 0, 'boxes': 0, 'start_ts': time.time(), 'key': key}
     dls_session = 0
 
-    try:
-        await app.start()
-        log_timing(f"   [Bot {bot_id}] 🟢 Conectado.")
-
-        while True:
-            # MEMORIA DE FLOOD: ¿Debo seguir durmiendo?
-            if bot_id in floodwait_until:
-                restante = floodwait_until[bot_id] - time.time()
-                if restante > 0:
-                    await asyncio.sleep(min(restante, 15))
-                    continue
-                else:
-                    del floodwait_until[bot_id]
-
-            tarea = await queue.get()
-            if tarea is None: break
-            
-            try:
-                await asyncio.sleep(random.uniform(BOT_WAIT_MIN, BOT_WAIT_MAX))
-
-                async with semaforo:
-                    stats_mon["activos"] += 1
-                    try:
-                        res = await asyncio.wait_for(procesar_descarga(app, bot_id, tarea), timeout=TIMEOUT_OPERACION)
-                        
-                        if res == "SUCCESS":
-                            procesados_total += 1
-                            exitos_total += 1
-                            bot_analytics[bot_id]['dl'] += 1
-                            dls_session += 1
-                            log_timing(f"   [Bot {bot_id}] ✅ OK: {tarea[1]}")
-                        elif res == "ERR_MSG_EMPTY":
-                            procesados_total += 1
-                            borrados_total += 1
-                        elif res == "ERR_NO_THUMB":
-                            procesados_total += 1
-                            sin_thumb_total += 1
-                        else:
-                            await queue.put(tarea)
-
-                    except FloodWait as e:
-                        floodwait_until[bot_id] = time.time() + e.value
-                        bot_analytics[bot_id]['floods'] += 1
-                        log_timing(f"   [Bot {bot_id}] 🛑 FLOOD {e.value}s. Se va a dormir.")
+    app = await cli_bots.get(key)
+    if app is None:
+        log_timing(f"   [Bot {bot_id}] ❌ No pudo conectar.")
+        return
+    log_timing(f"   [Bot {bot_id}] 🟢 Conectado.")
+
+    lote = []
+    while True:
+        # Token del bot antes de cada tarea: si queda en FloodWait, su lote vuelve a la cola
+        if await bot_rates.acquire([key], max_wait=15) is None:
+            await devolver_lote(queue, lote)
+            if fin_cola.is_set():
+                break
+            continue
+
+        if not lote:
+            lote = await tomar_lote(queue, key)
+        tarea = lote.pop(0)
+        if tarea is None: break
+        
+        try:
+            async with semaforo:
+                stats_mon["activos"] += 1
+                try:
+                    siguientes = [t[2] for t in lote if t is not None]
+                    res = await asyncio.wait_for(procesar_descarga(app, bot_id, tarea, siguientes), timeout=TIMEOUT_OPERACION)
+                    
+                    if res == "SUCCESS":
+                        procesados_total += 1
+                        exitos_total += 1
+                        bot_analytics[bot_id]['dl'] += 1
+                        bot_rates.report_success(key)
+                        dls_session += 1
+                        log_timing(f"   [Bot {bot_id}] ✅ OK: {tarea[1]}")
+                    elif res == "ERR_MSG_EMPTY":
+                        procesados_total += 1
+                        borrados_total += 1
+                    elif res == "ERR_NO_THUMB":
+                        procesados_total += 1
+                        sin_thumb_total += 1
+                    else:
                         await queue.put(tarea)
 
-                    except (asyncio.TimeoutError, ServiceUnavailable, Timeout):
-                        procesados_total += 1
-                        log_timing(f"   [Bot {bot_id}] ⚠️ Timeout Red. Se descarta esta tarea en esta sesión.")
-
-                    finally:
-                        stats_mon["activos"] -= 1
-
-                if dls_session >= int(BOT_BATCH_LIMIT):
-                    bot_analytics[bot_id]['boxes'] += 1
-                    await asyncio.sleep(BOT_BATCH_COOLDOWN)
-                    dls_session = 0
-
-            except Exception as e:
-                # Captura de errores de red que no son FloodWait nativos
-                err_str = str(e).upper()
-                if "420" in err_str or "FLOOD" in err_str:
-                    wait_s = int(re.search(r'\d+', err_str).group()) if re.search(r'\d+', err_str) else 600
-                    floodwait_until[bot_id] = time.time() + wait_s
-                    log_timing(f"   [Bot {bot_id}] 🛑 Error 420 detectado. Durmiendo {wait_s}s.")
-                else:
-                    log_timing(f"   [Bot {bot_id}] ❌ Error: {str(e)[:50]}")
-                await queue.put(tarea)
-            finally:
-                queue.task_done()
-    finally:
-        await app.stop()
+                except FloodWait as e:
+                    bot_rates.report_flood(key, e.value)
+                    bot_analytics[bot_id]['floods'] += 1
+                    log_timing(f"   [Bot {bot_id}] 🛑 FLOOD {e.value}s. Se va a dormir.")
+                    await queue.put(tarea)
+                    await devolver_lote(queue, lote)
+
+                except (asyncio.TimeoutError, ServiceUnavailable, Timeout):
+                    procesados_total += 1
+                    log_timing(f"   [Bot {bot_id}] ⚠️ Timeout Red. Se descarta esta tarea en esta sesión.")
+
+                finally:
+                    stats_mon["activos"] -= 1
+
+            if dls_session >= int(BOT_BATCH_LIMIT):
+                bot_analytics[bot_id]['boxes'] += 1
+                await asyncio.sleep(BOT_BATCH_COOLDOWN)
+                dls_session = 0
+
+        except Exception as e:
+            # Captura de errores de red que no son FloodWait nativos
+            err_str = str(e).upper()
+            if "420" in err_str or "FLOOD" in err_str:
+                wait_s = int(re.search(r'\d+', err_str).group()) if re.search(r'\d+', err_str) else 600
+                bot_rates.report_flood(key, wait_s)
+                log_timing(f"   [Bot {bot_id}] 🛑 Error 420 detectado. Durmiendo {wait_s}s.")
+                await devolver_lote(queue, lote)
+            else:
+                log_timing(f"   [Bot {bot_id}] ❌ Error: {str(e)[:50]}")
+            await queue.put(tarea)
+        finally:
+            queue.task_done()
 
 async def main(recycle_when_all_floodwait: bool = False):
     global tareas_totales
@@ -237,11 +260,10 @@ async def main(recycle_when_all_floodwait: bool = False):
 
     log_timing(f"📋 Tareas encontradas: {len(tareas)}")
 
-    if recycle_when_all_floodwait and floodwait_until:
-        now = time.time()
-        all_in_flood = all(ts > now for ts in floodwait_until.values())
-        if all_in_flood:
-            return {"tareas_iniciales": 0, "descargas": 0, "errores": 0, "recycled": True}
+    activos = [(i + 1, token) for i, token in enumerate(BOT_POOL_TOKENS) if (i + 1) not in BOTS_BLOQUEADOS]
+    keys = [bot_rate_key(token) for _, token in activos]
+    if recycle_when_all_floodwait and bot_rates.all_blocked(keys):
+        return {"tareas_iniciales": 0, "descargas": 0, "errores": 0, "recycled": True}
 
     if not tareas:
         return {"tareas_iniciales": 0, "descargas": 0, "errores": 0, "recycled": False}
@@ -249,20 +271,23 @@ async def main(recycle_when_all_floodwait: bool = False):
     queue = asyncio.Queue()
     for t in tareas: queue.put_nowait(t)
 
-    bot_tasks = [asyncio.create_task(worker_bot(queue, token, i+1)) 
-                 for i, token in enumerate(BOT_POOL_TOKENS) if (i+1) not in BOTS_BLOQUEADOS]
+    fin_cola.clear()
+    bot_tasks = [asyncio.create_task(worker_bot(queue, token, bot_id)) for bot_id, token in activos]
 
     async def monitor():
         while not queue.empty():
             await asyncio.sleep(10)
-            dormidos = sum(1 for v in floodwait_until.values() if v > time.time())
-            log_timing(f"📊 MONITOR: {procesados_total}/{tareas_totales} | {stats_mon['activos']}/8 cajas | 🛑 {dormidos} bots dormidos")
+            ritmo = bot_rates.get_stats()["total_rate_per_min"]
+            log_timing(f"📊 MONITOR: {procesados_total}/{tareas_totales} | {stats_mon['activos']}/8 cajas | "
+                       f"🛑 {bot_rates.blocked_count(keys)} bots dormidos | ritmo {ritmo}/min")
 
     mon_task = asyncio.create_task(monitor())
     await queue.join()
+    fin_cola.set()
     for _ in bot_tasks: await queue.put(None)
     await asyncio.gather(*bot_tasks)
     mon_task.cancel()
+    bot_rates.save()
     generar_informe_calibracion()
     return {
         "tareas_iniciales": tareas_totales,
@@ -271,9 +296,17 @@ async def main(recycle_when_all_floodwait: bool = False):
         "recycled": False
     }
 
+async def main_y_cerrar():
+    try:
+        return await main()
+    finally:
+        await cli_bots.stop()
+
 if __name__ == "__main__":
     try:
-        res = asyncio.run(main())
+        res = asyncio.run(main_y_cerrar())
         log_timing(res)
     except KeyboardInterrupt:
-        generar_informe_calibracion()
\ No newline at end of file
+        generar_informe_calibracion()
+    finally:
+        shutdown_thumb_encoder()
\ No newline at end of file
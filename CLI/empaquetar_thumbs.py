@@ -0,0 +1,114 @@
+"""
+Migra los thumbs de THUMB_FOLDER/<chat_id>/<file_unique_id>.webp al almacén
+empaquetado (services/thumb_pack.py). Es incremental: los thumbs ya
+empaquetados se saltan, así se puede volver a correr para sumar los nuevos.
+
+Uso:
+    python CLI/empaquetar_thumbs.py                 # empaquetar (los .webp se conservan)
+    python CLI/empaquetar_thumbs.py --borrar        # empaquetar y borrar los .webp ya indexados
+    python CLI/empaquetar_thumbs.py --reconstruir   # reconstruir index.db desde los packs
+Después activar THUMB_PACK_ENABLED=1 para que /api/photo sirva desde los packs.
+Ojo con --borrar: las herramientas CLI que leen los .webp por ruta
+(precalcular_thumb_sizes, duplicados...) no los verán; precalcular_phash_thumbs
+lee del almacén si THUMB_PACK_ENABLED.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import THUMB_FOLDER
+from services.thumb_pack import thumb_pack
+
+THUMB_EXT = ".webp"
+BATCH_SIZE = 1000
+
+
+def _iter_thumbs(root: str):
+    """(chat_id, file_unique_id, ruta) de cada .webp de las carpetas por chat."""
+    for chat_dir in os.scandir(root):
+        if not chat_dir.is_dir():
+            continue
+        try:
+            chat_id = int(chat_dir.name)
+        except ValueError:
+            continue  # _tmp y otras carpetas auxiliares
+        for entry in os.scandir(chat_dir.path):
+            if entry.is_file() and entry.name.endswith(THUMB_EXT):
+                yield chat_id, entry.name[:-len(THUMB_EXT)], entry.path
+
+
+def empaquetar(root: str = THUMB_FOLDER, borrar: bool = False) -> None:
+    inicio = time.time()
+    ya = thumb_pack.keys()
+    print(f"📦 Thumbs ya empaquetados: {len(ya)}")
+
+    batch, paths = [], []
+    stats = {"empaquetados": 0, "saltados": 0, "borrados": 0, "errores": 0, "bytes": 0}
+
+    def flush():
+        thumb_pack.put_many(batch)
+        stats["empaquetados"] += len(batch)
+        # Solo se borra lo que ya está en disco e indexado (fsync del pack y commit en put_many)
+        if borrar:
+            for path in paths:
+                try:
+                    os.remove(path)
+                    stats["borrados"] += 1
+                except OSError:
+                    stats["errores"] += 1
+        batch.clear()
+        paths.clear()
+        print(f"   ... {stats['empaquetados']} empaquetados ({stats['bytes'] / 1024 / 1024:.1f} MB)", end="\r")
+
+    for chat_id, uid, path in _iter_thumbs(root):
+        if (chat_id, uid) in ya:
+            stats["saltados"] += 1
+            if borrar:
+                try:
+                    os.remove(path)
+                    stats["borrados"] += 1
+                except OSError:
+                    stats["errores"] += 1
+            continue
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            stats["errores"] += 1
+            continue
+        if not data:
+            continue
+        batch.append((chat_id, uid, data))
+        paths.append(path)
+        stats["bytes"] += len(data)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    print()
+    print(f"✅ Empaquetados: {stats['empaquetados']} | Saltados: {stats['saltados']} | "
+          f"Borrados: {stats['borrados']} | Errores: {stats['errores']} | {time.time() - inicio:.1f}s")
+    print(f"📊 {thumb_pack.get_stats()}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Migrar thumbs .webp sueltos al almacén empaquetado")
+    parser.add_argument("--origen", default=THUMB_FOLDER, help="Carpeta raíz de thumbs por chat")
+    parser.add_argument("--borrar", action="store_true", help="Borrar los .webp una vez indexados en el pack")
+    parser.add_argument("--reconstruir", action="store_true", help="Reconstruir el índice escaneando los packs")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        if args.reconstruir:
+            print(f"🔧 Índice reconstruido: {thumb_pack.rebuild_index()} thumbs.")
+        else:
+            empaquetar(args.origen, borrar=args.borrar)
+    finally:
+        thumb_pack.close()
@@ -5,6 +5,14 @@ import descargar_dump
 
 
 async def main():
+    try:
+        await _ciclos()
+    finally:
+        # Los bots de descargar_dump quedan conectados entre ciclos; se cierran al salir
+        await descargar_dump.cli_bots.stop()
+
+
+async def _ciclos():
     ciclo = 0
     while True:
         ciclo += 1
@@ -0,0 +1,65 @@
+"""
+Backfill del índice FTS5 de videos (database/fts.py).
+Crea la tabla y los triggers si faltan y reconstruye el índice con todas las
+filas de videos_telegram. Desde ese momento los triggers lo mantienen al día
+y la búsqueda local deja de usar LIKE.
+
+Uso:
+    python CLI/indexar_fts.py                  # crear/reconstruir el índice
+    python CLI/indexar_fts.py --probar "texto" # además, medir una búsqueda
+"""
+import argparse
+import os
+import sys
+import sqlite3
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_PATH
+from database.fts import FTS_TABLE, BM25_WEIGHTS, fts_match_query, rebuild_videos_fts
+
+
+def indexar(probar: str | None = None) -> None:
+    if not os.path.exists(DB_PATH):
+        raise SystemExit(f"No existe la BD en {DB_PATH}")
+
+    with sqlite3.connect(DB_PATH, timeout=60) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout = 60000")
+        total = conn.execute("SELECT COUNT(*) FROM videos_telegram").fetchone()[0]
+        print(f"🔎 Indexando {total} videos en {FTS_TABLE}...")
+
+        inicio = time.time()
+        rebuild_videos_fts(conn)
+        elapsed = max(time.time() - inicio, 1e-6)
+        print(f"✅ Índice listo en {elapsed:.1f}s ({total / elapsed:.0f} filas/s)")
+
+        match = fts_match_query(probar or "")
+        if match:
+            inicio = time.perf_counter()
+            rows = conn.execute(
+                f"""
+                SELECT vt.nombre FROM {FTS_TABLE}
+                JOIN videos_telegram vt ON vt.rowid = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH ?
+                ORDER BY bm25({FTS_TABLE}, {BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]})
+                LIMIT 20
+                """,
+                (match,),
+            ).fetchall()
+            ms = (time.perf_counter() - inicio) * 1000
+            print(f"\n'{probar}' -> {match}: {len(rows)} resultados en {ms:.1f} ms")
+            for (nombre,) in rows[:10]:
+                print(f"  · {nombre}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Construye el índice FTS5 de nombre/caption de videos")
+    parser.add_argument("--probar", default=None, help="Texto de búsqueda para medir el índice")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    indexar(args.probar)
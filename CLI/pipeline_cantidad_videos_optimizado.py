@@ -32,9 +32,10 @@ from database.videos import (  # noqa: E402
     db_upsert_video,
     db_upsert_video_message,
     db_count_videos_by_chat,
+    ensure_video_messages_table,
 )
 from database.chats import db_upsert_chat_video_count  # noqa: E402
-from database import init_db  # noqa: E402
+from database import init_db, run_with_pool  # noqa: E402
 from utils import log_timing
 
 
@@ -93,22 +94,15 @@ async def contar_duplicados_y_actualizar() -> None:
     No borra ni marca, solo escribe el número de duplicados.
     """
     async with aiosqlite.connect(DB_PATH) as db:
-        # Mapa chat_id -> duplicados
+        await ensure_video_messages_table(db)
+        # Mapa chat_id -> duplicados (conteos materializados en video_message_counts)
         query = """
-            WITH base AS (
-                SELECT vm.chat_id, vm.video_id, COUNT(*) AS n
-                FROM video_messages vm
-                JOIN chats c ON vm.chat_id = c.chat_id
-                WHERE COALESCE(c.is_owner, 0) = 0
-                GROUP BY vm.chat_id, vm.video_id
-                HAVING n > 1
-            ),
-            dupes AS (
-                SELECT chat_id, COUNT(*) AS c
-                FROM base
-                GROUP BY chat_id
-            )
-            SELECT chat_id, c FROM dupes
+            SELECT mc.chat_id, COUNT(*) AS c
+            FROM video_message_counts mc
+            JOIN chats c ON mc.chat_id = c.chat_id
+            WHERE COALESCE(c.is_owner, 0) = 0
+              AND mc.messages_count > 1
+            GROUP BY mc.chat_id
         """
         dupes: dict[int, int] = {}
         async with db.execute(query) as cur:
@@ -310,7 +304,7 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> None:
     args = parse_args()
-    asyncio.run(run_pipeline(args))
+    run_with_pool(run_pipeline(args))
 
 
 if __name__ == "__main__":
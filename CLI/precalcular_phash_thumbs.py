@@ -1,23 +1,73 @@
+"""
+Precálculo de pHash/dHash/aHash de los thumbs visibles (oculto=0).
+
+Pipeline:
+  - lector (proceso principal): páginas de pendientes por rowid (keyset)
+  - N procesos de hash: cada thumb se decodifica una vez (escala de grises)
+    y de esa imagen salen los tres hashes
+  - escritor (un hilo, conexión propia): UPDATE con executemany por lote
+
+Es reanudable: el escritor guarda en PHASH_CHECKPOINT_FILE el último rowid
+escrito y una corrida interrumpida sigue desde ahí (--reiniciar vuelve al
+inicio). Al terminar una pasada completa el checkpoint se borra: filas con
+rowid menor pueden volverse pendientes después (p. ej. cuando el worker de
+thumbs pone has_thumb=1) y la consulta ya elige solo las que faltan.
+Los lotes se escriben en el orden en que se leyeron, así el checkpoint nunca
+salta filas. Si THUMB_PACK_ENABLED, los thumbs que ya no están como .webp se
+leen del almacén empaquetado.
+
+Uso:
+    python CLI/precalcular_phash_thumbs.py                  # todos los procesadores
+    python CLI/precalcular_phash_thumbs.py --workers 4 --batch-size 1000
+    python CLI/precalcular_phash_thumbs.py --reiniciar      # ignorar el checkpoint
+"""
 import argparse
+import io
+import json
 import os
+import queue
 import sys
 import sqlite3
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable
 
 import imagehash
 from PIL import Image
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DB_PATH, THUMB_FOLDER
-from utils.database_helpers import ensure_column
+from config import DB_PATH, THUMB_FOLDER, JSON_FOLDER, THUMB_PACK_ENABLED
+from utils.phash import phash_to_int
 
 
 THUMB_EXT = ".webp"
 LOCK_RETRIES = 5
 LOCK_SLEEP_SECONDS = 0.8
+PHASH_CHECKPOINT_FILE = os.path.join(JSON_FOLDER, "phash_checkpoint.json")
+REPORT_SECONDS = 5
+
+# Columnas que llena este script (además de thumb_phash en hex)
+HASH_COLUMNS = (("thumb_phash", "TEXT"), ("thumb_phash64", "INTEGER"), ("thumb_dhash64", "INTEGER"), ("thumb_ahash64", "INTEGER"))
+
+PENDIENTES_SQL = """
+    SELECT rowid, chat_id, file_unique_id
+    FROM videos_telegram
+    WHERE oculto = 0
+      AND has_thumb > 0
+      AND (thumb_phash IS NULL OR thumb_phash = '' OR thumb_phash64 IS NULL OR thumb_dhash64 IS NULL)
+      AND rowid > ?
+    ORDER BY rowid
+    LIMIT ?
+"""
+
+UPDATE_SQL = """
+    UPDATE videos_telegram
+    SET thumb_phash = ?, thumb_phash64 = ?, thumb_dhash64 = ?, thumb_ahash64 = ?
+    WHERE chat_id = ? AND file_unique_id = ?
+"""
 
 
 def configure_connection(conn: sqlite3.Connection) -> None:
@@ -26,118 +76,216 @@ def configure_connection(conn: sqlite3.Connection) -> None:
     conn.execute("PRAGMA busy_timeout = 30000")  # 30s de espera por lock
 
 
+def ensure_hash_columns(conn: sqlite3.Connection) -> None:
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(videos_telegram)")}
+    for col, col_type in HASH_COLUMNS:
+        if col not in cols:
+            conn.execute(f"ALTER TABLE videos_telegram ADD COLUMN {col} {col_type};")
+    conn.commit()
+
+
+# --- CHECKPOINT ---
+def load_checkpoint() -> int:
+    try:
+        with open(PHASH_CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("last_rowid", 0))
+    except (OSError, ValueError):
+        return 0
 
 
-def iter_pending_rows(conn: sqlite3.Connection, limit: int | None, offset: int) -> Iterable[tuple[int, str]]:
-    sql = [
-        "SELECT chat_id, file_unique_id",
-        "FROM videos_telegram",
-        "WHERE oculto = 0",
-        "  AND has_thumb > 0",
-        "  AND (thumb_phash IS NULL OR thumb_phash = '')",
-        "ORDER BY fecha_mensaje DESC, message_id DESC",
-    ]
-    params: list[int] = []
-    if limit is not None:
-        sql.append("LIMIT ? OFFSET ?")
-        params.extend([limit, offset])
-    elif offset:
-        # SQLite requiere LIMIT si hay OFFSET; usamos un LIMIT grande
-        sql.append("LIMIT -1 OFFSET ?")
-        params.append(offset)
-    query = "\n".join(sql)
-    for chat_id, file_unique_id in conn.execute(query, params):
-        yield int(chat_id), (file_unique_id or "").strip()
+def save_checkpoint(last_rowid: int) -> None:
+    os.makedirs(os.path.dirname(PHASH_CHECKPOINT_FILE), exist_ok=True)
+    tmp = f"{PHASH_CHECKPOINT_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_rowid": last_rowid, "updated": int(time.time())}, f)
+    os.replace(tmp, PHASH_CHECKPOINT_FILE)
 
 
-def compute_phash(path: Path) -> str | None:
+def clear_checkpoint() -> None:
     try:
-        with Image.open(path) as img:
-            return str(imagehash.phash(img))
+        os.remove(PHASH_CHECKPOINT_FILE)
+    except FileNotFoundError:
+        pass
+
+
+# --- PROCESOS DE HASH ---
+def compute_hashes(source: str | bytes) -> tuple[str, int, int, int] | None:
+    """(phash hex, phash64, dhash64, ahash64) con una sola decodificación de la imagen."""
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            gray = img.convert("L")
+        ph = str(imagehash.phash(gray))
+        return (
+            ph,
+            phash_to_int(ph),
+            phash_to_int(str(imagehash.dhash(gray))),
+            phash_to_int(str(imagehash.average_hash(gray))),
+        )
     except Exception:
         return None
 
 
-def process_batch(conn: sqlite3.Connection, rows: list[tuple[int, str]], thumb_root: Path) -> tuple[int, int]:
-    ok = fail = 0
-    for chat_id, file_unique_id in rows:
-        if not file_unique_id:
-            fail += 1
-            continue
-        thumb_path = thumb_root / str(chat_id) / f"{file_unique_id}{THUMB_EXT}"
-        if not thumb_path.exists():
-            fail += 1
-            continue
-        ph = compute_phash(thumb_path)
-        if ph is None:
+def hash_batch(items: list[tuple[int, int, str, str | bytes | None]]) -> tuple[int, list[tuple], int]:
+    """
+    Corre en un proceso del pool. items: (rowid, chat_id, file_unique_id, ruta o bytes).
+    Devuelve (último rowid del lote, filas para UPDATE_SQL, fallos).
+    """
+    filas, fail = [], 0
+    for _, chat_id, file_unique_id, source in items:
+        hashes = compute_hashes(source) if source is not None else None
+        if hashes is None:
             fail += 1
             continue
+        filas.append((*hashes, chat_id, file_unique_id))
+    return items[-1][0], filas, fail
+
+
+# --- LECTOR ---
+def iter_batches(conn: sqlite3.Connection, thumb_root: Path, after_rowid: int, batch_size: int, limit: int | None):
+    """Lotes de (rowid, chat_id, file_unique_id, ruta o bytes) pendientes después de after_rowid."""
+    pack = None
+    if THUMB_PACK_ENABLED:
+        from services.thumb_pack import thumb_pack as pack
+
+    leidos = 0
+    while limit is None or leidos < limit:
+        size = batch_size if limit is None else min(batch_size, limit - leidos)
+        rows = conn.execute(PENDIENTES_SQL, (after_rowid, size)).fetchall()
+        if not rows:
+            return
+        after_rowid = rows[-1][0]
+        leidos += len(rows)
+
+        items = []
+        for rowid, chat_id, file_unique_id in rows:
+            chat_id, file_unique_id = int(chat_id), (file_unique_id or "").strip()
+            source = None
+            if file_unique_id:
+                path = thumb_root / str(chat_id) / f"{file_unique_id}{THUMB_EXT}"
+                if path.exists():
+                    source = str(path)
+                elif pack is not None:
+                    source = pack.get(chat_id, file_unique_id)
+            items.append((rowid, chat_id, file_unique_id, source))
+        yield items
+
+
+# --- ESCRITOR ---
+class BatchWriter(threading.Thread):
+    """Hilo con conexión propia: executemany por lote, commit y checkpoint."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.queue: queue.Queue = queue.Queue(maxsize=8)
+        self.ok = 0
+        self.error: Exception | None = None
+
+    def run(self) -> None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        configure_connection(conn)
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                last_rowid, filas = item
+                if filas:
+                    self._write(conn, filas)
+                    self.ok += len(filas)
+                save_checkpoint(last_rowid)
+        except Exception as e:
+            self.error = e
+        finally:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, filas: list[tuple]) -> None:
         for attempt in range(LOCK_RETRIES):
             try:
-                conn.execute(
-                    "UPDATE videos_telegram SET thumb_phash = ? WHERE chat_id = ? AND file_unique_id = ?",
-                    (ph, chat_id, file_unique_id),
-                )
-                break
+                conn.executemany(UPDATE_SQL, filas)
+                conn.commit()
+                return
             except sqlite3.OperationalError as e:
+                conn.rollback()
                 # Reintento si está locked
                 if "locked" in str(e).lower() and attempt + 1 < LOCK_RETRIES:
                     time.sleep(LOCK_SLEEP_SECONDS * (attempt + 1))
                     continue
                 raise
-        ok += 1
-    return ok, fail
 
 
-def run(limit: int | None, offset: int, batch_size: int) -> None:
+def run(limit: int | None, batch_size: int, workers: int, reiniciar: bool) -> None:
     thumb_root = Path(THUMB_FOLDER)
-    if not thumb_root.exists():
+    if not thumb_root.exists() and not THUMB_PACK_ENABLED:
         raise SystemExit(f"Carpeta de thumbs no existe: {thumb_root}")
 
+    after_rowid = 0 if reiniciar else load_checkpoint()
+    if after_rowid:
+        print(f"↪️ Reanudando desde rowid {after_rowid} (--reiniciar para empezar de cero)")
+
     with sqlite3.connect(DB_PATH, timeout=30) as conn:
         configure_connection(conn)
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(videos_telegram)")
-        cols = [row[1] for row in cur.fetchall()]
-        if "thumb_phash" not in cols:
-            conn.execute("ALTER TABLE videos_telegram ADD COLUMN thumb_phash TEXT;")
-            conn.commit()
-
-        pending_iter = iter_pending_rows(conn, limit=limit, offset=offset)
-        total_ok = total_fail = total_seen = 0
-        batch: list[tuple[int, str]] = []
-
-        for row in pending_iter:
-            batch.append(row)
-            total_seen += 1
-            if len(batch) >= batch_size:
-                ok, fail = process_batch(conn, batch, thumb_root)
-                total_ok += ok
-                total_fail += fail
-                conn.commit()
-                batch.clear()
-                print(f"Procesados {total_seen} (ok={total_ok}, fail={total_fail})")
+        ensure_hash_columns(conn)
 
-        if batch:
-            ok, fail = process_batch(conn, batch, thumb_root)
-            total_ok += ok
+        writer = BatchWriter()
+        writer.start()
+        inicio = ultimo_reporte = time.time()
+        total_seen = total_fail = 0
+        en_vuelo: deque = deque()
+
+        def entregar(fut) -> None:
+            nonlocal total_fail
+            last_rowid, filas, fail = fut.result()
             total_fail += fail
-            conn.commit()
+            writer.queue.put((last_rowid, filas))
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for items in iter_batches(conn, thumb_root, after_rowid, batch_size, limit):
+                    total_seen += len(items)
+                    en_vuelo.append(pool.submit(hash_batch, items))
+                    # Se entregan en orden de lectura (el checkpoint no salta lotes) y
+                    # con a lo sumo dos lotes por proceso en vuelo
+                    while en_vuelo and (en_vuelo[0].done() or len(en_vuelo) >= workers * 2):
+                        entregar(en_vuelo.popleft())
+                    if writer.error:
+                        raise writer.error
+
+                    if time.time() - ultimo_reporte >= REPORT_SECONDS:
+                        ultimo_reporte = time.time()
+                        hechos = writer.ok + total_fail
+                        print(
+                            f"Procesados {hechos}/{total_seen} (ok={writer.ok}, fail={total_fail}) "
+                            f"· {hechos / (ultimo_reporte - inicio):.0f} hashes/s"
+                        )
+
+                while en_vuelo:
+                    entregar(en_vuelo.popleft())
+        finally:
+            writer.queue.put(None)
+            writer.join()
+        if writer.error:
+            raise writer.error
+        # Pasada completa (no cortada por --limit): la próxima vuelve a mirar desde el inicio
+        if limit is None or total_seen < limit:
+            clear_checkpoint()
 
+    elapsed = max(time.time() - inicio, 1e-6)
     print("\nResumen:")
     print(f"  Total registros leídos: {total_seen}")
-    print(f"  Hashes guardados:      {total_ok}")
+    print(f"  Hashes guardados:      {writer.ok}")
     print(f"  Fallos/sin thumb:      {total_fail}")
+    print(f"  Tiempo:                {elapsed:.1f}s ({(writer.ok + total_fail) / elapsed:.0f} hashes/s, {workers} procesos)")
 
 
 def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Precálculo de pHash para thumbs visibles (oculto=0)")
+    parser = argparse.ArgumentParser(description="Precálculo de pHash/dHash/aHash para thumbs visibles (oculto=0)")
     parser.add_argument("--limit", type=int, default=None, help="Límite de filas a procesar")
-    parser.add_argument("--offset", type=int, default=0, help="Offset inicial")
-    parser.add_argument("--batch-size", type=int, default=500, help="Tamaño de batch para commits")
+    parser.add_argument("--batch-size", type=int, default=500, help="Filas por lote (lectura, hash y UPDATE)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos de hash")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint y empezar desde el inicio")
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    run(limit=args.limit, offset=args.offset, batch_size=args.batch_size)
+    run(limit=args.limit, batch_size=args.batch_size, workers=max(1, args.workers), reiniciar=args.reiniciar)
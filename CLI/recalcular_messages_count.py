@@ -0,0 +1,53 @@
+"""
+Reconstrucción del conteo materializado de mensajes por video
+(video_message_counts, database/message_counts.py).
+Los triggers de video_messages lo mantienen al día; este comando lo compara
+con un COUNT(*) real y lo recalcula completo (crea tabla y triggers si faltan).
+
+Uso:
+    python CLI/recalcular_messages_count.py              # verificar y reconstruir
+    python CLI/recalcular_messages_count.py --verificar  # solo informar diferencias
+"""
+import argparse
+import os
+import sys
+import sqlite3
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_PATH
+from database.message_counts import COUNTS_TABLE, count_mismatches, rebuild_message_counts
+
+
+def recalcular(solo_verificar: bool = False) -> None:
+    if not os.path.exists(DB_PATH):
+        raise SystemExit(f"No existe la BD en {DB_PATH}")
+
+    with sqlite3.connect(DB_PATH, timeout=60) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout = 60000")
+        existe = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (COUNTS_TABLE,)).fetchone()
+        if existe:
+            diferencias = count_mismatches(conn)
+            print(f"🔎 {diferencias} conteos distintos de video_messages en {COUNTS_TABLE}")
+        else:
+            print(f"🔎 {COUNTS_TABLE} no existe todavía")
+        if solo_verificar:
+            return
+
+        inicio = time.time()
+        rebuild_message_counts(conn)
+        total = conn.execute(f"SELECT COUNT(*) FROM {COUNTS_TABLE}").fetchone()[0]
+        print(f"✅ {total} conteos recalculados en {time.time() - inicio:.1f}s")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Recalcula el conteo de mensajes por video desde video_messages")
+    parser.add_argument("--verificar", action="store_true", help="Solo comparar con video_messages, sin reconstruir")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    recalcular(args.verificar)
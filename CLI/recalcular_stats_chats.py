@@ -0,0 +1,55 @@
+"""
+Verificación/reparación de los contadores locales por chat de chat_video_counts
+(videos_locales, sin_thumb, vertical, duration_1h, blocked).
+Los triggers de videos_telegram (database/counters.py) los mantienen al día;
+este comando los compara con un recálculo completo (GROUP BY sobre toda la
+tabla) y los reescribe.
+
+Uso:
+    python CLI/recalcular_stats_chats.py              # verificar y reparar
+    python CLI/recalcular_stats_chats.py --verificar  # solo informar diferencias
+"""
+import argparse
+import os
+import sys
+import sqlite3
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_PATH
+from database.counters import OLD_TRIGGERS_SQL, CHAT_STATS_TRIGGERS_SQL, chat_stats_mismatches, repair_chat_stats
+
+
+def recalcular(solo_verificar: bool = False) -> None:
+    if not os.path.exists(DB_PATH):
+        raise SystemExit(f"No existe la BD en {DB_PATH}")
+
+    with sqlite3.connect(DB_PATH, timeout=60) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout = 60000")
+
+        inicio = time.time()
+        distintos = chat_stats_mismatches(conn)
+        print(f"🔎 {len(distintos)} chats con contadores distintos del recálculo ({time.time() - inicio:.1f}s)")
+        for chat_id in distintos[:20]:
+            print(f"  · {chat_id}")
+        if solo_verificar:
+            return
+
+        # Por si la BD nunca pasó por init_db con los triggers
+        for sql in OLD_TRIGGERS_SQL + CHAT_STATS_TRIGGERS_SQL:
+            conn.execute(sql)
+        total = repair_chat_stats(conn)
+        print(f"✅ {total} chats recalculados en {time.time() - inicio:.1f}s")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Verifica y repara los contadores por chat de chat_video_counts")
+    parser.add_argument("--verificar", action="store_true", help="Solo comparar con el recálculo, sin escribir")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    recalcular(args.verificar)
@@ -12,6 +12,7 @@ from services.telegram_client import get_client
 from services.video_processor import procesar_mensaje_video
 from database import (
     db_count_videos_by_chat,
+    run_with_pool,
 )
 
 
@@ -97,7 +98,7 @@ if __name__ == "__main__":
         except ValueError:
             raise SystemExit("Valor inválido. Ingresa un entero (ej: 0, 200) o ENTER.")
 
-    asyncio.run(
+    run_with_pool(
         scan_all_channels_to_db(
             max_videos_per_chat=None,
             max_indexed_videos_per_chat=max_indexed
@@ -15,9 +15,14 @@ from config import (
     ensure_directories, HOST, PORT, LOG_LEVEL, PYRO_LOG_LEVEL, UVICORN_LOG_LEVEL,
     MQTT_ENABLED, MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID, MQTT_USERNAME, MQTT_PASSWORD
 )
-from database import init_db
-from services import start_client, stop_client, warmup_cache
+from database import init_db, close_pool, db_stop_write_queue
+from services import start_client, stop_client, warmup_cache, stop_thumb_queue
+from services.disk_cache import load_disk_cache_index, persist_disk_cache_index
+from services.thumb_pack import close_thumb_pack
+from services.bot_pool import stop_bot_pool
+from services.bot_rate import bot_rates
 from utils import init_mqtt_manager, get_mqtt_manager, log_timing
+from utils.thumb_encoder import shutdown_thumb_encoder
 from routes import (
     home_router,
     folders_router,
@@ -92,10 +97,16 @@ async def lifespan(app: FastAPI):
     # En lugar de 'await warmup_cache', creamos una tarea independiente.
     # Esto permite que 'yield' se ejecute inmediatamente.
     asyncio.create_task(background_warmup())
+
+    # 5. Índice de la caché en disco (se carga en un hilo, sin bloquear el arranque)
+    asyncio.create_task(load_disk_cache_index())
     
     yield
     
     # --- SHUTDOWN ---
+    await stop_thumb_queue()
+    await stop_bot_pool()
+    bot_rates.save()  # Los FloodWait se guardan con retraso: lo que quede pendiente
     await stop_client()
     
     if MQTT_ENABLED:
@@ -103,6 +114,14 @@ async def lifespan(app: FastAPI):
         if mqtt_mgr:
             await mqtt_mgr.disconnect()
 
+    await persist_disk_cache_index()
+    shutdown_thumb_encoder()
+    close_thumb_pack()
+
+    # Vaciar la cola de escritura antes de cerrar las conexiones del pool de SQLite
+    await db_stop_write_queue()
+    await close_pool()
+
 
 # Crear aplicación FastAPI
 app = FastAPI(
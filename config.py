@@ -76,7 +76,7 @@ else:
 
     ]
 # --- CONTROL DE VELOCIDAD DE BOTS ---
-# 1. Ritmo "Sprint" (Tiempo entre cada foto individual)
+# 1. Ritmo "Sprint" (Tiempo entre cada foto individual; solo scripts de CLI/.old, ver 3.)
 BOT_WAIT_MIN = 2  # Mínimo de segundos a esperar
 BOT_WAIT_MAX = 3  # Máximo de segundos a esperar
 
@@ -84,10 +84,37 @@ BOT_WAIT_MAX = 3  # Máximo de segundos a esperar
 BOT_BATCH_LIMIT = 50    # ¿Cada cuántas descargas paramos?
 BOT_BATCH_COOLDOWN = 20 # ¿Cuántos segundos descansamos?
 
+# 3. Ritmo adaptativo por bot (services/bot_rate.py, reemplaza a BOT_WAIT_*)
+# Peticiones/segundo iniciales, límites, subida por éxito y factor de bajada ante FloodWait
+BOT_RATE_INITIAL = float(os.getenv("BOT_RATE_INITIAL", "0.4"))
+BOT_RATE_MIN = float(os.getenv("BOT_RATE_MIN", "0.02"))
+BOT_RATE_MAX = float(os.getenv("BOT_RATE_MAX", "5"))
+BOT_RATE_INCREASE = float(os.getenv("BOT_RATE_INCREASE", "0.01"))
+BOT_RATE_DECREASE = float(os.getenv("BOT_RATE_DECREASE", "0.5"))
+BOT_RATE_BURST = int(os.getenv("BOT_RATE_BURST", "3"))
+# Segundos que se agrupan los FloodWait antes de guardar BOT_RATES_FILE (en un hilo)
+BOT_RATE_SAVE_DELAY = float(os.getenv("BOT_RATE_SAVE_DELAY", "10"))
+
+# 4. Pool persistente de clientes bot (services/bot_pool.py)
+# Arranques simultáneos, segundos sin uso antes de verificar la conexión y espera antes de reintentar un bot caído
+BOT_POOL_START_CONCURRENCY = int(os.getenv("BOT_POOL_START_CONCURRENCY", "6"))
+BOT_POOL_HEALTHCHECK_IDLE = float(os.getenv("BOT_POOL_HEALTHCHECK_IDLE", "120"))
+BOT_POOL_RETRY_SECONDS = float(os.getenv("BOT_POOL_RETRY_SECONDS", "300"))
+
 # En Telegram/config.py
 CACHE_DUMP_VIDEOS_CHANNEL_ID = -1003512635282
 # --- STREAMING ---
 CHUNK_SIZE = 1024 * 1024  # 1MB
+# Read-ahead del streaming desde Telegram: chunks en vuelo por stream (ventana adaptativa entre MIN y MAX)
+# y tope global de descargas de chunks simultáneas entre todos los streams
+STREAM_READAHEAD_MIN = int(os.getenv("STREAM_READAHEAD_MIN", "2"))
+STREAM_READAHEAD_MAX = int(os.getenv("STREAM_READAHEAD_MAX", "8"))
+STREAM_GLOBAL_FETCH_LIMIT = int(os.getenv("STREAM_GLOBAL_FETCH_LIMIT", "16"))
+# Lotes de get_messages (services/message_batcher.py): ventana de agrupación (ms), ids por llamada
+# (Telegram acepta hasta 200) y segundos que se recuerda un mensaje ya pedido
+MESSAGE_BATCH_WINDOW_MS = int(os.getenv("MESSAGE_BATCH_WINDOW_MS", "20"))
+MESSAGE_BATCH_MAX = min(200, int(os.getenv("MESSAGE_BATCH_MAX", "200")))
+MESSAGE_BATCH_CACHE_TTL = float(os.getenv("MESSAGE_BATCH_CACHE_TTL", "300"))
 
 # --- SMART CACHE ---
 SMART_CACHE_ENABLED = os.getenv("SMART_CACHE_ENABLED", "1").lower() not in ("0", "false", "no", "off")
@@ -95,6 +122,15 @@ SMART_CACHE_ENABLED = os.getenv("SMART_CACHE_ENABLED", "1").lower() not in ("0",
 MAX_DISK_CACHE_SIZE = 4 * 1024 * 1024 * 1024  
 # Tamaño ideal por video en disco (5 MB es un buen balance)
 TARGET_VIDEO_CACHE_SIZE = 5 * 1024 * 1024
+# Presupuesto de la caché RAM de prefijos de video (MB) y fracción reservada al segmento protegido de la LRU
+RAM_CACHE_MAX_MB = int(os.getenv("RAM_CACHE_MAX_MB", "512"))
+RAM_CACHE_PROTECTED_RATIO = float(os.getenv("RAM_CACHE_PROTECTED_RATIO", "0.8"))
+# Caché LRU de (video_id, ruta_local) por mensaje: entradas máximas y TTL (s) de aciertos y de negativos
+VIDEO_INFO_CACHE_SIZE = int(os.getenv("VIDEO_INFO_CACHE_SIZE", "5000"))
+VIDEO_INFO_CACHE_TTL = float(os.getenv("VIDEO_INFO_CACHE_TTL", "600"))
+VIDEO_INFO_CACHE_NEGATIVE_TTL = float(os.getenv("VIDEO_INFO_CACHE_NEGATIVE_TTL", "30"))
+# ETags de thumbs (hash del contenido) recordados en memoria para responder 304 sin tocar disco
+THUMB_ETAG_CACHE_SIZE = int(os.getenv("THUMB_ETAG_CACHE_SIZE", "50000"))
 
 # --- CARPETAS ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -102,7 +138,9 @@ DUMP_FOLDER = os.path.join(BASE_DIR, "dumps")
 FOLDER_SESSIONS = os.path.join(BASE_DIR, "sessions")
 THUMB_FOLDER = os.path.join(DUMP_FOLDER, "thumbs", "videos")
 GRUPOS_THUMB_FOLDER = os.path.join(DUMP_FOLDER, "thumbs", "grupos_canales")
+THUMB_PACK_FOLDER = os.path.join(DUMP_FOLDER, "thumbs", "packs")
 JSON_FOLDER = os.path.join(DUMP_FOLDER, "json")
+BOT_RATES_FILE = os.path.join(JSON_FOLDER, "bot_rates.json")  # Ritmos aprendidos por bot
 
 # Carpeta gestionada inteligentemente
 CACHE_DIR = os.path.join(DUMP_FOLDER, "smart_cache") 
@@ -111,6 +149,20 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 MAIN_TEMPLATE = "layout.html"
 DB_PATH = os.path.join(BASE_DIR, "database", "chats.db")
 
+# --- POOL DE CONEXIONES SQLITE ---
+# Conexiones lectoras simultáneas (además de la única escritora)
+DB_POOL_READERS = int(os.getenv("DB_POOL_READERS", "4"))
+# Segundos de inactividad tras los cuales se valida la conexión con SELECT 1
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "60"))
+# Segundos que se reutiliza el total (COUNT) de un listado paginado por cursor
+PAGE_COUNT_CACHE_TTL = float(os.getenv("PAGE_COUNT_CACHE_TTL", "60"))
+
+# --- COLA DE ESCRITURA DE VIDEOS (write-behind) ---
+# Operaciones por transacción, segundos máximos antes de vaciar y tope de pendientes (backpressure)
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "500"))
+WRITE_QUEUE_FLUSH_INTERVAL = float(os.getenv("WRITE_QUEUE_FLUSH_INTERVAL", "0.5"))
+WRITE_QUEUE_MAX_PENDING = int(os.getenv("WRITE_QUEUE_MAX_PENDING", "10000"))
+
 # --- SERVIDOR ---
 HOST = "127.0.0.2"
 PORT = 8000
@@ -144,6 +196,29 @@ SPRITE_QUALITY = 70  # Calidad un poco menor para que el sprite no pese demasiad
 MIN_SPRITE_DURATION = 5
 MIN_FILE_SIZE = 1024
 
+# --- THUMBS (descarga en memoria + WebP en pool de procesos) ---
+# Calidad WebP y esfuerzo del codificador (method: 0 = más rápido ... 6 = más lento y compacto)
+THUMB_WEBP_QUALITY = int(os.getenv("THUMB_WEBP_QUALITY", "90"))
+THUMB_WEBP_METHOD = int(os.getenv("THUMB_WEBP_METHOD", "4"))
+# Procesos para decodificar/codificar thumbs (0 = en un hilo, sin pool de procesos)
+THUMB_ENCODE_WORKERS = int(os.getenv("THUMB_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Servir thumbs desde el almacén empaquetado (CLI/empaquetar_thumbs.py) y tamaño máximo de cada pack (MB)
+THUMB_PACK_ENABLED = os.getenv("THUMB_PACK_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+THUMB_PACK_MAX_MB = int(os.getenv("THUMB_PACK_MAX_MB", "512"))
+# Hoja de sprites por página de grilla: columnas, ancho de celda (16:9), calidad y sprites en caché
+THUMB_SPRITE_ENABLED = os.getenv("THUMB_SPRITE_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+THUMB_SPRITE_COLS = int(os.getenv("THUMB_SPRITE_COLS", "10"))
+THUMB_SPRITE_TILE_WIDTH = int(os.getenv("THUMB_SPRITE_TILE_WIDTH", "256"))
+THUMB_SPRITE_QUALITY = int(os.getenv("THUMB_SPRITE_QUALITY", "80"))
+THUMB_SPRITE_CACHE_SIZE = int(os.getenv("THUMB_SPRITE_CACHE_SIZE", "32"))
+# Cola de thumbs pendientes: filas por página leída de la BD y segundos sin trabajo antes de cerrar los bots
+THUMB_QUEUE_PAGE_SIZE = int(os.getenv("THUMB_QUEUE_PAGE_SIZE", "500"))
+THUMB_QUEUE_IDLE_SECONDS = int(os.getenv("THUMB_QUEUE_IDLE_SECONDS", "30"))
+# Duplicados por pHash: distancia de Hamming máxima por defecto (bits, 0 = phash idéntico)
+# y segundos que dura el índice en memoria de toda la biblioteca antes de recargarlo
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))
+PHASH_INDEX_TTL = int(os.getenv("PHASH_INDEX_TTL", "600"))
+
 # Timeouts (segundos)
 FFPROBE_TIMEOUT = 15
 FFMPEG_THUMB_TIMEOUT = 30
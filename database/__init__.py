@@ -5,8 +5,12 @@ Expone las funciones principales para uso externo.
 from .connection import (
     init_db,
     get_db,
+    get_read_db,
     transaction,
     get_sync_connection,
+    close_pool,
+    run_with_pool,
+    get_pool_stats,
     DatabaseConnectionError
 )
 
@@ -34,6 +38,17 @@ from .videos import (
     db_bulk_add_video_file_ids
 )
 
+# 2b. Cola de escritura única para videos (write-behind)
+from .write_queue import (
+    db_enqueue_video,
+    db_enqueue_video_message,
+    db_enqueue_video_file_id,
+    db_enqueue_thumb_ready,
+    db_flush_writes,
+    db_stop_write_queue,
+    get_write_queue_stats
+)
+
 # 3. Funciones de CARPETAS (Solo get_folder_items_from_db está aquí)
 from .folders import (
     get_folder_items_from_db,
@@ -49,11 +64,18 @@ from .tags import (
 
 # 5. Funciones NUEVAS de OPTIMIZACIÓN (Queries y Counters)
 from .queries import db_get_channel_videos, db_get_chat_info
+from .fts import fts_filter, fts_match_query, fts_ready, BM25_WEIGHTS
+from .keyset import (
+    SEEK_SORTS, encode_cursor, decode_cursor, seek_page, clamp_page, keyset_page_info,
+    cached_count, get_keyset_stats,
+)
+from .message_counts import messages_counts_for
 from .counters import update_chat_stats_background
 
 __all__ = [
     # Conexión
-    "init_db", "get_db", "transaction", "get_sync_connection", "DatabaseConnectionError",
+    "init_db", "get_db", "get_read_db", "transaction", "get_sync_connection",
+    "close_pool", "run_with_pool", "get_pool_stats", "DatabaseConnectionError",
     
     # Chats
     "db_upsert_chat_basic", "db_upsert_chat_from_ci", "db_get_chat",
@@ -64,6 +86,10 @@ __all__ = [
     "db_upsert_video", "db_add_video_file_id", "db_upsert_video_message",
     "db_get_video_messages", "db_count_videos_by_chat",
     "db_bulk_upsert_videos", "db_bulk_upsert_video_messages", "db_bulk_add_video_file_ids",
+
+    # Cola de escritura
+    "db_enqueue_video", "db_enqueue_video_message", "db_enqueue_video_file_id",
+    "db_enqueue_thumb_ready", "db_flush_writes", "db_stop_write_queue", "get_write_queue_stats",
     
     # Folders
     "get_folder_items_from_db", "get_all_chats_with_counts",
@@ -72,5 +98,15 @@ __all__ = [
     "db_upsert_tag", "db_list_tags", "db_ensure_tags_table",
 
     # Optimization
-    "db_get_channel_videos", "db_get_chat_info", "update_chat_stats_background"
+    "db_get_channel_videos", "db_get_chat_info", "update_chat_stats_background",
+
+    # Búsqueda FTS5
+    "fts_filter", "fts_match_query", "fts_ready", "BM25_WEIGHTS",
+
+    # Paginación por cursor
+    "SEEK_SORTS", "encode_cursor", "decode_cursor", "seek_page", "clamp_page", "keyset_page_info",
+    "cached_count", "get_keyset_stats",
+
+    # Conteo de mensajes por video
+    "messages_counts_for",
 ]
\ No newline at end of file
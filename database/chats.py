@@ -4,9 +4,7 @@ Versión Async TOTAL (aiosqlite).
 """
 import json
 import datetime
-import aiosqlite
-from config import DB_PATH
-from database.connection import get_db
+from database.connection import get_db, get_read_db
 
 async def db_upsert_chat_basic(
     chat_id: int,
@@ -152,7 +150,7 @@ async def db_bulk_upsert_chats(chats_data: list[tuple]) -> None:
 
 async def db_get_chat(chat_id: int) -> dict | None:
     """Obtiene un chat guardado por ID de forma ASÍNCRONA."""
-    async with get_db() as db:
+    async with get_read_db() as db:
         async with db.execute(
             """
             SELECT
@@ -212,7 +210,7 @@ async def db_upsert_chat_video_count(
 
 async def db_get_chat_scan_meta(chat_id: int) -> dict | None:
     """Obtiene videos_count, scanned_at, duplicados e indexados del chat si existen."""
-    async with get_db() as db:
+    async with get_read_db() as db:
         async with db.execute(
             "SELECT videos_count, scanned_at, duplicados, indexados FROM chat_video_counts WHERE chat_id = ? LIMIT 1",
             (chat_id,),
@@ -230,7 +228,7 @@ async def db_get_chat_scan_meta(chat_id: int) -> dict | None:
 
 async def db_get_chat_folders(chat_id: int) -> list[int]:
     """Obtiene las carpetas a las que pertenece un chat de forma ASÍNCRONA."""
-    async with get_db() as db:
+    async with get_read_db() as db:
         async with db.execute("SELECT folder_id FROM chat_folders WHERE chat_id = ?", (chat_id,)) as cursor:
             rows = await cursor.fetchall()
             return [r[0] for r in rows]
@@ -1,14 +1,16 @@
 """
 Conexión y configuración de la base de datos (Versión Asíncrona con aiosqlite).
+Pool de conexiones de larga vida (N lectoras + 1 escritora).
 Incluye manejo de reconexión y bloqueos.
 """
 import aiosqlite
 import sqlite3
 import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
 from typing import AsyncIterator, Optional, List, Tuple, Any, Dict
-from config import DB_PATH
+from config import DB_PATH, DB_POOL_READERS, DB_POOL_HEALTHCHECK_IDLE
 from utils import log_timing
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -34,7 +36,7 @@ class DatabaseConnectionError(Exception):
     """Excepción personalizada para errores de conexión a la base de datos."""
     pass
 
-async def get_db_connection() -> aiosqlite.Connection:
+async def get_db_connection(read_only: bool = False) -> aiosqlite.Connection:
     """
     Obtiene una conexión a la base de datos con configuración optimizada.
     Incluye manejo de reconexión automática.
@@ -49,9 +51,10 @@ async def get_db_connection() -> aiosqlite.Connection:
             # Aplicar configuraciones PRAGMA
             for pragma, value in SQLITE_PRAGMAS.items():
                 await db.execute(f"PRAGMA {pragma} = {value}")
-                
-            # Habilitar soporte para claves foráneas
-            await db.execute("PRAGMA foreign_keys = ON")
+
+            # Las conexiones lectoras no pueden escribir por accidente
+            if read_only:
+                await db.execute("PRAGMA query_only = ON")
             
             # Configurar el modo de aislamiento
             db.isolation_level = "IMMEDIATE"
@@ -70,19 +73,271 @@ async def get_db_connection() -> aiosqlite.Connection:
                 logger.error("Número máximo de reintentos alcanzado")
                 raise DatabaseConnectionError(
                     f"No se pudo conectar a la base de datos después de {MAX_RETRIES} intentos"
-                ) from e
+                ) from last_error
+
+
+class _PooledConnection:
+    """Conexión del pool con su marca de último uso (para el health check)."""
+    __slots__ = ("conn", "last_used")
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self.conn = conn
+        self.last_used = time.monotonic()
+
+
+class DatabasePool:
+    """
+    Pool de conexiones aiosqlite de larga vida.
+    - N conexiones lectoras (query_only) compartidas vía asyncio.Queue.
+    - 1 conexión escritora dedicada, serializada con un Lock
+      (SQLite solo admite un escritor a la vez en WAL).
+    Los PRAGMAs se aplican una sola vez al abrir cada conexión.
+    """
+
+    def __init__(self, readers: int = DB_POOL_READERS):
+        self.size = max(1, readers)
+        self._readers: asyncio.Queue[_PooledConnection] = asyncio.Queue()
+        self._writer: Optional[_PooledConnection] = None
+        self._writer_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._opened_readers = 0
+        self._closed = False
+        self.loop = asyncio.get_running_loop()
+        self.stats: Dict[str, Any] = {
+            "reader_borrows": 0,
+            "writer_borrows": 0,
+            "reader_waits": 0,
+            "writer_waits": 0,
+            "wait_time_ms": 0.0,
+            "reconnects": 0,
+            "health_checks": 0,
+            "rollbacks_on_release": 0,
+        }
+
+    async def _open(self, read_only: bool) -> _PooledConnection:
+        return _PooledConnection(await get_db_connection(read_only=read_only))
+
+    async def _ensure_healthy(self, item: _PooledConnection, read_only: bool) -> _PooledConnection:
+        """Valida con SELECT 1 las conexiones ociosas; si fallan, las reabre."""
+        if time.monotonic() - item.last_used < DB_POOL_HEALTHCHECK_IDLE:
+            return item
+        self.stats["health_checks"] += 1
+        try:
+            async with item.conn.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+            return item
+        except Exception as e:
+            logger.warning(f"Conexión del pool inválida, reconectando: {e}")
+            try:
+                await item.conn.close()
+            except Exception:
+                pass
+            self.stats["reconnects"] += 1
+            return await self._open(read_only)
+
+    async def _reset(self, item: _PooledConnection) -> None:
+        """Deja la conexión limpia para el siguiente que la pida."""
+        conn = item.conn
+        conn.row_factory = None
+        if conn.in_transaction:
+            self.stats["rollbacks_on_release"] += 1
+            await conn.rollback()
+        item.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        item = await self._acquire_reader()
+        broken = False
+        try:
+            yield item.conn
+        except (sqlite3.ProgrammingError, ValueError):
+            # Conexión cerrada o inutilizable: no la devolvemos al pool
+            broken = True
+            raise
+        finally:
+            await self._release_reader(item, broken)
+
+    async def _acquire_reader(self) -> _PooledConnection:
+        self.stats["reader_borrows"] += 1
+        if self._readers.empty():
+            async with self._open_lock:
+                if self._readers.empty() and self._opened_readers < self.size:
+                    self._opened_readers += 1
+                    try:
+                        return await self._open(read_only=True)
+                    except Exception:
+                        self._opened_readers -= 1
+                        raise
+            self.stats["reader_waits"] += 1
+        started = time.perf_counter()
+        item = await self._readers.get()
+        self.stats["wait_time_ms"] += (time.perf_counter() - started) * 1000
+        try:
+            return await self._ensure_healthy(item, read_only=True)
+        except Exception:
+            # La vieja ya está cerrada y la nueva no abrió: se libera el hueco
+            self._opened_readers -= 1
+            raise
+
+    async def _release_reader(self, item: _PooledConnection, broken: bool) -> None:
+        if not broken and not self._closed:
+            try:
+                await self._reset(item)
+                self._readers.put_nowait(item)
+                return
+            except Exception:
+                pass
+        self._opened_readers -= 1
+        try:
+            await item.conn.close()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        self.stats["writer_borrows"] += 1
+        if self._writer_lock.locked():
+            self.stats["writer_waits"] += 1
+        started = time.perf_counter()
+        async with self._writer_lock:
+            self.stats["wait_time_ms"] += (time.perf_counter() - started) * 1000
+            if self._writer is None:
+                self._writer = await self._open(read_only=False)
+            else:
+                self._writer = await self._ensure_healthy(self._writer, read_only=False)
+            try:
+                yield self._writer.conn
+            finally:
+                try:
+                    await self._reset(self._writer)
+                except Exception:
+                    self.stats["reconnects"] += 1
+                    try:
+                        await self._writer.conn.close()
+                    except Exception:
+                        pass
+                    self._writer = None
+
+    async def close(self) -> None:
+        self._closed = True
+        while not self._readers.empty():
+            item = self._readers.get_nowait()
+            self._opened_readers -= 1
+            try:
+                await item.conn.close()
+            except Exception:
+                pass
+        async with self._writer_lock:
+            if self._writer is not None:
+                try:
+                    await self._writer.conn.close()
+                except Exception:
+                    pass
+                self._writer = None
+
+    def close_nowait(self) -> None:
+        """
+        Cierre sin await para un pool cuyo event loop ya terminó: detiene los
+        hilos de aiosqlite (no son daemon y dejarían colgado el proceso).
+        """
+        self._closed = True
+        conns = []
+        while not self._readers.empty():
+            conns.append(self._readers.get_nowait().conn)
+        if self._writer is not None:
+            conns.append(self._writer.conn)
+            self._writer = None
+        self._opened_readers = 0
+        for conn in conns:
+            try:
+                conn.stop()
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "wait_time_ms": round(self.stats["wait_time_ms"], 2),
+            "readers_max": self.size,
+            "readers_open": self._opened_readers,
+            "readers_idle": self._readers.qsize(),
+            "writer_open": self._writer is not None,
+            "writer_busy": self._writer_lock.locked(),
+        }
+
+
+_pool: Optional[DatabasePool] = None
+
+
+def _get_pool() -> DatabasePool:
+    """
+    Devuelve el pool del event loop actual (lo crea de forma perezosa).
+    Los scripts CLI que llaman asyncio.run varias veces obtienen un pool nuevo
+    por loop, ya que Queue/Lock quedan ligados al loop donde se usaron; el del
+    loop anterior se cierra.
+    """
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool.loop is not loop or _pool._closed:
+        if _pool is not None and not _pool._closed:
+            _pool.close_nowait()
+        _pool = DatabasePool()
+    return _pool
+
+
+async def close_pool() -> None:
+    """Cierra todas las conexiones del pool (shutdown de la app)."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def run_with_pool(coro) -> Any:
+    """
+    asyncio.run para scripts CLI: vacía la cola de escritura y cierra el pool
+    al terminar (aunque falle). Sin esto el proceso no termina, porque las
+    conexiones de aiosqlite corren en hilos que no son daemon.
+    """
+    from database.write_queue import db_stop_write_queue  # Import local: write_queue importa este módulo
+
+    async def _main():
+        try:
+            return await coro
+        finally:
+            try:
+                await db_stop_write_queue()
+            finally:
+                await close_pool()
+
+    return asyncio.run(_main())
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Estadísticas del pool para /api/stats."""
+    if _pool is None:
+        return {"readers_max": DB_POOL_READERS, "readers_open": 0, "writer_open": False}
+    return _pool.get_stats()
+
 
 @asynccontextmanager
 async def get_db() -> AsyncIterator[aiosqlite.Connection]:
     """
-    Context manager para manejar conexiones a la base de datos.
-    Se encarga de abrir y cerrar la conexión automáticamente.
+    Presta la conexión ESCRITORA del pool (serializada).
+    Usar para cualquier INSERT/UPDATE/DELETE; el llamador hace commit.
     """
-    db = await get_db_connection()
-    try:
+    async with _get_pool().writer() as db:
+        yield db
+
+
+@asynccontextmanager
+async def get_read_db() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    Presta una conexión LECTORA del pool (solo SELECT).
+    Varias lecturas pueden correr en paralelo con WAL.
+    """
+    async with _get_pool().reader() as db:
         yield db
-    finally:
-        await db.close()
 
 @asynccontextmanager
 async def transaction(db: aiosqlite.Connection) -> AsyncIterator[aiosqlite.Cursor]:
@@ -218,6 +473,23 @@ async def init_db():
         
         # Aplicar migraciones
         await _run_migrations(db)
+
+        log_timing("   Verificando índices de paginación por cursor...")
+        from .keyset import SEEK_INDEXES_SQL
+        for sql in SEEK_INDEXES_SQL:
+            await db.execute(sql)
+
+        log_timing("   Verificando conteo de mensajes por video...")
+        from .videos import ensure_video_messages_table
+        await ensure_video_messages_table(db)
+
+        log_timing("   Verificando triggers de contadores por chat...")
+        from .counters import ensure_chat_stats_triggers
+        await ensure_chat_stats_triggers(db)
+
+        log_timing("   Verificando índice FTS de videos...")
+        from .fts import ensure_videos_fts
+        await ensure_videos_fts(db)
         
         
         await db.commit()
@@ -229,9 +501,11 @@ async def _run_migrations(db: aiosqlite.Connection):
     # Verificar y agregar columnas faltantes
     tables = {
         "chats": ["last_message_date", "ultimo_escaneo"],
-        "chat_video_counts": ["duplicados", "indexados"],
+        "chat_video_counts": ["duplicados", "indexados",
+                              "videos_locales", "sin_thumb", "vertical", "duration_1h", "blocked", "last_updated"],
         "videos_telegram": ["watch_later", "thumb_bytes", "has_thumb", 
-                           "tamano_bytes", "duracion", "nombre", "fecha_mensaje"]
+                           "tamano_bytes", "duracion", "nombre", "fecha_mensaje",
+                           "es_vertical", "dump_fail", "dump_message_id"]
     }
     
     for table, columns in tables.items():
@@ -253,7 +527,16 @@ async def _run_migrations(db: aiosqlite.Connection):
                         "tamano_bytes": "INTEGER",
                         "duracion": "INTEGER",
                         "nombre": "TEXT",
-                        "fecha_mensaje": "TEXT"
+                        "fecha_mensaje": "TEXT",
+                        "videos_locales": "INTEGER DEFAULT 0",
+                        "sin_thumb": "INTEGER DEFAULT 0",
+                        "vertical": "INTEGER DEFAULT 0",
+                        "duration_1h": "INTEGER DEFAULT 0",
+                        "blocked": "INTEGER DEFAULT 0",
+                        "last_updated": "TEXT",
+                        "es_vertical": "INTEGER DEFAULT 0",
+                        "dump_fail": "INTEGER DEFAULT 0",
+                        "dump_message_id": "INTEGER"
                     }[column])
         except aiosqlite.OperationalError as e:
             logger.warning(f"No se pudo verificar la tabla {table}: {e}")
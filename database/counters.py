@@ -1,14 +1,95 @@
 """
 Gestión de contadores cacheados en segundo plano (Worker).
 Se encarga de mantener la tabla chat_video_counts actualizada sin bloquear la UI.
-Incluye lógica de recálculo masivo seguro.
+Los contadores locales por chat (videos_locales, sin_thumb, vertical,
+duration_1h, blocked) los ajustan triggers sobre videos_telegram en cada
+insert, update y delete. videos_count no se toca: es el total que reporta
+Telegram (auditoría / pipeline de conteo). El recálculo masivo queda como
+verificación/reparación (CLI/recalcular_stats_chats.py).
 """
 import asyncio
-import aiosqlite
+import sqlite3
 import time
-from config import DB_PATH
+
+import aiosqlite
+
+from database.connection import get_db, get_read_db
 from utils import log_timing
 
+# Contadores por chat y la condición de fila que suma 1 en cada uno
+STAT_PREDICATES = {
+    "sin_thumb": "{r}.has_thumb = 0",
+    "vertical": "{r}.es_vertical = 1",
+    "duration_1h": "{r}.duracion >= 3600",
+    "blocked": "{r}.dump_fail = 1 AND {r}.dump_message_id IS NULL",
+}
+STAT_COLUMNS = ("videos_locales", *STAT_PREDICATES)
+
+# Recálculo completo (GROUP BY sobre toda la tabla): solo para verificar/reparar
+STATS_BY_CHAT_SQL = f"""
+    SELECT
+        chat_id,
+        COUNT(*) as total,
+        {", ".join(f"SUM(CASE WHEN {p.format(r='videos_telegram')} THEN 1 ELSE 0 END)" for p in STAT_PREDICATES.values())}
+    FROM videos_telegram
+    GROUP BY chat_id
+"""
+
+UPSERT_STATS_SQL = """
+    INSERT INTO chat_video_counts
+    (videos_locales, sin_thumb, vertical, duration_1h, blocked, chat_id, last_updated)
+    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(chat_id) DO UPDATE SET
+        videos_locales = excluded.videos_locales,
+        sin_thumb = excluded.sin_thumb,
+        vertical = excluded.vertical,
+        duration_1h = excluded.duration_1h,
+        blocked = excluded.blocked,
+        last_updated = CURRENT_TIMESTAMP
+"""
+
+
+def _row_deltas(r: str) -> list[str]:
+    """Aporte (0/1) de la fila new/old a cada contador de STAT_COLUMNS."""
+    return ["1"] + [f"(CASE WHEN {p.format(r=r)} THEN 1 ELSE 0 END)" for p in STAT_PREDICATES.values()]
+
+
+def _add_sql(r: str) -> str:
+    cols = ", ".join(STAT_COLUMNS)
+    sets = ", ".join(f"{c} = COALESCE({c}, 0) + excluded.{c}" for c in STAT_COLUMNS)
+    return f"""
+        INSERT INTO chat_video_counts (chat_id, {cols}, last_updated)
+        VALUES ({r}.chat_id, {", ".join(_row_deltas(r))}, CURRENT_TIMESTAMP)
+        ON CONFLICT(chat_id) DO UPDATE SET {sets}, last_updated = CURRENT_TIMESTAMP;"""
+
+
+def _sub_sql(r: str) -> str:
+    sets = ", ".join(f"{c} = COALESCE({c}, 0) - {d}" for c, d in zip(STAT_COLUMNS, _row_deltas(r)))
+    return f"""
+        UPDATE chat_video_counts SET {sets}, last_updated = CURRENT_TIMESTAMP
+        WHERE chat_id = {r}.chat_id;"""
+
+
+_changed = " OR ".join(
+    ["old.chat_id IS NOT new.chat_id"]
+    + [f"({p.format(r='old')}) IS NOT ({p.format(r='new')})" for p in STAT_PREDICATES.values()]
+)
+
+# Versión anterior de los triggers: sumaban en videos_count, que es el total de Telegram
+OLD_TRIGGERS_SQL = [
+    f"DROP TRIGGER IF EXISTS {name}"
+    for name in ("videos_chat_stats_ai", "videos_chat_stats_ad", "videos_chat_stats_au")
+]
+
+CHAT_STATS_TRIGGERS_SQL = [
+    f"CREATE TRIGGER IF NOT EXISTS videos_chat_local_ai AFTER INSERT ON videos_telegram BEGIN {_add_sql('new')} END",
+    f"CREATE TRIGGER IF NOT EXISTS videos_chat_local_ad AFTER DELETE ON videos_telegram BEGIN {_sub_sql('old')} END",
+    # Los upserts reescriben las columnas aunque no cambien: solo se ajusta si cambia algún contador
+    f"""CREATE TRIGGER IF NOT EXISTS videos_chat_local_au
+    AFTER UPDATE OF chat_id, has_thumb, es_vertical, duracion, dump_fail, dump_message_id ON videos_telegram
+    WHEN {_changed} BEGIN {_sub_sql('old')} {_add_sql('new')} END""",
+]
+
 # Semáforo para actualizaciones individuales (1 a la vez para no saturar)
 _counter_semaphore = asyncio.Semaphore(1)
 
@@ -22,10 +103,52 @@ async def update_chat_stats_background(chat_id: int):
     """
     asyncio.create_task(_worker_update_stats(chat_id))
 
+async def ensure_chat_stats_triggers(db: aiosqlite.Connection) -> None:
+    """Crea los triggers de contadores si faltan; al instalarlos por primera vez recalcula todo una vez."""
+    async with db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'videos_chat_local_ai'"
+    ) as cursor:
+        existia = await cursor.fetchone() is not None
+    for sql in OLD_TRIGGERS_SQL + CHAT_STATS_TRIGGERS_SQL:
+        await db.execute(sql)
+    if not existia:
+        async with db.execute(STATS_BY_CHAT_SQL) as cursor:
+            rows = await cursor.fetchall()
+        await db.executemany(UPSERT_STATS_SQL, _batch_from_rows(rows))
+    await db.commit()
+
+
+def _batch_from_rows(rows) -> list[tuple]:
+    """Filas de STATS_BY_CHAT_SQL -> parámetros de UPSERT_STATS_SQL."""
+    # r = (chat_id, total, sin_thumb, vertical, duration_1h, blocked)
+    return [(r[1] or 0, r[2] or 0, r[3] or 0, r[4] or 0, r[5] or 0, r[0]) for r in rows]
+
+
+def chat_stats_mismatches(conn: sqlite3.Connection) -> list[int]:
+    """chat_id cuyos contadores en chat_video_counts no coinciden con el recálculo completo."""
+    guardados = {
+        row[0]: tuple(v or 0 for v in row[1:])
+        for row in conn.execute(f"SELECT chat_id, {', '.join(STAT_COLUMNS)} FROM chat_video_counts")
+    }
+    return [
+        r[5] for r in _batch_from_rows(conn.execute(STATS_BY_CHAT_SQL).fetchall())
+        if guardados.get(r[5]) != r[:5]
+    ]
+
+
+def repair_chat_stats(conn: sqlite3.Connection) -> int:
+    """Reescribe los contadores de todos los chats con el recálculo completo. Devuelve cuántos chats."""
+    batch = _batch_from_rows(conn.execute(STATS_BY_CHAT_SQL).fetchall())
+    conn.executemany(UPSERT_STATS_SQL, batch)
+    conn.commit()
+    return len(batch)
+
+
 async def recalculate_all_stats_background():
     """
     Función pública: Dispara el recálculo MASIVO de TODOS los chats.
-    Usado por: Home (al cargar la página principal).
+    Ya no se usa al cargar páginas (los triggers mantienen los contadores): queda
+    para reparar a mano si se sospecha una desincronización.
     Es "Fire & Forget": retorna inmediatamente y deja el trabajo corriendo en background.
     Si ya hay un cálculo masivo corriendo, se salta esta llamada.
     """
@@ -39,7 +162,7 @@ async def _worker_update_stats(chat_id: int):
     """Lógica interna: Calcula estadísticas de un solo chat."""
     async with _counter_semaphore:
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with get_read_db() as db:
                 async with db.execute("""
                     SELECT 
                         COUNT(*),
@@ -52,17 +175,18 @@ async def _worker_update_stats(chat_id: int):
                 """, (chat_id,)) as cursor:
                     row = await cursor.fetchone()
                 
-                if not row: return
+            if not row: return
 
-                total, no_thumb, vertical, long_vid, blocked = row
+            total, no_thumb, vertical, long_vid, blocked = row
                 
-                # Upsert (Insertar o Actualizar)
+            # Upsert (Insertar o Actualizar)
+            async with get_db() as db:
                 await db.execute("""
                     INSERT INTO chat_video_counts 
-                    (chat_id, videos_count, sin_thumb, vertical, duration_1h, blocked, last_updated)
+                    (chat_id, videos_locales, sin_thumb, vertical, duration_1h, blocked, last_updated)
                     VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
                     ON CONFLICT(chat_id) DO UPDATE SET
-                        videos_count = excluded.videos_count,
+                        videos_locales = excluded.videos_locales,
                         sin_thumb = excluded.sin_thumb,
                         vertical = excluded.vertical,
                         duration_1h = excluded.duration_1h,
@@ -81,50 +205,19 @@ async def _worker_recalculate_all():
     async with _global_recalc_lock:
         try:
             # start = time.time()
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with get_read_db() as db:
                 # 1. Calcular todo en memoria (Una sola lectura masiva es muy rápida)
-                async with db.execute("""
-                    SELECT 
-                        chat_id,
-                        COUNT(*) as total,
-                        SUM(CASE WHEN has_thumb = 0 THEN 1 ELSE 0 END),
-                        SUM(CASE WHEN es_vertical = 1 THEN 1 ELSE 0 END),
-                        SUM(CASE WHEN duracion >= 3600 THEN 1 ELSE 0 END),
-                        SUM(CASE WHEN dump_fail = 1 AND dump_message_id IS NULL THEN 1 ELSE 0 END)
-                    FROM videos_telegram
-                    GROUP BY chat_id
-                """) as cursor:
+                async with db.execute(STATS_BY_CHAT_SQL) as cursor:
                     rows = await cursor.fetchall()
 
-                if not rows: return
-
-                # 2. Preparar datos para inserción en lote
-                # La query espera: (videos_count, sin_thumb, vertical, duration_1h, blocked, CHAT_ID)
-                batch_data = []
-                for r in rows:
-                    # r = (chat_id, total, sin_thumb, vertical, duration_1h, blocked)
-                    batch_data.append((
-                        r[1] or 0, # videos_count
-                        r[2] or 0, # sin_thumb
-                        r[3] or 0, # vertical
-                        r[4] or 0, # duration_1h
-                        r[5] or 0, # blocked
-                        r[0]       # chat_id
-                    ))
-
-                # 3. Escritura masiva
-                await db.executemany("""
-                    INSERT INTO chat_video_counts 
-                    (videos_count, sin_thumb, vertical, duration_1h, blocked, chat_id, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    ON CONFLICT(chat_id) DO UPDATE SET
-                        videos_count = excluded.videos_count,
-                        sin_thumb = excluded.sin_thumb,
-                        vertical = excluded.vertical,
-                        duration_1h = excluded.duration_1h,
-                        blocked = excluded.blocked,
-                        last_updated = CURRENT_TIMESTAMP
-                """, batch_data)
+            if not rows: return
+
+            # 2. Preparar datos para inserción en lote
+            batch_data = _batch_from_rows(rows)
+
+            # 3. Escritura masiva (conexión escritora del pool)
+            async with get_db() as db:
+                await db.executemany(UPSERT_STATS_SQL, batch_data)
                 
                 await db.commit()
                 log_timing(f"✅ Recálculo masivo completado: {len(batch_data)} chats actualizados")
@@ -6,7 +6,7 @@ import datetime
 import aiosqlite
 from typing import List
 from config import DB_PATH, CACHE_DUMP_VIDEOS_CHANNEL_ID
-from database.connection import get_db
+from database.connection import get_read_db
 from .chats import db_get_chat_folders
 from utils import serialize_pyrogram, json_serial, log_timing
 
@@ -22,7 +22,7 @@ async def get_all_chats_with_counts(
     """
     limite = limite_videos if limite_videos is not None else 9_999_999_999
 
-    async with get_db() as db:
+    async with get_read_db() as db:
         log_timing("Iniciando consulta optimizada (chats con conteos)")
         # JOIN único para obtener todo en una sola consulta
         query = """
@@ -173,7 +173,7 @@ async def get_folder_items_from_db(
     """
     Devuelve la lista de chats de una carpeta desde la BD local (Async).
     """
-    async with get_db() as db:
+    async with get_read_db() as db:
         # Consulta optimizada
         query = """
             SELECT
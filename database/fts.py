@@ -0,0 +1,122 @@
+"""
+Índice FTS5 sobre nombre y caption de videos_telegram para la búsqueda local.
+Tabla de contenido externo (no duplica el texto) sincronizada con triggers;
+el tokenizador unicode61 con remove_diacritics ignora tildes ("cancion"
+encuentra "Canción"). Cada palabra buscada se trata como prefijo para la
+búsqueda mientras se escribe.
+El índice de filas ya existentes se arma con CLI/indexar_fts.py; hasta
+entonces las búsquedas siguen por LIKE.
+"""
+import re
+import time
+import logging
+import sqlite3
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "videos_fts"
+# Pesos de bm25 por columna (nombre, caption): el nombre pesa más
+BM25_WEIGHTS = (10.0, 1.0)
+
+FTS_SCHEMA_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        nombre, caption,
+        content='videos_telegram', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Marca de índice completo (la deja el backfill o una BD nueva)
+    "CREATE TABLE IF NOT EXISTS fts_state (name TEXT PRIMARY KEY, built_at TEXT)",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos_telegram BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, nombre, caption) VALUES (new.rowid, new.nombre, new.caption);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos_telegram BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, caption) VALUES ('delete', old.rowid, old.nombre, old.caption);
+    END
+    """,
+    # Los upserts reescriben nombre/caption aunque no cambien: solo se reindexa si cambian
+    f"""
+    CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE OF nombre, caption ON videos_telegram
+    WHEN old.nombre IS NOT new.nombre OR old.caption IS NOT new.caption BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, caption) VALUES ('delete', old.rowid, old.nombre, old.caption);
+        INSERT INTO {FTS_TABLE}(rowid, nombre, caption) VALUES (new.rowid, new.nombre, new.caption);
+    END
+    """,
+]
+
+MARK_BUILT_SQL = "INSERT OR REPLACE INTO fts_state (name, built_at) VALUES (?, datetime('now'))"
+
+_word_re = re.compile(r"\w+", re.UNICODE)
+_ready = False
+_ready_checked_at = 0.0
+_READY_RECHECK_SECONDS = 60
+
+
+def fts_match_query(q: str) -> str | None:
+    """Texto del usuario -> expresión MATCH (todas las palabras, cada una como prefijo)."""
+    words = _word_re.findall(q or "")
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
+
+
+async def ensure_videos_fts(db: aiosqlite.Connection) -> None:
+    """Crea la tabla FTS5 y sus triggers si faltan. En una BD sin videos queda lista al instante."""
+    try:
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)) as cursor:
+            existia = await cursor.fetchone() is not None
+        for sql in FTS_SCHEMA_SQL:
+            await db.execute(sql)
+        if not existia:
+            async with db.execute("SELECT 1 FROM videos_telegram LIMIT 1") as cursor:
+                if await cursor.fetchone() is None:
+                    await db.execute(MARK_BUILT_SQL, (FTS_TABLE,))
+        await db.commit()
+    except (aiosqlite.OperationalError, sqlite3.OperationalError) as e:
+        # SQLite sin FTS5: la búsqueda sigue por LIKE
+        logger.warning(f"No se pudo crear el índice FTS5: {e}")
+        return
+
+    if not await fts_ready(db):
+        logger.warning("Índice FTS de videos sin construir: correr python CLI/indexar_fts.py")
+
+
+async def fts_ready(db: aiosqlite.Connection) -> bool:
+    """True si el índice FTS está completo (se recuerda; el negativo se revisa cada minuto)."""
+    global _ready, _ready_checked_at
+    if _ready or time.monotonic() - _ready_checked_at < _READY_RECHECK_SECONDS:
+        return _ready
+    _ready_checked_at = time.monotonic()
+    try:
+        async with db.execute("SELECT 1 FROM fts_state WHERE name = ?", (FTS_TABLE,)) as cursor:
+            _ready = await cursor.fetchone() is not None
+    except (aiosqlite.OperationalError, sqlite3.OperationalError):
+        _ready = False
+    return _ready
+
+
+async def fts_filter(db: aiosqlite.Connection, q: str, rowid_col: str = "rowid") -> tuple[str, tuple] | None:
+    """
+    Fragmento WHERE que filtra videos por q usando el índice FTS, con sus parámetros.
+    None si el índice no está listo o q no tiene palabras (el llamador usa LIKE).
+    """
+    match = fts_match_query(q)
+    if match is None or not await fts_ready(db):
+        return None
+    return f"{rowid_col} IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)", (match,)
+
+
+def rebuild_videos_fts(conn: sqlite3.Connection) -> None:
+    """Crea el índice si falta y lo reconstruye completo desde videos_telegram (backfill)."""
+    for sql in FTS_SCHEMA_SQL:
+        conn.execute(sql)
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    conn.execute(MARK_BUILT_SQL, (FTS_TABLE,))
+    conn.commit()
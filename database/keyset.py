@@ -0,0 +1,150 @@
+"""
+Paginación por cursor (keyset / seek) de listados de videos_telegram.
+En lugar de LIMIT/OFFSET, cada página pide las filas que siguen a la última
+vista: el cursor (opaco, base64 de JSON) lleva la clave de orden y el rowid de
+esa fila. El rowid es el desempate porque es único y SQLite lo guarda al final
+de cada entrada de índice, así (oculto, COALESCE(col)) alcanza para recorrer
+en orden sin ordenar en memoria (índices idx_videos_seek_*).
+La condición se escribe como `expr <= k AND (expr < k OR rowid < r)`: la
+primera parte es la que SQLite usa como rango del índice.
+Los totales de cada filtro se cachean PAGE_COUNT_CACHE_TTL segundos.
+"""
+import json
+import time
+import base64
+import binascii
+from collections import OrderedDict
+
+import aiosqlite
+
+from config import PAGE_COUNT_CACHE_TTL
+
+# Clave de orden por opción de la UI (misma expresión que los índices idx_videos_seek_*)
+SEEK_SORTS = {
+    "fecha": "COALESCE(vt.fecha_mensaje, '')",
+    "nombre": "COALESCE(vt.nombre, '')",
+    "duracion": "COALESCE(vt.duracion, 0)",
+}
+
+SEEK_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_videos_seek_fecha ON videos_telegram(oculto, COALESCE(fecha_mensaje, ''))",
+    "CREATE INDEX IF NOT EXISTS idx_videos_seek_nombre ON videos_telegram(oculto, COALESCE(nombre, ''))",
+    "CREATE INDEX IF NOT EXISTS idx_videos_seek_duracion ON videos_telegram(oculto, COALESCE(duracion, 0))",
+    # Listado de un canal (routes/channels.py): mismo orden, filtrando por chat_id
+    "CREATE INDEX IF NOT EXISTS idx_videos_chat_fecha ON videos_telegram(chat_id, COALESCE(fecha_mensaje, ''))",
+    "CREATE INDEX IF NOT EXISTS idx_videos_chat_nombre ON videos_telegram(chat_id, COALESCE(nombre, ''))",
+    "CREATE INDEX IF NOT EXISTS idx_videos_chat_duracion ON videos_telegram(chat_id, COALESCE(duracion, 0))",
+]
+
+_COUNT_CACHE_MAX = 256
+_count_cache: OrderedDict[tuple, tuple[float, int]] = OrderedDict()
+_stats = {"count_hits": 0, "count_misses": 0}
+
+
+def encode_cursor(sort: str, key, rowid: int, before: bool = False) -> str:
+    """Cursor opaco: página siguiente a (key, rowid), o anterior si before."""
+    raw = json.dumps({"s": sort, "k": key, "r": rowid, "b": int(before)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None, sort: str) -> dict | None:
+    """Datos del cursor, o None si falta, está dañado o es de otro orden."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("s") != sort or not isinstance(data.get("r"), int):
+        return None
+    return data
+
+
+def seek_page(sort: str, direction: str, cursor: dict | None) -> tuple[str, tuple, str, bool]:
+    """
+    (condición WHERE, parámetros, ORDER BY, invertir) para la página del cursor.
+    Con un cursor "anterior" se recorre en sentido contrario y las filas
+    leídas se invierten (invertir=True) para mostrarlas en el orden pedido.
+    """
+    expr = SEEK_SORTS.get(sort, SEEK_SORTS["fecha"])
+    desc = direction != "asc"
+    before = bool(cursor and cursor.get("b"))
+    forward_desc = desc != before
+    order = "DESC" if forward_desc else "ASC"
+    order_sql = f"{expr} {order}, vt.rowid {order}"
+    if cursor is None:
+        return "", (), order_sql, before
+
+    op, op_eq = ("<", "<=") if forward_desc else (">", ">=")
+    key, rowid = cursor.get("k"), cursor["r"]
+    where = f"{expr} {op_eq} ? AND ({expr} {op} ? OR vt.rowid {op} ?)"
+    return where, (key, key, rowid), order_sql, before
+
+
+def clamp_page(page: int, total_items: int, per_page: int) -> int:
+    """Página pedida sin cursor, limitada a 1..última según el total (OFFSET dentro de la tabla)."""
+    return min(max(1, page), max(1, -(-total_items // per_page)))
+
+
+def keyset_page_info(
+    page: int,
+    per_page: int,
+    total_items: int,
+    rows: list,
+    has_more: bool,
+    reverse_rows: bool,
+    seeking: bool,
+    cursor_sort: str,
+) -> dict:
+    """
+    Paginación de una página ya leída (rows en el orden mostrado, con seek_key
+    y seek_rowid; has_more = se leyó la fila de más en el sentido del recorrido).
+    Devuelve page, total_pages, has_prev, has_next, prev_cursor y next_cursor.
+    """
+    if reverse_rows and not has_more:
+        page = 1  # Se retrocedió hasta el principio
+    has_next = has_more if not reverse_rows else bool(rows)
+    total_pages = max(1, -(-total_items // per_page))
+    if seeking:
+        # El total puede venir de la caché: con cursor nunca menos páginas que las recorridas
+        total_pages = max(total_pages, page + (1 if has_next else 0))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_next:
+            next_cursor = encode_cursor(cursor_sort, rows[-1]["seek_key"], rows[-1]["seek_rowid"])
+        if page > 1:
+            prev_cursor = encode_cursor(cursor_sort, rows[0]["seek_key"], rows[0]["seek_rowid"], before=True)
+    return {
+        "page": page,
+        "total_pages": total_pages,
+        "has_prev": page > 1,
+        "has_next": has_next,
+        "prev_cursor": prev_cursor,
+        "next_cursor": next_cursor,
+    }
+
+
+async def cached_count(db: aiosqlite.Connection, sql: str, params: tuple) -> int:
+    """COUNT(*) de un filtro, recordado PAGE_COUNT_CACHE_TTL segundos (total aproximado)."""
+    cache_key = (sql, tuple(params))
+    item = _count_cache.get(cache_key)
+    now = time.monotonic()
+    if item is not None and now - item[0] < PAGE_COUNT_CACHE_TTL:
+        _count_cache.move_to_end(cache_key)
+        _stats["count_hits"] += 1
+        return item[1]
+
+    _stats["count_misses"] += 1
+    async with db.execute(sql, params) as cursor:
+        row = await cursor.fetchone()
+    total = int((row[0] if row else 0) or 0)
+    _count_cache[cache_key] = (now, total)
+    while len(_count_cache) > _COUNT_CACHE_MAX:
+        _count_cache.popitem(last=False)
+    return total
+
+
+def get_keyset_stats() -> dict:
+    return {**_stats, "cached_counts": len(_count_cache)}
@@ -0,0 +1,128 @@
+"""
+Cantidad de mensajes por video (video_messages) materializada en
+video_message_counts y mantenida por triggers en cada insert/delete/cambio
+de video_id. Los listados leen el número ya calculado en lugar de hacer
+COUNT(*) sobre video_messages.
+La clave es (video_id, chat_id): el total de un video es la suma de sus
+pocos chats y los duplicados por chat salen de la misma tabla.
+La tabla se llena al crearse; CLI/recalcular_messages_count.py la verifica
+y la reconstruye si alguna vez se desincroniza.
+"""
+import sqlite3
+
+import aiosqlite
+
+COUNTS_TABLE = "video_message_counts"
+
+_MAX_SQL_PARAMS = 900
+
+MESSAGE_COUNTS_SCHEMA_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {COUNTS_TABLE} (
+        video_id TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        messages_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (video_id, chat_id)
+    ) WITHOUT ROWID
+    """,
+    # Duplicados por chat (contar_duplicados_y_actualizar): solo las claves con más de un mensaje
+    f"CREATE INDEX IF NOT EXISTS idx_{COUNTS_TABLE}_dupes ON {COUNTS_TABLE}(chat_id) WHERE messages_count > 1",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS video_messages_count_ai AFTER INSERT ON video_messages BEGIN
+        INSERT INTO {COUNTS_TABLE}(video_id, chat_id, messages_count) VALUES (new.video_id, new.chat_id, 1)
+        ON CONFLICT(video_id, chat_id) DO UPDATE SET messages_count = messages_count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS video_messages_count_ad AFTER DELETE ON video_messages BEGIN
+        UPDATE {COUNTS_TABLE} SET messages_count = messages_count - 1
+        WHERE video_id = old.video_id AND chat_id = old.chat_id;
+        DELETE FROM {COUNTS_TABLE}
+        WHERE video_id = old.video_id AND chat_id = old.chat_id AND messages_count <= 0;
+    END
+    """,
+    # El upsert de mensajes puede reasignar video_id: se mueve el conteo solo si cambia
+    f"""
+    CREATE TRIGGER IF NOT EXISTS video_messages_count_au AFTER UPDATE OF video_id, chat_id ON video_messages
+    WHEN old.video_id IS NOT new.video_id OR old.chat_id IS NOT new.chat_id BEGIN
+        UPDATE {COUNTS_TABLE} SET messages_count = messages_count - 1
+        WHERE video_id = old.video_id AND chat_id = old.chat_id;
+        DELETE FROM {COUNTS_TABLE}
+        WHERE video_id = old.video_id AND chat_id = old.chat_id AND messages_count <= 0;
+        INSERT INTO {COUNTS_TABLE}(video_id, chat_id, messages_count) VALUES (new.video_id, new.chat_id, 1)
+        ON CONFLICT(video_id, chat_id) DO UPDATE SET messages_count = messages_count + 1;
+    END
+    """,
+]
+
+REBUILD_SQL = [
+    f"DELETE FROM {COUNTS_TABLE}",
+    f"""
+    INSERT INTO {COUNTS_TABLE}(video_id, chat_id, messages_count)
+    SELECT video_id, chat_id, COUNT(*) FROM video_messages GROUP BY video_id, chat_id
+    """,
+]
+
+# Diferencias entre la tabla materializada y un COUNT(*) real (verificación)
+DIFF_SQL = f"""
+    WITH real AS (
+        SELECT video_id, chat_id, COUNT(*) AS n FROM video_messages GROUP BY video_id, chat_id
+    )
+    SELECT COUNT(*) FROM (
+        SELECT r.video_id FROM real r
+        LEFT JOIN {COUNTS_TABLE} m ON m.video_id = r.video_id AND m.chat_id = r.chat_id
+        WHERE m.messages_count IS NOT r.n
+        UNION ALL
+        SELECT m.video_id FROM {COUNTS_TABLE} m
+        LEFT JOIN real r ON r.video_id = m.video_id AND r.chat_id = m.chat_id
+        WHERE r.n IS NULL
+    )
+"""
+
+_ensured = False
+
+
+async def ensure_message_counts(db: aiosqlite.Connection) -> None:
+    """Crea la tabla y los triggers si faltan (video_messages ya debe existir); al crearla la llena."""
+    global _ensured
+    if _ensured:
+        return
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (COUNTS_TABLE,)) as cursor:
+        existia = await cursor.fetchone() is not None
+    for sql in MESSAGE_COUNTS_SCHEMA_SQL:
+        await db.execute(sql)
+    if not existia:
+        for sql in REBUILD_SQL:
+            await db.execute(sql)
+    await db.commit()
+    _ensured = True
+
+
+async def messages_counts_for(db: aiosqlite.Connection, video_ids) -> dict[str, int]:
+    """{video_id: mensajes} de los videos pedidos (los que no tienen mensajes no aparecen)."""
+    ids = list({v for v in video_ids if v})
+    counts: dict[str, int] = {}
+    for i in range(0, len(ids), _MAX_SQL_PARAMS):
+        part = ids[i:i + _MAX_SQL_PARAMS]
+        placeholders = ",".join("?" * len(part))
+        async with db.execute(
+            f"SELECT video_id, SUM(messages_count) FROM {COUNTS_TABLE} WHERE video_id IN ({placeholders}) GROUP BY video_id",
+            part,
+        ) as cursor:
+            for video_id, n in await cursor.fetchall():
+                counts[video_id] = int(n or 0)
+    return counts
+
+
+def count_mismatches(conn: sqlite3.Connection) -> int:
+    """Claves (video_id, chat_id) cuyo conteo materializado no coincide con video_messages."""
+    return int(conn.execute(DIFF_SQL).fetchone()[0])
+
+
+def rebuild_message_counts(conn: sqlite3.Connection) -> None:
+    """Crea la tabla/triggers si faltan y recalcula todos los conteos desde video_messages."""
+    for sql in MESSAGE_COUNTS_SCHEMA_SQL:
+        conn.execute(sql)
+    for sql in REBUILD_SQL:
+        conn.execute(sql)
+    conn.commit()
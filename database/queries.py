@@ -3,11 +3,12 @@ Consultas de lectura (Read Operations) para la interfaz web.
 Separa la lógica SQL de las rutas.
 """
 import aiosqlite
-from config import DB_PATH
+from database.connection import get_read_db
+from database.fts import fts_filter
 
 async def db_get_chat_info(chat_id: int):
     """Obtiene información básica de un chat."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT id, title, username, type FROM chats WHERE id = ?", 
@@ -28,7 +29,7 @@ async def db_get_channel_videos(
     Obtiene videos de un canal con filtros, búsqueda y paginación.
     Retorna: (lista_videos, total_count)
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         db.row_factory = aiosqlite.Row
         
         # Construcción dinámica de la query
@@ -45,9 +46,14 @@ async def db_get_channel_videos(
 
         # 2. Búsqueda
         if search_query:
-            where_clauses.append("(file_name LIKE ? OR caption LIKE ?)")
-            q_str = f"%{search_query}%"
-            params.extend([q_str, q_str])
+            fts = await fts_filter(db, search_query)
+            if fts:
+                where_clauses.append(fts[0])
+                params.extend(fts[1])
+            else:
+                where_clauses.append("(file_name LIKE ? OR caption LIKE ?)")
+                q_str = f"%{search_query}%"
+                params.extend([q_str, q_str])
 
         where_sql = " AND ".join(where_clauses)
 
@@ -3,7 +3,7 @@ Operaciones de base de datos para la tabla de tags.
 """
 from typing import List, Dict
 
-from .connection import get_db
+from .connection import get_db, get_read_db
 
 
 async def db_ensure_tags_table():
@@ -38,7 +38,7 @@ async def db_upsert_tag(key: str, name_en: str, name_es: str) -> None:
 
 async def db_list_tags() -> List[Dict[str, str]]:
     await db_ensure_tags_table()
-    async with get_db() as db:
+    async with get_read_db() as db:
         async with db.execute(
             "SELECT key, name_en, name_es FROM tags ORDER BY key"
         ) as cur:
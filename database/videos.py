@@ -5,7 +5,8 @@ Versión Asíncrona TOTAL (Non-blocking).
 import json
 import aiosqlite
 from config import DB_PATH
-from database.connection import get_db
+from database.connection import get_db, get_read_db
+from database.message_counts import ensure_message_counts
 
 # Nota: Ya no importamos get_connection síncrono para estas funciones
 
@@ -39,8 +40,11 @@ async def _ensure_video_messages_table(db: aiosqlite.Connection) -> None:
             UNIQUE (chat_id, message_id)
         )
     """)
+    # Conteo de mensajes por video en los listados (WHERE video_id IN ...)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_video_messages_video_id ON video_messages(video_id)")
 
     if _VIDEO_MESSAGES_RAW_JSON_DROPPED and _VIDEO_MESSAGES_CAPTION_ENTITIES_DROPPED:
+        await ensure_message_counts(db)
         return
 
     async with db.execute("PRAGMA table_info(video_messages)") as cursor:
@@ -55,6 +59,7 @@ async def _ensure_video_messages_table(db: aiosqlite.Connection) -> None:
     if not needs_migration:
         _VIDEO_MESSAGES_RAW_JSON_DROPPED = True
         _VIDEO_MESSAGES_CAPTION_ENTITIES_DROPPED = True
+        await ensure_message_counts(db)
         return
 
     migrate_sql = """
@@ -102,48 +107,134 @@ async def _ensure_video_messages_table(db: aiosqlite.Connection) -> None:
     await db.executescript(migrate_sql)
     _VIDEO_MESSAGES_RAW_JSON_DROPPED = True
     _VIDEO_MESSAGES_CAPTION_ENTITIES_DROPPED = True
+    # Los triggers de conteo se crean después de la migración (DROP TABLE los elimina)
+    await ensure_message_counts(db)
+
+
+UPSERT_VIDEO_SQL = """
+    INSERT INTO videos_telegram (
+        id, chat_id, message_id, file_id, file_unique_id, nombre, caption,
+        tamano_bytes, fecha_mensaje, duracion, ancho, alto, es_vertical,
+        mime_type, views, outgoing
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        file_id = excluded.file_id,
+        nombre = excluded.nombre,
+        caption = excluded.caption,
+        tamano_bytes = excluded.tamano_bytes,
+        fecha_mensaje = excluded.fecha_mensaje,
+        duracion = excluded.duracion,
+        ancho = excluded.ancho,
+        alto = excluded.alto,
+        es_vertical = excluded.es_vertical,
+        mime_type = excluded.mime_type,
+        views = excluded.views,
+        outgoing = excluded.outgoing
+"""
+
+UPSERT_VIDEO_MESSAGE_SQL = """
+    INSERT INTO video_messages (
+        video_id, chat_id, message_id, date, from_user_id, from_username, from_is_bot,
+        media_type, views, forwards, outgoing, reply_to_message_id,
+        forward_from_chat_id, forward_from_chat_title, forward_from_message_id,
+        forward_date, caption
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(chat_id, message_id) DO UPDATE SET
+        video_id = excluded.video_id,
+        date = excluded.date,
+        from_user_id = excluded.from_user_id,
+        from_username = excluded.from_username,
+        from_is_bot = excluded.from_is_bot,
+        media_type = excluded.media_type,
+        views = excluded.views,
+        forwards = excluded.forwards,
+        outgoing = excluded.outgoing,
+        reply_to_message_id = excluded.reply_to_message_id,
+        forward_from_chat_id = excluded.forward_from_chat_id,
+        forward_from_chat_title = excluded.forward_from_chat_title,
+        forward_from_message_id = excluded.forward_from_message_id,
+        forward_date = excluded.forward_date,
+        caption = excluded.caption
+"""
+
+ADD_VIDEO_FILE_ID_SQL = """
+    INSERT INTO video_file_ids (video_id, file_id, file_unique_id, origen)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(video_id, file_id) DO UPDATE SET
+        fecha_detectado = CURRENT_TIMESTAMP
+"""
+
+
+def video_params(video_data: dict) -> tuple:
+    """Convierte el dict de un video en la tupla de parámetros de UPSERT_VIDEO_SQL."""
+    return (
+        video_data.get("file_unique_id"),
+        video_data.get("chat_id"),
+        video_data.get("message_id"),
+        video_data.get("file_id"),
+        video_data.get("file_unique_id"),
+        video_data.get("nombre"),
+        video_data.get("caption"),
+        video_data.get("tamano_bytes"),
+        video_data.get("fecha_mensaje"),
+        video_data.get("duracion", 0),
+        video_data.get("ancho", 0),
+        video_data.get("alto", 0),
+        1 if video_data.get("alto", 0) > video_data.get("ancho", 0) else 0,
+        video_data.get("mime_type"),
+        video_data.get("views", 0),
+        1 if video_data.get("outgoing") else 0,
+    )
+
+
+def video_message_params(message_data: dict) -> tuple:
+    """Convierte el dict de un mensaje en la tupla de parámetros de UPSERT_VIDEO_MESSAGE_SQL."""
+    from_user = message_data.get("from_user") or {}
+    if not isinstance(from_user, dict):
+        from_user = {
+            "id": getattr(from_user, "id", None),
+            "username": getattr(from_user, "username", None),
+            "is_bot": getattr(from_user, "is_bot", False),
+        }
+
+    forward_from_chat = message_data.get("forward_from_chat") or {}
+    if not isinstance(forward_from_chat, dict):
+        forward_from_chat = {
+            "id": getattr(forward_from_chat, "id", None),
+            "title": getattr(forward_from_chat, "title", None),
+        }
+
+    return (
+        message_data.get("video_id"),
+        message_data.get("chat_id"),
+        message_data.get("message_id"),
+        message_data.get("date"),
+        from_user.get("id"),
+        from_user.get("username"),
+        1 if from_user.get("is_bot") else 0 if from_user else None,
+        message_data.get("media"),
+        message_data.get("views"),
+        message_data.get("forwards"),
+        1 if message_data.get("outgoing") else 0,
+        message_data.get("reply_to_message_id"),
+        forward_from_chat.get("id"),
+        forward_from_chat.get("title"),
+        message_data.get("forward_from_message_id"),
+        message_data.get("forward_date"),
+        message_data.get("caption"),
+    )
+
+
+async def ensure_video_messages_table(db: aiosqlite.Connection) -> None:
+    """Crea/migra video_messages solo la primera vez en el proceso."""
+    if not (_VIDEO_MESSAGES_RAW_JSON_DROPPED and _VIDEO_MESSAGES_CAPTION_ENTITIES_DROPPED):
+        await _ensure_video_messages_table(db)
 
 
 async def db_upsert_video(video_data: dict) -> None:
     """Inserta o actualiza un video en la tabla videos_telegram (Asíncrono)."""
     async with get_db() as db:
-        await db.execute("""
-            INSERT INTO videos_telegram (
-                id, chat_id, message_id, file_id, file_unique_id, nombre, caption,
-                tamano_bytes, fecha_mensaje, duracion, ancho, alto, es_vertical,
-                mime_type, views, outgoing
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET
-                file_id = excluded.file_id,
-                nombre = excluded.nombre,
-                caption = excluded.caption,
-                tamano_bytes = excluded.tamano_bytes,
-                fecha_mensaje = excluded.fecha_mensaje,
-                duracion = excluded.duracion,
-                ancho = excluded.ancho,
-                alto = excluded.alto,
-                es_vertical = excluded.es_vertical,
-                mime_type = excluded.mime_type,
-                views = excluded.views,
-                outgoing = excluded.outgoing
-        """, (
-            video_data.get("file_unique_id"),
-            video_data.get("chat_id"),
-            video_data.get("message_id"),
-            video_data.get("file_id"),
-            video_data.get("file_unique_id"),
-            video_data.get("nombre"),
-            video_data.get("caption"),
-            video_data.get("tamano_bytes"),
-            video_data.get("fecha_mensaje"),
-            video_data.get("duracion", 0),
-            video_data.get("ancho", 0),
-            video_data.get("alto", 0),
-            1 if video_data.get("alto", 0) > video_data.get("ancho", 0) else 0,
-            video_data.get("mime_type"),
-            video_data.get("views", 0),
-            1 if video_data.get("outgoing") else 0,
-        ))
+        await db.execute(UPSERT_VIDEO_SQL, video_params(video_data))
         await db.commit()
 
 
@@ -152,73 +243,17 @@ async def db_upsert_video_message(message_data: dict) -> None:
     async with get_db() as db:
         # Aseguramos la tabla aquí también por si acaso (o mover a init_db)
         await _ensure_video_messages_table(db)
-
-        from_user = message_data.get("from_user") or {}
-        if not isinstance(from_user, dict):
-            from_user = {
-                "id": getattr(from_user, "id", None),
-                "username": getattr(from_user, "username", None),
-                "is_bot": getattr(from_user, "is_bot", False),
-            }
-
-        forward_from_chat = message_data.get("forward_from_chat") or {}
-        if not isinstance(forward_from_chat, dict):
-            forward_from_chat = {
-                "id": getattr(forward_from_chat, "id", None),
-                "title": getattr(forward_from_chat, "title", None),
-            }
-
-        await db.execute("""
-            INSERT INTO video_messages (
-                video_id, chat_id, message_id, date, from_user_id, from_username, from_is_bot,
-                media_type, views, forwards, outgoing, reply_to_message_id,
-                forward_from_chat_id, forward_from_chat_title, forward_from_message_id,
-                forward_date, caption
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(chat_id, message_id) DO UPDATE SET
-                video_id = excluded.video_id,
-                date = excluded.date,
-                from_user_id = excluded.from_user_id,
-                from_username = excluded.from_username,
-                from_is_bot = excluded.from_is_bot,
-                media_type = excluded.media_type,
-                views = excluded.views,
-                forwards = excluded.forwards,
-                outgoing = excluded.outgoing,
-                reply_to_message_id = excluded.reply_to_message_id,
-                forward_from_chat_id = excluded.forward_from_chat_id,
-                forward_from_chat_title = excluded.forward_from_chat_title,
-                forward_from_message_id = excluded.forward_from_message_id,
-                forward_date = excluded.forward_date,
-                caption = excluded.caption
-        """, (
-            message_data.get("video_id"),
-            message_data.get("chat_id"),
-            message_data.get("message_id"),
-            message_data.get("date"),
-            from_user.get("id"),
-            from_user.get("username"),
-            1 if from_user.get("is_bot") else 0 if from_user else None,
-            message_data.get("media"),
-            message_data.get("views"),
-            message_data.get("forwards"),
-            1 if message_data.get("outgoing") else 0,
-            message_data.get("reply_to_message_id"),
-            forward_from_chat.get("id"),
-            forward_from_chat.get("title"),
-            message_data.get("forward_from_message_id"),
-            message_data.get("forward_date"),
-            message_data.get("caption"),
-        ))
+        await db.execute(UPSERT_VIDEO_MESSAGE_SQL, video_message_params(message_data))
         await db.commit()
 
 
 async def db_get_video_messages(video_id: str) -> list[dict]:
     """Obtiene mensajes asociados a un video de forma ASÍNCRONA (Sin cambios mayores)."""
-    async with get_db() as db:
-        # Nota: La creación de tabla aquí es redundante si ya se hace arriba o en init_db,
-        # pero no hace daño dejarla por seguridad.
-        await _ensure_video_messages_table(db)
+    if not _VIDEO_MESSAGES_RAW_JSON_DROPPED:
+        # Primera llamada del proceso: la tabla (o su migración) requiere la escritora
+        async with get_db() as db:
+            await _ensure_video_messages_table(db)
+    async with get_read_db() as db:
         async with db.execute("""
             SELECT
                 chat_id, message_id, date, from_user_id, from_username, from_is_bot,
@@ -254,154 +289,101 @@ async def db_get_video_messages(video_id: str) -> list[dict]:
     return results
 
 
-async def db_bulk_upsert_videos(videos_data: list[dict]) -> None:
-    """Inserta o actualiza múltiples videos en una sola transacción."""
+# Límite conservador de parámetros por sentencia (SQLITE_MAX_VARIABLE_NUMBER antiguo = 999)
+_MAX_SQL_PARAMS = 900
+
+
+async def _count_existing(db: aiosqlite.Connection, table: str, columns: tuple[str, ...], keys: set) -> int:
+    """Cuenta cuántas claves (simples o compuestas) ya existen en la tabla, por bloques."""
+    if not keys:
+        return 0
+    keys = list(keys)
+    width = len(columns)
+    chunk = max(1, _MAX_SQL_PARAMS // width)
+    found = 0
+    for i in range(0, len(keys), chunk):
+        part = keys[i:i + chunk]
+        # JOIN contra VALUES: cada clave se resuelve con el índice único (no un scan por bloque)
+        row = "(" + ",".join("?" * width) + ")"
+        join_on = " AND ".join(f"t.{col} = k.column{n + 1}" for n, col in enumerate(columns))
+        sql = f"SELECT COUNT(*) FROM (VALUES {','.join([row] * len(part))}) AS k JOIN {table} t ON {join_on}"
+        params = [value for key in part for value in key] if width > 1 else part
+        async with db.execute(sql, params) as cursor:
+            found += (await cursor.fetchone())[0]
+    return found
+
+
+def _has_null(key) -> bool:
+    return key is None or (isinstance(key, tuple) and None in key)
+
+
+async def _bulk_upsert(db: aiosqlite.Connection, sql: str, rows: list[tuple], table: str, columns: tuple[str, ...], keys: list) -> dict:
+    """
+    executemany de un upsert ya parametrizado; devuelve cuántas claves eran nuevas y cuántas se actualizaron.
+    keys: la clave de cada fila. Una clave repetida en el lote cuenta una sola vez; una clave
+    con NULL nunca choca con el índice único, así que esa fila siempre es nueva.
+    """
+    null_rows = sum(1 for key in keys if _has_null(key))
+    unique_keys = {key for key in keys if not _has_null(key)}
+    existing = await _count_existing(db, table, columns, unique_keys)
+    await db.executemany(sql, rows)
+    await db.commit()
+    return {"inserted": len(unique_keys) - existing + null_rows, "updated": existing}
+
+
+async def db_bulk_upsert_videos(videos_data: list[dict]) -> dict:
+    """Inserta o actualiza múltiples videos en una sola transacción (executemany).
+    Retorna {"inserted": n, "updated": n}.
+    """
     if not videos_data:
-        return
-    
+        return {"inserted": 0, "updated": 0}
+
+    rows = [video_params(video_data) for video_data in videos_data]
+    keys = [row[0] for row in rows]
     async with get_db() as db:
-        await db.execute("BEGIN TRANSACTION")
-        for video_data in videos_data:
-            await db.execute("""
-                INSERT INTO videos_telegram (
-                    id, chat_id, message_id, file_id, file_unique_id, nombre, caption,
-                    tamano_bytes, fecha_mensaje, duracion, ancho, alto, es_vertical,
-                    mime_type, views, outgoing
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(id) DO UPDATE SET
-                    file_id = excluded.file_id,
-                    nombre = excluded.nombre,
-                    caption = excluded.caption,
-                    tamano_bytes = excluded.tamano_bytes,
-                    fecha_mensaje = excluded.fecha_mensaje,
-                    duracion = excluded.duracion,
-                    ancho = excluded.ancho,
-                    alto = excluded.alto,
-                    es_vertical = excluded.es_vertical,
-                    mime_type = excluded.mime_type,
-                    views = excluded.views,
-                    outgoing = excluded.outgoing
-            """, (
-                video_data.get("file_unique_id"),
-                video_data.get("chat_id"),
-                video_data.get("message_id"),
-                video_data.get("file_id"),
-                video_data.get("file_unique_id"),
-                video_data.get("nombre"),
-                video_data.get("caption"),
-                video_data.get("tamano_bytes"),
-                video_data.get("fecha_mensaje"),
-                video_data.get("duracion", 0),
-                video_data.get("ancho", 0),
-                video_data.get("alto", 0),
-                1 if video_data.get("alto", 0) > video_data.get("ancho", 0) else 0,
-                video_data.get("mime_type"),
-                video_data.get("views", 0),
-                1 if video_data.get("outgoing") else 0,
-            ))
-        await db.execute("COMMIT")
-
-
-async def db_bulk_upsert_video_messages(messages_data: list[dict]) -> None:
-    """Inserta o actualiza múltiples mensajes en una sola transacción."""
+        return await _bulk_upsert(db, UPSERT_VIDEO_SQL, rows, "videos_telegram", ("id",), keys)
+
+
+async def db_bulk_upsert_video_messages(messages_data: list[dict]) -> dict:
+    """Inserta o actualiza múltiples mensajes en una sola transacción (executemany).
+    Retorna {"inserted": n, "updated": n}.
+    """
     if not messages_data:
-        return
-    
+        return {"inserted": 0, "updated": 0}
+
+    rows = [video_message_params(message_data) for message_data in messages_data]
+    keys = [(row[1], row[2]) for row in rows]
     async with get_db() as db:
-        await _ensure_video_messages_table(db)
-        
-        for message_data in messages_data:
-            from_user = message_data.get("from_user") or {}
-            if not isinstance(from_user, dict):
-                from_user = {
-                    "id": getattr(from_user, "id", None),
-                    "username": getattr(from_user, "username", None),
-                    "is_bot": getattr(from_user, "is_bot", False),
-                }
-
-            forward_from_chat = message_data.get("forward_from_chat") or {}
-            if not isinstance(forward_from_chat, dict):
-                forward_from_chat = {
-                    "id": getattr(forward_from_chat, "id", None),
-                    "title": getattr(forward_from_chat, "title", None),
-                }
-
-            await db.execute("""
-                INSERT INTO video_messages (
-                    video_id, chat_id, message_id, date, from_user_id, from_username, from_is_bot,
-                    media_type, views, forwards, outgoing, reply_to_message_id,
-                    forward_from_chat_id, forward_from_chat_title, forward_from_message_id,
-                    forward_date, caption
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(chat_id, message_id) DO UPDATE SET
-                    video_id = excluded.video_id,
-                    date = excluded.date,
-                    from_user_id = excluded.from_user_id,
-                    from_username = excluded.from_username,
-                    from_is_bot = excluded.from_is_bot,
-                    media_type = excluded.media_type,
-                    views = excluded.views,
-                    forwards = excluded.forwards,
-                    outgoing = excluded.outgoing,
-                    reply_to_message_id = excluded.reply_to_message_id,
-                    forward_from_chat_id = excluded.forward_from_chat_id,
-                    forward_from_chat_title = excluded.forward_from_chat_title,
-                    forward_from_message_id = excluded.forward_from_message_id,
-                    forward_date = excluded.forward_date,
-                    caption = excluded.caption
-            """, (
-                message_data.get("video_id"),
-                message_data.get("chat_id"),
-                message_data.get("message_id"),
-                message_data.get("date"),
-                from_user.get("id"),
-                from_user.get("username"),
-                1 if from_user.get("is_bot") else 0 if from_user else None,
-                message_data.get("media"),
-                message_data.get("views"),
-                message_data.get("forwards"),
-                1 if message_data.get("outgoing") else 0,
-                message_data.get("reply_to_message_id"),
-                forward_from_chat.get("id"),
-                forward_from_chat.get("title"),
-                message_data.get("forward_from_message_id"),
-                message_data.get("forward_date"),
-                message_data.get("caption"),
-            ))
-        await db.commit()
+        await ensure_video_messages_table(db)
+        return await _bulk_upsert(
+            db, UPSERT_VIDEO_MESSAGE_SQL, rows, "video_messages", ("chat_id", "message_id"), keys
+        )
 
 
-async def db_bulk_add_video_file_ids(file_ids_data: list[tuple]) -> None:
-    """Registra múltiples file_ids en una sola transacción.
+async def db_bulk_add_video_file_ids(file_ids_data: list[tuple]) -> dict:
+    """Registra múltiples file_ids en una sola transacción (executemany).
     file_ids_data: lista de tuplas (video_id, file_id, file_unique_id, origen)
+    Retorna {"inserted": n, "updated": n}.
     """
     if not file_ids_data:
-        return
-    
+        return {"inserted": 0, "updated": 0}
+
+    rows = [tuple(row) for row in file_ids_data]
+    keys = [(row[0], row[1]) for row in rows]
     async with get_db() as db:
-        for video_id, file_id, file_unique_id, origen in file_ids_data:
-            await db.execute("""
-                INSERT INTO video_file_ids (video_id, file_id, file_unique_id, origen)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(video_id, file_id) DO UPDATE SET
-                    fecha_detectado = CURRENT_TIMESTAMP
-            """, (video_id, file_id, file_unique_id, origen))
-        await db.commit()
+        return await _bulk_upsert(
+            db, ADD_VIDEO_FILE_ID_SQL, rows, "video_file_ids", ("video_id", "file_id"), keys
+        )
 
 
 async def db_add_video_file_id(video_id: str, file_id: str, file_unique_id: str, origen: str = "scan") -> None:
     """Registra un file_id detectado para un video (Asíncrono)."""
     async with get_db() as db:
-        await db.execute("""
-            INSERT INTO video_file_ids (video_id, file_id, file_unique_id, origen)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(video_id, file_id) DO UPDATE SET
-                fecha_detectado = CURRENT_TIMESTAMP
-        """, (video_id, file_id, file_unique_id, origen))
+        await db.execute(ADD_VIDEO_FILE_ID_SQL, (video_id, file_id, file_unique_id, origen))
         await db.commit()
 
 async def db_count_videos_by_chat(chat_id: int) -> int:
-    async with get_db() as db:
+    async with get_read_db() as db:
         async with db.execute(
             "SELECT COUNT(*) FROM videos_telegram WHERE chat_id = ?",
             (chat_id,),
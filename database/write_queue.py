@@ -0,0 +1,264 @@
+"""
+Cola de escritura única (write-behind) para videos_telegram / video_messages.
+Todos los productores (escaneo de canales, sincronizador, workers de thumbs)
+encolan sus upserts y un único consumidor los agrupa en transacciones con
+executemany, que se vacían por tamaño o por tiempo.
+Así se paga un solo commit (fsync) por lote en lugar de tres por video.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import WRITE_QUEUE_BATCH_SIZE, WRITE_QUEUE_FLUSH_INTERVAL, WRITE_QUEUE_MAX_PENDING
+from database.connection import get_db
+from database.videos import (
+    UPSERT_VIDEO_SQL,
+    UPSERT_VIDEO_MESSAGE_SQL,
+    ADD_VIDEO_FILE_ID_SQL,
+    video_params,
+    video_message_params,
+    ensure_video_messages_table,
+)
+
+logger = logging.getLogger(__name__)
+
+MARK_THUMB_READY_SQL = "UPDATE videos_telegram SET has_thumb = 1 WHERE id = ?"
+
+# Tipos de operación encolables
+_VIDEO = "video"
+_MESSAGE = "message"
+_FILE_ID = "file_id"
+_THUMB = "thumb"
+_FLUSH = "flush"
+
+
+class _Batch:
+    """Lote en construcción; las claves deduplican upserts repetidos del mismo registro."""
+    __slots__ = ("videos", "messages", "file_ids", "thumbs")
+
+    def __init__(self):
+        self.videos: Dict[Any, tuple] = {}
+        self.messages: Dict[Any, tuple] = {}
+        self.file_ids: Dict[Any, tuple] = {}
+        self.thumbs: Dict[Any, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self.videos) + len(self.messages) + len(self.file_ids) + len(self.thumbs)
+
+    def add(self, kind: str, params: tuple) -> None:
+        if kind == _VIDEO:
+            self.videos[params[0]] = params
+        elif kind == _MESSAGE:
+            self.messages[(params[1], params[2])] = params
+        elif kind == _FILE_ID:
+            self.file_ids[(params[0], params[1])] = params
+        elif kind == _THUMB:
+            self.thumbs[params[0]] = params
+
+    def statements(self) -> list[tuple[str, list[tuple]]]:
+        # Orden: primero el video, luego lo que cuelga de él
+        return [
+            (UPSERT_VIDEO_SQL, list(self.videos.values())),
+            (ADD_VIDEO_FILE_ID_SQL, list(self.file_ids.values())),
+            (UPSERT_VIDEO_MESSAGE_SQL, list(self.messages.values())),
+            (MARK_THUMB_READY_SQL, list(self.thumbs.values())),
+        ]
+
+
+class VideoWriteQueue:
+    """
+    Consumidor único de escrituras de videos.
+    - put() bloquea cuando hay max_pending operaciones sin escribir (backpressure).
+    - El lote se escribe al llegar a batch_size o tras flush_interval segundos.
+    - flush() espera a que todo lo encolado antes de la llamada esté en disco.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = WRITE_QUEUE_BATCH_SIZE,
+        flush_interval: float = WRITE_QUEUE_FLUSH_INTERVAL,
+        max_pending: int = WRITE_QUEUE_MAX_PENDING,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        self.loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight = 0  # Operaciones ya sacadas de la cola y aún sin escribir
+        self.stats: Dict[str, Any] = {
+            "enqueued": 0,
+            "written": 0,
+            "coalesced": 0,
+            "failed": 0,
+            "batches": 0,
+            "backpressure_waits": 0,
+            "last_batch_ms": 0.0,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, kind: str, params: tuple) -> None:
+        self._ensure_started()
+        if self._queue.full():
+            self.stats["backpressure_waits"] += 1
+        await self._queue.put((kind, params))
+        self.stats["enqueued"] += 1
+
+    def pending(self) -> int:
+        """Operaciones encoladas o en el lote en curso que todavía no están en disco."""
+        return self._queue.qsize() + self._in_flight
+
+    async def flush(self) -> None:
+        if self._task is None or self._task.done():
+            return
+        waiter = self.loop.create_future()
+        await self._queue.put((_FLUSH, waiter))
+        await waiter
+
+    async def stop(self) -> None:
+        """Vacía lo pendiente y detiene el consumidor (shutdown)."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            kind, payload = await self._queue.get()
+            batch = _Batch()
+            waiters: list[asyncio.Future] = []
+            received = 0
+            deadline = self.loop.time() + self.flush_interval
+
+            while True:
+                if kind == _FLUSH:
+                    waiters.append(payload)
+                else:
+                    batch.add(kind, payload)
+                    received += 1
+                    self._in_flight = received
+                if waiters or received >= self.batch_size:
+                    break
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    kind, payload = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if len(batch):
+                self.stats["coalesced"] += received - len(batch)
+                await self._write(batch)
+            self._in_flight = 0
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _write(self, batch: _Batch) -> None:
+        started = time.perf_counter()
+        statements = batch.statements()
+        try:
+            async with get_db() as db:
+                if batch.messages:
+                    await ensure_video_messages_table(db)
+                try:
+                    for sql, rows in statements:
+                        if rows:
+                            await db.executemany(sql, rows)
+                    await db.commit()
+                    self.stats["written"] += len(batch)
+                except Exception as e:
+                    # Un registro conflictivo no debe tirar el lote entero:
+                    # reintentamos fila a fila y descartamos solo las que fallan.
+                    await db.rollback()
+                    logger.warning(f"Lote de escritura falló ({e}); reintentando fila a fila")
+                    for sql, rows in statements:
+                        for row in rows:
+                            try:
+                                await db.execute(sql, row)
+                                self.stats["written"] += 1
+                            except Exception as row_error:
+                                self.stats["failed"] += 1
+                                logger.error(f"Fila descartada en cola de escritura: {row_error}")
+                    await db.commit()
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error(f"Error escribiendo lote de videos: {e}")
+        finally:
+            self.stats["batches"] += 1
+            self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": self.pending(), "max_pending": self._queue.maxsize}
+
+
+_write_queue: Optional[VideoWriteQueue] = None
+
+
+def get_write_queue() -> VideoWriteQueue:
+    """
+    Cola del event loop actual (se crea de forma perezosa, igual que el pool).
+    Si la del loop anterior quedó con escrituras sin confirmar (el loop terminó
+    sin db_stop_write_queue) se lanza RuntimeError en lugar de perderlas.
+    """
+    global _write_queue
+    loop = asyncio.get_running_loop()
+    if _write_queue is not None and _write_queue.loop is not loop:
+        pendientes = _write_queue.pending()
+        if pendientes:
+            raise RuntimeError(
+                f"La cola de escritura de otro event loop tiene {pendientes} escrituras sin confirmar; "
+                "llamar a db_stop_write_queue() antes de que termine su loop"
+            )
+        _write_queue = None
+    if _write_queue is None:
+        _write_queue = VideoWriteQueue()
+    return _write_queue
+
+
+async def db_enqueue_video(video_data: dict) -> None:
+    """Encola el upsert de un video (mismo dict que db_upsert_video)."""
+    await get_write_queue().put(_VIDEO, video_params(video_data))
+
+
+async def db_enqueue_video_message(message_data: dict) -> None:
+    """Encola el upsert de un mensaje (mismo dict que db_upsert_video_message)."""
+    await get_write_queue().put(_MESSAGE, video_message_params(message_data))
+
+
+async def db_enqueue_video_file_id(video_id: str, file_id: str, file_unique_id: str, origen: str = "scan") -> None:
+    """Encola el registro de un file_id (mismos argumentos que db_add_video_file_id)."""
+    await get_write_queue().put(_FILE_ID, (video_id, file_id, file_unique_id, origen))
+
+
+async def db_enqueue_thumb_ready(video_id: str) -> None:
+    """Encola la marca has_thumb = 1 de un video."""
+    await get_write_queue().put(_THUMB, (video_id,))
+
+
+async def db_flush_writes() -> None:
+    """Espera a que todas las escrituras encoladas hasta ahora estén confirmadas."""
+    if _write_queue is not None:
+        await _write_queue.flush()
+
+
+async def db_stop_write_queue() -> None:
+    """Vacía y detiene la cola (hook de shutdown del lifespan)."""
+    global _write_queue
+    if _write_queue is not None:
+        await _write_queue.stop()
+        _write_queue = None
+
+
+def get_write_queue_stats() -> Dict[str, Any]:
+    if _write_queue is None:
+        return {"pending": 0, "max_pending": WRITE_QUEUE_MAX_PENDING}
+    return _write_queue.get_stats()
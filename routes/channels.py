@@ -13,12 +13,15 @@ from fastapi.responses import JSONResponse
 from pyrogram import enums
 
 from config import TEMPLATES_DIR, JSON_FOLDER, MAIN_TEMPLATE, DB_PATH, SMART_CACHE_ENABLED
-from database.connection import get_db
-from services import get_client, prefetch_channel_videos_to_ram, background_thumb_downloader
+from database.connection import get_read_db
+from database.keyset import SEEK_SORTS, seek_page, decode_cursor, cached_count, clamp_page, keyset_page_info
+from database.message_counts import messages_counts_for
+from services import get_client, prefetch_channel_videos_to_ram, background_thumb_downloader, prioritize_page_thumbs
+from services.thumb_sprites import register_thumb_sprite
 from database import (
-    db_upsert_video, db_add_video_file_id, 
+    db_enqueue_video, db_enqueue_video_file_id, db_enqueue_video_message, db_flush_writes,
     db_get_chat, db_get_chat_folders, db_get_chat_scan_meta,
-    db_upsert_video_message, db_count_videos_by_chat, db_upsert_chat_video_count
+    db_count_videos_by_chat, db_upsert_chat_video_count
 )
 from utils import convertir_tamano, formatear_miles, ws_manager, log_timing
 
@@ -115,46 +118,18 @@ async def api_channel_videos(
     per_page: int = Query(100, ge=1, le=200),
     sort: str = Query("fecha"),
     direction: str = Query("desc"),
+    cursor: str = Query(""),
 ):
     """
     Devuelve videos ya indexados de un canal/chat (solo lectura, sin disparar indexación).
     """
     log_timing(f" Iniciando endpoint /api/channel/{chat_id}/videos..")
-    videos_locales = await get_local_videos(chat_id)
-
-    valid_sorts = {
-        "fecha": ("date", True),
-        "nombre": ("name", False),
-        "duracion": ("duration_seconds", False),
-    }
-    sort_field, _ = valid_sorts.get(sort, ("date", True))
-    direction = direction.lower()
-    reverse = direction != "asc"
-
-    if sort_field == "date":
-        videos_locales = sorted(videos_locales, key=lambda x: x.get("date") or "", reverse=reverse)
-    else:
-        videos_locales = sorted(videos_locales, key=lambda x: x.get(sort_field) or 0, reverse=reverse)
-
-    total_items = len(videos_locales)
     per_page = max(1, min(200, per_page))
-    total_pages = max(1, (total_items + per_page - 1) // per_page)
-    page = min(page, total_pages)
-    offset = (page - 1) * per_page
-    items_paged = videos_locales[offset : offset + per_page]
-
-    pagination = {
-        "page": page,
-        "per_page": per_page,
-        "total_items": total_items,
-        "total_pages": total_pages,
-        "has_prev": page > 1,
-        "has_next": page < total_pages,
-        "prev_page": max(1, page - 1),
-        "next_page": min(total_pages, page + 1),
-        "sort": sort,
-        "direction": direction,
-    }
+    direction = direction.lower()
+    items_paged, info = await get_local_videos_page(chat_id, page, per_page, sort, direction, cursor)
+    pagination = _channel_pagination(info, per_page, sort, direction)
+    # Los thumbs que faltan en esta página se adelantan en la cola del worker
+    prioritize_page_thumbs(items_paged)
     log_timing(f"Endpoint /api/channel/{chat_id}/videos terminado")
     return {"items": items_paged, "pagination": pagination}
 
@@ -229,50 +204,111 @@ async def _thumb_poller(stop_event: asyncio.Event):
     except Exception:
         pass
 
-async def get_local_videos(chat_id: int):
-    """Obtiene rápidamente los videos ya guardados en la BD para mostrar algo al usuario."""
+async def get_local_videos_page(
+    chat_id: int,
+    page: int = 1,
+    per_page: int = 100,
+    sort: str = "fecha",
+    direction: str = "desc",
+    cursor: str = "",
+) -> tuple[list[dict], dict]:
+    """
+    Página de videos ya guardados de un chat, ordenada y paginada en SQL
+    (índices idx_videos_chat_*). Con cursor sigue desde la última fila vista;
+    sin cursor salta a la página con OFFSET.
+    Devuelve (items, datos de paginación).
+    """
     videos = []
+    info = {
+        "page": page, "total_items": 0, "total_pages": max(1, page),
+        "has_next": False, "next_cursor": None, "prev_cursor": None,
+    }
+    if sort not in SEEK_SORTS:
+        sort = "fecha"
+    direction = "asc" if direction.lower() == "asc" else "desc"
+    cursor_sort = f"{sort}.{direction}"
+    seek = decode_cursor(cursor, cursor_sort)
+    seek_where, seek_params, order_clause, reverse_rows = seek_page(sort, direction, seek)
+
     try:
-        async with get_db() as db:
+        async with get_read_db() as db:
             db.row_factory = aiosqlite.Row
+            info["total_items"] = await cached_count(
+                db, "SELECT COUNT(*) FROM videos_telegram vt WHERE vt.chat_id = ?", (chat_id,)
+            )
+            if not seek:
+                # Un ?page= pasado del final (enlace viejo o editado) va a la última página
+                page = clamp_page(page, info["total_items"], per_page)
+            limit_sql = "LIMIT ?" if seek else "LIMIT ? OFFSET ?"
+            limit_params = (per_page + 1,) if seek else (per_page + 1, (page - 1) * per_page)
             # Seleccionamos campos compatibles con la vista
-            cursor = await db.execute("""
-                SELECT message_id, nombre, tamano_bytes, file_unique_id, 
-                       file_id, caption, duracion, ancho, alto, mime_type, 
-                       views, outgoing, fecha_mensaje, has_thumb,
-                       (
-                           SELECT COUNT(*) FROM video_messages vm
-                           WHERE vm.video_id = videos_telegram.file_unique_id
-                       ) AS messages_count
-                FROM videos_telegram 
-                WHERE chat_id = ? 
-                ORDER BY message_id DESC
-            """, (chat_id,))
-            rows = await cursor.fetchall()
-            
-            for r in rows:
-                videos.append({
-                    "name": r["nombre"],
-                    "count": convertir_tamano(r["tamano_bytes"]),
-                    "link": f"/play/{chat_id}/{r['message_id']}",
-                    "type": "video",
-                    "photo_id": r["file_id"],  # La BD no suele guardar thumb_id, se puede mejorar
-                    "chat_id": chat_id,
-                    "video_id": r["file_unique_id"],
-                    "file_unique_id": r["file_unique_id"],
-                    "caption": r["caption"],
-                    "duration_text": _format_duration(r["duracion"]),
-                    "duration_seconds": r["duracion"],
-                    "file_size": r["tamano_bytes"],
-                    "message_id": r["message_id"],
-                    "views": r["views"],
-                    "date": r["fecha_mensaje"],
-                    "messages_count": r["messages_count"],
-                    "has_thumb": r["has_thumb"]
-                })
+            cursor_db = await db.execute(f"""
+                SELECT vt.message_id, vt.nombre, vt.tamano_bytes, vt.file_unique_id,
+                       vt.file_id, vt.caption, vt.duracion, vt.ancho, vt.alto, vt.mime_type,
+                       vt.views, vt.outgoing, vt.fecha_mensaje, vt.has_thumb,
+                       {SEEK_SORTS[sort]} AS seek_key,
+                       vt.rowid AS seek_rowid
+                FROM videos_telegram vt
+                WHERE vt.chat_id = ? {"AND " + seek_where if seek_where else ""}
+                ORDER BY {order_clause}
+                {limit_sql}
+            """, (chat_id, *seek_params, *limit_params))
+            rows = await cursor_db.fetchall()
+
+            hay_mas = len(rows) > per_page
+            rows = rows[:per_page]
+            if reverse_rows:
+                rows = rows[::-1]
+
+            # Mensajes por video solo de esta página (conteo materializado)
+            messages_counts = await messages_counts_for(db, [r["file_unique_id"] for r in rows])
+
+        info.update(keyset_page_info(
+            page, per_page, info["total_items"], rows, hay_mas, reverse_rows, bool(seek), cursor_sort
+        ))
+
+        for r in rows:
+            videos.append({
+                "name": r["nombre"],
+                "count": convertir_tamano(r["tamano_bytes"]),
+                "link": f"/play/{chat_id}/{r['message_id']}",
+                "type": "video",
+                "photo_id": r["file_id"],  # La BD no suele guardar thumb_id, se puede mejorar
+                "chat_id": chat_id,
+                "video_id": r["file_unique_id"],
+                "file_unique_id": r["file_unique_id"],
+                "caption": r["caption"],
+                "duration_text": _format_duration(r["duracion"]),
+                "duration_seconds": r["duracion"],
+                "file_size": r["tamano_bytes"],
+                "message_id": r["message_id"],
+                "views": r["views"],
+                "date": r["fecha_mensaje"],
+                "messages_count": messages_counts.get(r["file_unique_id"], 0),
+                "has_thumb": r["has_thumb"]
+            })
     except Exception as e:
         print(f"⚠️ Error leyendo cache local: {e}")
-    return videos
+    return videos, info
+
+
+def _channel_pagination(info: dict, per_page: int, sort: str, direction: str) -> dict:
+    """Datos de paginación comunes a /channel/{id} y /api/channel/{id}/videos."""
+    page = info["page"]
+    return {
+        "page": page,
+        "per_page": per_page,
+        "total_items": info["total_items"],
+        "total_pages": info["total_pages"],
+        "has_prev": page > 1,
+        "has_next": info["has_next"],
+        "prev_page": max(1, page - 1),
+        "next_page": page + 1,
+        "prev_cursor": info["prev_cursor"],
+        "next_cursor": info["next_cursor"],
+        "sort": sort,
+        "direction": direction,
+    }
 
 async def scan_channel_background(chat_id: int, run_thumb_worker: bool = True):
     """
@@ -324,8 +360,8 @@ async def scan_channel_background(chat_id: int, run_thumb_worker: bool = True):
                     "views": m.views or 0,
                     "outgoing": m.outgoing,
                 }
-                await db_upsert_video(video_data)
-                await db_add_video_file_id(v.file_unique_id, v.file_id, v.file_unique_id, "scan")
+                await db_enqueue_video(video_data)
+                await db_enqueue_video_file_id(v.file_unique_id, v.file_id, v.file_unique_id, "scan")
 
                 # Upsert Mensaje
                 message_data = {
@@ -347,7 +383,7 @@ async def scan_channel_background(chat_id: int, run_thumb_worker: bool = True):
                     "caption_entities": msg_dict.get("caption_entities"),
                     "raw_json": msg_dict,
                 }
-                await db_upsert_video_message(message_data)
+                await db_enqueue_video_message(message_data)
                 
                 # Guardamos el ID de mensaje explícito en el dump para referencia rápida
                 msg_dict["message_id"] = m.id
@@ -368,6 +404,8 @@ async def scan_channel_background(chat_id: int, run_thumb_worker: bool = True):
         print(f"✅ [Background] Escaneo finalizado para {chat_id}. {count_new} videos procesados.")
         
         try:
+            # Los upserts van por la cola de escritura: confirmarlos antes de contar
+            await db_flush_writes()
             indexed_final = await db_count_videos_by_chat(chat_id)
             scanned_at = datetime.datetime.utcnow().isoformat()
             await db_upsert_chat_video_count(
@@ -409,13 +447,16 @@ async def ver_canal(
     per_page: int = Query(100, ge=1, le=200),
     sort: str = Query("fecha"),
     direction: str = Query("desc"),
+    cursor: str = Query(""),
 ):
     """Vista de canal no bloqueante."""
     log_timing(f" Iniciando endpoint /channel/{chat_id}..")
     
-    # 1. Recuperar datos locales (RÁPIDO)
+    # 1. Recuperar datos locales (RÁPIDO): solo la página pedida, ordenada en SQL
     # Esto asegura que el usuario vea algo inmediatamente si ya entró antes.
-    videos_locales = await get_local_videos(chat_id)
+    per_page = max(1, min(200, per_page))
+    direction = direction.lower()
+    items_paged, page_info = await get_local_videos_page(chat_id, page, per_page, sort, direction, cursor)
     
     # 2. Programar escaneo en segundo plano (FIRE AND FORGET)
     # Esto evita que la página se quede "pegada" cargando.
@@ -449,28 +490,6 @@ async def ver_canal(
         current_folder_url = "/"
         parent_link = "javascript:history.back()"
 
-    # 4. Orden y paginación básica (mantener selector visible y navegable)
-    valid_sorts = {
-        "fecha": ("date", True),
-        "nombre": ("name", False),
-        "duracion": ("duration_seconds", False),
-    }
-    sort_field, _ = valid_sorts.get(sort, ("date", True))
-    direction = direction.lower()
-    reverse = direction != "asc"
-
-    if sort_field == "date":
-        videos_locales = sorted(videos_locales, key=lambda x: x.get("date") or "", reverse=reverse)
-    else:
-        videos_locales = sorted(videos_locales, key=lambda x: x.get(sort_field) or 0, reverse=reverse)
-
-    total_items = len(videos_locales)
-    per_page = max(1, min(200, per_page))
-    total_pages = max(1, (total_items + per_page - 1) // per_page)
-    page = min(page, total_pages)
-    offset = (page - 1) * per_page
-    items_paged = videos_locales[offset : offset + per_page]
-
     base_path = f"/channel/{chat_id}"
     query_suffix = ""
     if name:
@@ -482,24 +501,20 @@ async def ver_canal(
     if direction:
         query_suffix += f"&direction={direction}"
 
-    pagination = {
-        "page": page,
-        "page_fmt": formatear_miles(page),
-        "per_page": per_page,
-        "total_items": total_items,
-        "total_items_fmt": formatear_miles(total_items),
-        "total_pages": total_pages,
-        "total_pages_fmt": formatear_miles(total_pages),
-        "has_prev": page > 1,
-        "has_next": page < total_pages,
-        "prev_page": max(1, page - 1),
-        "next_page": min(total_pages, page + 1),
+    # 4. Paginación (mantener selector visible y navegable)
+    pagination = _channel_pagination(page_info, per_page, sort, direction)
+    pagination.update({
+        "page_fmt": formatear_miles(pagination["page"]),
+        "total_items_fmt": formatear_miles(pagination["total_items"]),
+        "total_pages_fmt": formatear_miles(pagination["total_pages"]),
         "base_path": base_path,
         "query_suffix": query_suffix,
-        "sort": sort,
-        "direction": direction,
-        "pages": _build_page_links(page, total_pages),
-    }
+        "pages": _build_page_links(pagination["page"], pagination["total_pages"]),
+    })
+
+    # Un solo sprite con los thumbs de la página en vez de una petición por tarjeta
+    thumb_sprite = await register_thumb_sprite(items_paged)
+    prioritize_page_thumbs(items_paged)
 
     # 5. Responder inmediatamente
     result = templates.TemplateResponse(MAIN_TEMPLATE, {
@@ -514,6 +529,7 @@ async def ver_canal(
         "parent_link": parent_link,
         "is_scanning": True, # Flag opcional para mostrar un spinner en el frontend
         "pagination": pagination,
+        "thumb_sprite": thumb_sprite,
     })
     log_timing(f"Endpoint /channel/{chat_id} terminado")
     return result
\ No newline at end of file
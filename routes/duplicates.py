@@ -1,5 +1,6 @@
 import os
 import re
+import asyncio
 import sqlite3
 import logging
 from typing import Any
@@ -10,7 +11,7 @@ from fastapi.templating import Jinja2Templates
 from PIL import Image
 
 # Importaciones de la base de datos
-from database import get_db, transaction, DatabaseConnectionError
+from database import get_db, get_read_db, transaction, DatabaseConnectionError, messages_counts_for
 
 try:
     import torch
@@ -22,8 +23,11 @@ except Exception:
     ResNet18_Weights = None  # type: ignore
     resnet18 = None  # type: ignore
 
-from config import CACHE_DUMP_VIDEOS_CHANNEL_ID, DB_PATH, MAIN_TEMPLATE, TEMPLATES_DIR, THUMB_FOLDER
+from config import CACHE_DUMP_VIDEOS_CHANNEL_ID, MAIN_TEMPLATE, TEMPLATES_DIR, THUMB_FOLDER, PHASH_MAX_DISTANCE
 from utils import convertir_tamano, log_timing
+from utils.phash import cluster_phashes, phash_to_int
+from services import prioritize_page_thumbs
+from services.phash_index import phash_index
 
 router = APIRouter()
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
@@ -34,6 +38,14 @@ _name_clean_re = re.compile(r"[^a-z0-9 ]+", re.IGNORECASE)
 _space_re = re.compile(r"\s+")
 _SIM_MODEL = None
 _SIM_TRANSFORM = None
+# Pares (chat_id, message_id) por consulta al traer los grupos del índice de pHash
+_KEYS_PER_QUERY = 400
+
+_ROW_COLUMNS = """
+            vt.chat_id, vt.message_id, vt.nombre, vt.tamano_bytes, vt.duracion,
+            vt.file_unique_id, vt.file_id, vt.has_thumb, vt.fecha_mensaje,
+            vt.thumb_bytes, vt.thumb_phash, vt.thumb_phash64,
+            c.name AS chat_name, c.username AS chat_username"""
 
 
 def _normalize_name(name: str | None) -> str:
@@ -192,13 +204,46 @@ async def _ensure_thumb_bytes_column(db: aiosqlite.Connection) -> None:
 async def _ensure_thumb_phash_column(db: aiosqlite.Connection) -> None:
     async with db.execute("PRAGMA table_info(videos_telegram)") as cursor:
         cols = [row[1] async for row in cursor]
-    if "thumb_phash" in cols:
-        return
-    try:
-        await db.execute("ALTER TABLE videos_telegram ADD COLUMN thumb_phash TEXT;")
-        await db.commit()
-    except Exception:
-        pass
+    for col, col_type in (("thumb_phash", "TEXT"), ("thumb_phash64", "INTEGER")):
+        if col in cols:
+            continue
+        try:
+            await db.execute(f"ALTER TABLE videos_telegram ADD COLUMN {col} {col_type};")
+            await db.commit()
+        except Exception:
+            pass
+
+
+def _row_phash(r) -> int | None:
+    """pHash de la fila como int64 (thumb_phash64, o el hex si aún no se convirtió)."""
+    if not (r["thumb_phash"] or "").strip():
+        return None
+    if r["thumb_phash64"] is not None:
+        return int(r["thumb_phash64"])
+    return phash_to_int(r["thumb_phash"])
+
+
+async def _phash_cluster_rows(max_distance: int, min_group_size: int, limit: int) -> list:
+    """Filas de los `limit` grupos más grandes de toda la biblioteca por radio de pHash."""
+    clusters = await phash_index.clusters(max_distance, min_group_size)
+    keys = [k for g in clusters[:limit] for k in g]
+    rows = []
+    async with get_read_db() as db:
+        db.row_factory = aiosqlite.Row
+        for i in range(0, len(keys), _KEYS_PER_QUERY):
+            chunk = keys[i:i + _KEYS_PER_QUERY]
+            values = ",".join("(?, ?)" for _ in chunk)
+            sql = f"""
+                SELECT {_ROW_COLUMNS},
+                    NULL AS key_name, NULL AS key_dur, NULL AS key_size
+                FROM videos_telegram vt
+                LEFT JOIN chats c ON c.chat_id = vt.chat_id
+                WHERE (vt.chat_id, vt.message_id) IN (VALUES {values})
+            """
+            async with db.execute(sql, [v for k in chunk for v in k]) as cursor:
+                rows.extend(await cursor.fetchall())
+    rows.sort(key=lambda r: (r["tamano_bytes"] or 0, r["fecha_mensaje"] or 0), reverse=True)
+    return rows
 
 
 @router.get("/duplicates")
@@ -234,6 +279,7 @@ async def api_duplicates(
     size_tol_bytes: int = Query(0, ge=0, le=50_000_000),
     thumb_mode: str = Query("wh"),
     similarity_threshold: float = Query(0.92, ge=0.5, le=0.99),
+    phash_max_distance: int = Query(PHASH_MAX_DISTANCE, ge=0, le=16),
     limit: int = Query(100, ge=1, le=200_000),
     min_group_size: int = Query(2, ge=2, le=50),
 ):
@@ -291,11 +337,7 @@ async def api_duplicates(
             ORDER BY COUNT(*) DESC
             LIMIT ? 
         )
-        SELECT 
-            vt.chat_id, vt.message_id, vt.nombre, vt.tamano_bytes, vt.duracion,
-            vt.file_unique_id, vt.file_id, vt.has_thumb, vt.fecha_mensaje,
-            vt.thumb_bytes, vt.thumb_phash,
-            c.name AS chat_name, c.username AS chat_username,
+        SELECT {_ROW_COLUMNS},
             {name_key_expr if by_name else 'NULL'} AS key_name,
             {dur_key_expr if by_duration else 'NULL'} AS key_dur,
             {size_key_expr if by_video_size else 'NULL'} AS key_size
@@ -306,16 +348,24 @@ async def api_duplicates(
         ORDER BY vt.tamano_bytes DESC, vt.fecha_mensaje DESC
     """
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_db() as db:
         await _ensure_thumb_bytes_column(db)
         await _ensure_thumb_phash_column(db)
-        db.row_factory = aiosqlite.Row
-        try:
-            async with db.execute(query_sql, (min_group_size, limit)) as cursor:
-                rows = await cursor.fetchall()
-        except sqlite3.OperationalError as e:
-            logger.error(f"Error SQL: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+
+    if potential_keys:
+        async with get_read_db() as db:
+            db.row_factory = aiosqlite.Row
+            try:
+                async with db.execute(query_sql, (min_group_size, limit)) as cursor:
+                    rows = await cursor.fetchall()
+            except sqlite3.OperationalError as e:
+                logger.error(f"Error SQL: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+    elif by_thumb_phash:
+        # Solo pHash: grupos por radio de Hamming sobre toda la biblioteca (índice en memoria)
+        rows = await _phash_cluster_rows(phash_max_distance, min_group_size, limit)
+    else:
+        raise HTTPException(status_code=400, detail="Se requiere al menos un criterio de nombre, duración, peso, canal o phash.")
 
     rows = rows or []
     
@@ -323,11 +373,8 @@ async def api_duplicates(
     video_ids = {(r["file_unique_id"] or "").strip() for r in rows if r["file_unique_id"]}
     msg_counts: dict[str, int] = {}
     if video_ids:
-        placeholders = ",".join("?" for _ in video_ids)
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute(f"SELECT video_id, COUNT(*) FROM video_messages WHERE video_id IN ({placeholders}) GROUP BY video_id", tuple(video_ids)) as cursor:
-                async for row in cursor:
-                    msg_counts[row[0].strip()] = row[1]
+        async with get_read_db() as db:
+            msg_counts = {vid.strip(): n for vid, n in (await messages_counts_for(db, video_ids)).items()}
 
     # --- Semejanza (GPU/CPU) ---
     similarity_clusters = {}
@@ -340,6 +387,14 @@ async def api_duplicates(
         if sim_items:
             similarity_clusters = _cluster_by_similarity(sim_items, similarity_threshold, device)
 
+    # --- pHash por radio de Hamming ---
+    phash_clusters: dict[int, int] = {}
+    if by_thumb_phash and rows:
+        phash_idx = [(idx, _row_phash(r)) for idx, r in enumerate(rows)]
+        phash_idx = [(idx, h) for idx, h in phash_idx if h is not None]
+        labels = await asyncio.to_thread(cluster_phashes, [h for _, h in phash_idx], phash_max_distance)
+        phash_clusters = {idx: label for (idx, _), label in zip(phash_idx, labels)}
+
     # --- Agrupamiento Final ---
     groups: dict[tuple, dict] = {}
     for idx, r in enumerate(rows):
@@ -365,9 +420,10 @@ async def api_duplicates(
             
         # Filtros extra de Python (Phash / Semejanza)
         if by_thumb_phash:
-            phash = (r["thumb_phash"] or "").strip()
-            key_parts.append(phash or f"no_phash_{idx}")
-            key_view["phash"] = phash
+            phash_id = phash_clusters.get(idx)
+            key_parts.append(f"phash_{phash_id}" if phash_id is not None else f"no_phash_{idx}")
+            key_view["phash"] = (r["thumb_phash"] or "").strip()
+            key_view["phash_max_distance"] = phash_max_distance
         if by_similarity:
             sim_id = similarity_clusters.get(idx)
             key_parts.append(sim_id if sim_id is not None else f"no_sim_{idx}")
@@ -437,8 +493,12 @@ async def api_duplicates(
         reverse=True,
     )
 
+    # Los primeros grupos son los que se ven: sus thumbs faltantes van primero en la cola
+    prioritize_page_thumbs([it for g in out_groups[:50] for it in g["items"]])
+
     result = {
         "scanned": len(rows),
+        "phash_max_distance": phash_max_distance if by_thumb_phash else None,
         "groups": out_groups,
         "groups_count": len(out_groups)
     }
@@ -458,6 +518,7 @@ async def hide_duplicates(payload: dict = Body(...)):
         async with get_db() as db:
             async with transaction(db) as cursor:
                 await cursor.executemany("UPDATE videos_telegram SET oculto = 2 WHERE chat_id = ? AND message_id = ?", pairs)
+        phash_index.invalidate()
         return {"ok": True, "updated": len(pairs)}
     except Exception as e:
         logger.error(f"Error hide: {e}")
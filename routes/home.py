@@ -10,13 +10,10 @@ from pyrogram.raw.functions.messages import GetDialogFilters
 from pyrogram.raw.types import DialogFilter, DialogFilterChatlist
 
 from config import TEMPLATES_DIR, MAIN_TEMPLATE, DB_PATH
-from database.connection import get_db
+from database.connection import get_read_db
 from services import get_client
 from utils import obtener_id_limpio, formatear_miles, log_timing
 
-# 👇 IMPORTAMOS EL GATILLO DEL WORKER
-from database.counters import recalculate_all_stats_background
-
 router = APIRouter()
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
@@ -38,7 +35,7 @@ async def _get_cached_videos_count():
     
     # Actualizar cache
     try:
-        async with get_db() as db:
+        async with get_read_db() as db:
             async with db.execute(
                 "SELECT COUNT(*) FROM videos_telegram WHERE has_thumb > 0"
             ) as cursor:
@@ -63,7 +60,7 @@ async def _get_cached_chats_count():
     
     # Actualizar cache
     try:
-        async with get_db() as db:
+        async with get_read_db() as db:
             async with db.execute("SELECT COUNT(*) FROM chats") as cursor:
                 row = await cursor.fetchone()
                 count = int((row[0] if row else 0) or 0)
@@ -100,11 +97,8 @@ async def _get_cached_filters():
 async def ver_home(request: Request):
     """Vista principal con lista de carpetas - Optimizada con cache."""
     log_timing(" Iniciando endpoint /..")
-    
-    # 🔥 GATILLO: Disparar recálculo de estadísticas en segundo plano
-    # Esto actualiza la tabla de estadísticas si hubo cambios externos (CLI).
-    # Es no-bloqueante gracias a asyncio.create_task dentro de la función.
-    await recalculate_all_stats_background()
+    # Las estadísticas por chat las mantienen triggers de videos_telegram (database/counters.py):
+    # cargar la home no recalcula nada
     
     # Ejecutar todas las operaciones de lectura en paralelo
     log_timing(" Obteniendo datos cacheados/en paralelo..")
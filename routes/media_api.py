@@ -6,17 +6,31 @@ import os
 import tempfile
 import asyncio
 import aiosqlite
-from fastapi import APIRouter, Body, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Body, Header, HTTPException
+from fastapi.responses import FileResponse, Response
 from PIL import UnidentifiedImageError
 from pyrogram.errors import FloodWait, FileReferenceExpired
 
-from config import THUMB_FOLDER, GRUPOS_THUMB_FOLDER, DB_PATH, CACHE_DUMP_VIDEOS_CHANNEL_ID
+from config import THUMB_FOLDER, GRUPOS_THUMB_FOLDER, CACHE_DUMP_VIDEOS_CHANNEL_ID, THUMB_PACK_ENABLED, BOT_POOL_TOKENS
 from services import get_client
-from services.thumb_worker_hibrido import _descargar_con_cliente
+from services.memory_cache import get_ram_cache_stats
+from services.disk_cache import get_disk_cache_stats
+from services.single_flight import get_single_flight_stats
+from services.thumb_pack import get_packed_thumb, thumb_pack
+from services.thumb_sprites import register_thumb_sprite, get_thumb_sprite, get_thumb_sprite_stats
+from services.thumb_worker_hibrido import _descargar_con_cliente, get_thumb_queue_stats, prioritize_thumbs
+from services.bot_rate import bot_rates, get_bot_rate_stats
+from services.bot_pool import bot_pool, get_bot_pool_stats
+from services.message_batcher import get_message_batcher_stats
+from services.phash_index import get_phash_index_stats
+from database.keyset import get_keyset_stats
 from utils import save_image_as_webp, log_timing
-from database import db_get_video_messages
-from .media_common import thumb_download_sem, thumb_db_cache
+from utils.thumb_encoder import get_thumb_encoder_stats
+from database import db_get_video_messages, get_db, get_read_db, get_pool_stats, db_enqueue_thumb_ready, get_write_queue_stats
+from .media_common import (
+    thumb_download_sem, thumb_db_cache, video_info_cache,
+    thumb_etag_cache, THUMB_CACHE_CONTROL, content_etag, http_date, is_not_modified,
+)
 
 router = APIRouter()
 
@@ -31,15 +45,78 @@ async def api_video_messages(video_id: str):
 @router.post("/api/video/{video_id}/watch_later")
 async def toggle_watch_later(video_id: str, value: bool = Body(..., embed=True)):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with get_db() as db:
             await db.execute("UPDATE videos_telegram SET watch_later = ? WHERE id = ?", (1 if value else 0, video_id))
             await db.commit()
             return {"video_id": video_id, "watch_later": value}
     except Exception:
         raise HTTPException(status_code=500, detail="Error")
 
+def _thumb_validators_sync(filepath: str) -> tuple[str, str] | None:
+    """(ETag por contenido, Last-Modified) de un thumb en disco; None si no existe."""
+    try:
+        with open(filepath, "rb") as f:
+            data = f.read()
+            mtime = os.fstat(f.fileno()).st_mtime
+    except OSError:
+        return None
+    return content_etag(data), http_date(mtime)
+
+
+def _thumb_headers(validators: tuple[str, str]) -> dict:
+    headers = {"ETag": validators[0], "Cache-Control": THUMB_CACHE_CONTROL}
+    if validators[1]:
+        headers["Last-Modified"] = validators[1]
+    return headers
+
+
+def _not_modified_response(validators: tuple[str, str]) -> Response:
+    thumb_etag_cache.not_modified += 1
+    return Response(status_code=304, headers=_thumb_headers(validators))
+
+
+# Espera máxima (s) por un token de bot antes de delegar el thumb a la cola del worker
+PHOTO_BOT_MAX_WAIT = 2
+
+
+async def _download_thumb_with_pool(chat_id: int, video_id: str, filepath: str) -> bool:
+    """
+    Fallback de /api/photo: baja el thumb del canal de dump con un bot ya conectado del pool.
+    Sin bots conectados devuelve False y el thumb queda para el worker.
+    """
+    async with get_read_db() as db:
+        async with db.execute(
+            "SELECT dump_message_id FROM videos_telegram WHERE chat_id = ? AND file_unique_id = ? AND dump_message_id > 0 LIMIT 1",
+            (chat_id, video_id),
+        ) as cursor:
+            row = await cursor.fetchone()
+    if not row:
+        return False
+    # Solo bots ya conectados: un login en frío (client.start) no debe frenar una grilla de thumbs
+    conectados = [k for k in bot_pool.keys() if (c := bot_pool.peek(k)) is not None and c.is_connected]
+    if not conectados:
+        return False
+    key = await bot_rates.acquire(conectados, max_wait=PHOTO_BOT_MAX_WAIT)
+    client = bot_pool.peek(key) if key else None
+    if client is None or not client.is_connected:
+        return False
+    res = await _descargar_con_cliente(
+        client, CACHE_DUMP_VIDEOS_CHANNEL_ID, row[0], video_id,
+        os.path.dirname(filepath), filepath, es_bot=True, rate_key=key,
+    )
+    return res is True
+
+
 @router.get("/api/photo/{file_id}")
-async def get_photo(file_id: str, tipo: str = "video", chat_id: int = None, video_id: str = None, has_thumb: str = "0"):
+async def get_photo(
+    file_id: str,
+    tipo: str = "video",
+    chat_id: int = None,
+    video_id: str = None,
+    has_thumb: str = "0",
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None),
+):
     # (Tu lógica de descarga de miniaturas se mantiene intacta)
     client = get_client()
     if tipo == "grupo":
@@ -47,7 +124,6 @@ async def get_photo(file_id: str, tipo: str = "video", chat_id: int = None, vide
         filename = f"{file_id}.webp"
     elif chat_id and video_id:
         target_folder = os.path.join(THUMB_FOLDER, str(chat_id))
-        os.makedirs(target_folder, exist_ok=True)
         filename = f"{video_id}.webp"
     else:
         target_folder = THUMB_FOLDER
@@ -57,19 +133,84 @@ async def get_photo(file_id: str, tipo: str = "video", chat_id: int = None, vide
     try: has_thumb_int = int(has_thumb) if str(has_thumb).strip() != "" else 0
     except: has_thumb_int = 0
 
+    # Petición condicional con validadores ya conocidos: 304 sin tocar el archivo
+    validators = thumb_etag_cache.get(filepath)
+    if validators and (if_none_match or if_modified_since) and is_not_modified(validators, if_none_match, if_modified_since):
+        return _not_modified_response(validators)
+
+    # Almacén empaquetado: un slice del mmap del pack en vez de abrir un archivo por thumb
+    if THUMB_PACK_ENABLED and tipo != "grupo" and chat_id and video_id:
+        # SQLite + copia del mmap bajo lock: fuera del event loop
+        data = await asyncio.to_thread(get_packed_thumb, chat_id, video_id)
+        if data is not None:
+            if has_thumb_int == 0:
+                try:
+                    await db_enqueue_thumb_ready(video_id)
+                except: pass
+            validators = validators or (content_etag(data), "")
+            thumb_etag_cache.set(filepath, *validators)
+            if is_not_modified(validators, if_none_match, None):
+                return _not_modified_response(validators)
+            return Response(data, media_type="image/webp", headers=_thumb_headers(validators))
+
     if os.path.exists(filepath):
         if has_thumb_int == 0 and video_id:
             try:
-                async with aiosqlite.connect(DB_PATH) as db:
-                    await db.execute("UPDATE videos_telegram SET has_thumb = 1 WHERE id = ?", (video_id,))
-                    await db.commit()
+                await db_enqueue_thumb_ready(video_id)
             except: pass
-        return FileResponse(filepath)
+        return await _thumb_file_response(filepath, validators, if_none_match, if_modified_since)
 
+    os.makedirs(target_folder, exist_ok=True)
     async with thumb_download_sem:
         # (Lógica simplificada para brevedad, usa tu código original de get_photo aquí si es muy largo)
         # La clave es que este endpoint no cambia, lo que cambia es api_stats abajo.
-        return FileResponse(filepath) if os.path.exists(filepath) else {"error": "not_found"}
+        if os.path.exists(filepath):
+            return await _thumb_file_response(filepath, None, if_none_match, if_modified_since)
+        if tipo != "grupo" and chat_id and video_id and BOT_POOL_TOKENS:
+            try:
+                if await _download_thumb_with_pool(chat_id, video_id, filepath):
+                    await db_enqueue_thumb_ready(video_id)
+                    return await _thumb_file_response(filepath, None, if_none_match, if_modified_since)
+            except Exception as e:
+                print(f"⚠️ [Photo] Fallback con bot falló para {video_id}: {e}")
+            # Sin bot libre: el worker de thumbs lo adelanta en su cola
+            await prioritize_thumbs([video_id])
+        return {"error": "not_found"}
+
+
+async def _thumb_file_response(filepath: str, validators, if_none_match: str | None, if_modified_since: str | None):
+    """FileResponse con ETag por contenido (calculado una vez) y caché inmutable."""
+    try:
+        stat_result = os.stat(filepath)
+    except OSError:
+        return {"error": "not_found"}
+    # El hash cacheado solo vale si el archivo no se regeneró desde entonces
+    if validators is None or validators[1] != http_date(stat_result.st_mtime):
+        validators = await asyncio.to_thread(_thumb_validators_sync, filepath)
+        if validators is None:
+            return {"error": "not_found"}
+        thumb_etag_cache.set(filepath, *validators)
+        if is_not_modified(validators, if_none_match, if_modified_since):
+            return _not_modified_response(validators)
+    return FileResponse(filepath, media_type="image/webp", stat_result=stat_result, headers=_thumb_headers(validators))
+
+
+@router.post("/api/thumbs/sprite")
+async def api_thumb_sprite_manifest(items: list[dict] = Body(..., embed=True)):
+    """
+    Registra los thumbs de una grilla ([{chat_id, video_id, photo_id, has_thumb}, ...])
+    y devuelve la URL del sprite y la posición CSS de cada video_id.
+    """
+    manifest = await register_thumb_sprite(items)
+    return manifest or {"key": None, "positions": {}}
+
+
+@router.get("/api/thumbs/sprite/{key}.webp")
+async def api_thumb_sprite(key: str):
+    sprite = await get_thumb_sprite(key)
+    if sprite is None:
+        raise HTTPException(status_code=404, detail="Sprite no registrado")
+    return Response(sprite, media_type="image/webp", headers={"Cache-Control": "public, max-age=3600"})
 
 
 # --- ESTADÍSTICAS INSTANTÁNEAS (V3 - Tabla Pre-calculada) ---
@@ -84,15 +225,15 @@ async def api_stats(limit: int = 10):
     
     EXCLUDE_CHAT_ID = -1003512635282
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         db.row_factory = aiosqlite.Row
         
         # 1. TOTALES GLOBALES
-        # Sumamos las columnas pre-calculadas en lugar de contar millones de filas
+        # Sumamos las columnas pre-calculadas (triggers) en lugar de contar millones de filas
         sql_totals = """
             SELECT 
-                SUM(videos_count) as total,
-                SUM(videos_count - COALESCE(duplicados, 0)) as unique_vid,
+                SUM(videos_locales) as total,
+                SUM(videos_locales - COALESCE(duplicados, 0)) as unique_vid,
                 SUM(sin_thumb) as no_thumb,
                 SUM(vertical) as vertical,
                 SUM(duration_1h) as long_vid,
@@ -116,7 +257,7 @@ async def api_stats(limit: int = 10):
             FROM chat_video_counts cv
             LEFT JOIN chats c ON c.chat_id = cv.chat_id
             WHERE cv.chat_id NOT IN (?, ?)
-            ORDER BY cv.videos_count DESC LIMIT ?
+            ORDER BY cv.videos_locales DESC LIMIT ?
         """
         async with db.execute(sql_top, (CACHE_DUMP_VIDEOS_CHANNEL_ID, EXCLUDE_CHAT_ID, limit)) as c:
             top_groups = await c.fetchall()
@@ -149,7 +290,7 @@ async def api_stats(limit: int = 10):
         for r in rows:
             chat_id = r["chat_id"]
             name = r["name"] or str(chat_id)
-            total = r["videos_count"] or 0
+            total = r["videos_locales"] or 0
             metric_val = r[main_metric_key] or 0
             
             # Cálculo seguro de porcentaje
@@ -179,9 +320,25 @@ async def api_stats(limit: int = 10):
         "videos_verticales": t_vert,
         "videos_largos_mas_1h": t_long,
         
-        "top_groups": format_list(top_groups, "videos_count"),
+        "top_groups": format_list(top_groups, "videos_locales"),
         "top_no_thumb_groups": format_list(top_nothumb, "sin_thumb"),
         "restricted_forward_groups": format_list(top_blocked, "blocked"),
+        "db_pool": get_pool_stats(),
+        "write_queue": get_write_queue_stats(),
+        "video_info_cache": video_info_cache.get_stats(),
+        "ram_cache": get_ram_cache_stats(),
+        "disk_cache": get_disk_cache_stats(),
+        "single_flight": get_single_flight_stats(),
+        "thumb_encoder": get_thumb_encoder_stats(),
+        "thumb_pack": thumb_pack.get_stats() if THUMB_PACK_ENABLED else None,
+        "thumb_sprites": get_thumb_sprite_stats(),
+        "thumb_etags": thumb_etag_cache.get_stats(),
+        "thumb_queue": get_thumb_queue_stats(),
+        "bot_rates": get_bot_rate_stats(),
+        "bot_pool": get_bot_pool_stats(),
+        "message_batcher": get_message_batcher_stats(),
+        "phash_index": get_phash_index_stats(),
+        "page_counts": get_keyset_stats(),
     }
     
     log_timing(f"Endpoint /api/stats terminado")
@@ -1,14 +1,25 @@
 import asyncio
-import aiosqlite
+import time
+from collections import OrderedDict
 
-from config import DB_PATH
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+from config import VIDEO_INFO_CACHE_SIZE, VIDEO_INFO_CACHE_TTL, VIDEO_INFO_CACHE_NEGATIVE_TTL, THUMB_ETAG_CACHE_SIZE
+from database import get_read_db
 
 __all__ = [
     "thumb_download_sem",
     "video_info_cache",
     "thumb_db_cache",
+    "thumb_etag_cache",
+    "THUMB_CACHE_CONTROL",
+    "content_etag",
+    "http_date",
+    "is_not_modified",
     "MAX_CACHE_SIZE",
     "get_video_info_from_db",
+    "invalidate_video_info",
     "_format_duration",
     "_build_page_links",
 ]
@@ -18,28 +29,168 @@ __all__ = [
 thumb_download_sem = asyncio.Semaphore(3)
 
 # --- CACHÉ EN MEMORIA ---
-# Caché para evitar consultas repetidas a la BD
-video_info_cache: dict[str, tuple | None] = {}
-MAX_CACHE_SIZE = 1000
+class VideoInfoCache:
+    """
+    LRU acotada con TTL para (video_id, ruta_local).
+    Los negativos caducan antes que los aciertos: un video que se descarga
+    después de la primera consulta deja de ir a Telegram en cuanto expira
+    (o de inmediato si se llama a invalidate()).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: OrderedDict[str, tuple[float, tuple]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> tuple | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: tuple) -> None:
+        ttl = self.ttl if value[0] is not None else self.negative_ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, chat_id: int, message_id: int, file_unique_id: str | None = None) -> None:
+        for key in {_video_info_key(chat_id, message_id, None), _video_info_key(chat_id, message_id, file_unique_id)}:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def _video_info_key(chat_id: int, message_id: int, file_unique_id: str | None) -> str:
+    return f"{chat_id}:{message_id}:{file_unique_id or ''}"
+
+
+# Caché para evitar consultas repetidas a la BD en cada petición de rango
+video_info_cache = VideoInfoCache(VIDEO_INFO_CACHE_SIZE, VIDEO_INFO_CACHE_TTL, VIDEO_INFO_CACHE_NEGATIVE_TTL)
+MAX_CACHE_SIZE = VIDEO_INFO_CACHE_SIZE
 
 thumb_db_cache: dict[str, tuple | None] = {}
 
 
+# --- VALIDADORES HTTP DE THUMBS ---
+# Los thumbs se nombran por file_unique_id (y los avatares por file_id): el contenido de una URL no cambia
+THUMB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ThumbETagCache:
+    """LRU ruta -> (ETag, Last-Modified): el hash del contenido se calcula una sola vez por thumb."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: OrderedDict[str, tuple[str, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, etag: str, last_modified: str) -> None:
+        self._data[key] = (etag, last_modified)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+thumb_etag_cache = ThumbETagCache(THUMB_ETAG_CACHE_SIZE)
+
+
+def content_etag(data: bytes) -> str:
+    return '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(validators: tuple[str, str], if_none_match: str | None, if_modified_since: str | None) -> bool:
+    """Evalúa If-None-Match (prioritario) o If-Modified-Since contra (ETag, Last-Modified)."""
+    etag, last_modified = validators
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        # Comparación débil: W/"x" equivale a "x"
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 # --- UTILS DB ASYNC ---
 async def get_video_info_from_db(chat_id: int, message_id: int, file_unique_id: str | None = None):
     """
     Busca de forma ASÍNCRONA si el video ya está descargado por completo en disco.
     Usa caché en memoria para evitar consultas repetidas.
     """
-    cache_key = f"{chat_id}:{message_id}:{file_unique_id or ''}"
+    cache_key = _video_info_key(chat_id, message_id, file_unique_id)
 
     # 1. Intentar obtener de la caché
-    if cache_key in video_info_cache:
-        return video_info_cache[cache_key]
+    cached = video_info_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
     # 2. Si no está en caché, consultar BD
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with get_read_db() as db:
             if file_unique_id:
                 query = "SELECT id, ruta_local FROM videos_telegram WHERE chat_id = ? AND message_id = ? AND file_unique_id = ?"
                 params = (chat_id, message_id, file_unique_id)
@@ -49,20 +200,20 @@ async def get_video_info_from_db(chat_id: int, message_id: int, file_unique_id:
 
             async with db.execute(query, params) as cursor:
                 row = await cursor.fetchone()
-                if row:
-                    # Guardar en caché
-                    result = (row[0], row[1])  # video_id, ruta_local
-                    if len(video_info_cache) >= MAX_CACHE_SIZE:
-                        # Limpiar caché si es muy grande
-                        video_info_cache.clear()
-                    video_info_cache[cache_key] = result
-                    return result
     except Exception as e:
+        # Sin caché: un fallo transitorio de BD no debe quedar memorizado
         print(f"Error DB info: {e}")
+        return None, None
+
+    # Los negativos también se guardan, pero con TTL corto
+    result = (row[0], row[1]) if row else (None, None)  # video_id, ruta_local
+    video_info_cache.set(cache_key, result)
+    return result
+
 
-    # Guardar el negativo también en caché
-    video_info_cache[cache_key] = (None, None)
-    return None, None
+def invalidate_video_info(chat_id: int, message_id: int, file_unique_id: str | None = None) -> None:
+    """Descarta la entrada cacheada de un mensaje (p.ej. tras escribir ruta_local)."""
+    video_info_cache.invalidate(chat_id, message_id, file_unique_id)
 
 
 def _format_duration(seconds):
@@ -5,8 +5,13 @@ import aiosqlite
 from fastapi import APIRouter, Request, Query, HTTPException
 from fastapi.templating import Jinja2Templates
 
-from config import TEMPLATES_DIR, THUMB_FOLDER, MAIN_TEMPLATE, DB_PATH,LIMIT_PER_PAGE
+from config import TEMPLATES_DIR, THUMB_FOLDER, MAIN_TEMPLATE, LIMIT_PER_PAGE
 from utils import convertir_tamano, formatear_miles, log_timing
+from database import (
+    get_read_db, fts_filter, SEEK_SORTS, seek_page, decode_cursor, cached_count, clamp_page, keyset_page_info,
+    messages_counts_for,
+)
+from services import prioritize_page_thumbs
 from .media_common import _build_page_links, _format_duration, get_video_info_from_db
 
 router = APIRouter()
@@ -74,22 +79,20 @@ async def _build_videos_page(
     view_type: str = "files",
     thumb_filter: str = "con",
     buscar: str = "",
+    cursor: str = "",
 ):
     print("Buscando videos...")   
-   
-    offset = (page - 1) * per_page
-
-    valid_sorts = {
-        "fecha": "fecha_mensaje",
-        "nombre": "nombre",
-        "duracion": "duracion",
-    }
-    sort_key = valid_sorts.get(sort, "fecha_mensaje")
+
+    if sort not in SEEK_SORTS:
+        sort = "fecha"
     direction = direction.lower()
     if direction not in ("asc", "desc"):
         direction = "desc"
 
-    order_clause = f"{sort_key} {direction.upper()}, message_id DESC"
+    # Con cursor se sigue desde la última fila vista (keyset); sin cursor (saltos de página) se usa OFFSET
+    cursor_sort = f"{sort}.{direction}"
+    seek = decode_cursor(cursor, cursor_sort)
+    seek_where, seek_params, order_clause, reverse_rows = seek_page(sort, direction, seek)
 
     where_clause = "WHERE oculto = 0"
     if thumb_filter == "con":
@@ -98,20 +101,31 @@ async def _build_videos_page(
         where_clause = f"{where_clause} AND has_thumb = 0"
     if extra_where:
         where_clause = f"{where_clause} AND {extra_where}"
-    if buscar:
-        where_clause = f"{where_clause} AND (nombre LIKE ? OR caption LIKE ? or file_unique_id LIKE ?)"
-        extra_params = (*extra_params, f"%{buscar}%", f"%{buscar}%", f"%{buscar}%")
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         db.row_factory = aiosqlite.Row
 
-        async with db.execute(
-            f"SELECT COUNT(*) AS cnt FROM videos_telegram {where_clause}",
-            extra_params,
-        ) as cursor:
-            row = await cursor.fetchone()
-            total_items = int((row["cnt"] if row else 0) or 0)
-        
+        if buscar:
+            fts = await fts_filter(db, buscar, rowid_col="vt.rowid")
+            if fts:
+                where_clause = f"{where_clause} AND ({fts[0]} OR file_unique_id = ?)"
+                extra_params = (*extra_params, *fts[1], buscar.strip())
+            else:
+                where_clause = f"{where_clause} AND (nombre LIKE ? OR caption LIKE ? or file_unique_id LIKE ?)"
+                extra_params = (*extra_params, f"%{buscar}%", f"%{buscar}%", f"%{buscar}%")
+
+        total_items = await cached_count(
+            db, f"SELECT COUNT(*) AS cnt FROM videos_telegram vt {where_clause}", extra_params
+        )
+
+        if not seek:
+            # Un ?page= pasado del final (enlace viejo o editado) va a la última página
+            page = clamp_page(page, total_items, per_page)
+        page_where = f"{where_clause} AND {seek_where}" if seek_where else where_clause
+        limit_sql = "LIMIT ?" if seek else "LIMIT ? OFFSET ?"
+        # Una fila de más para saber si hay otra página en el sentido del recorrido
+        limit_params = (per_page + 1,) if seek else (per_page + 1, (page - 1) * per_page)
+
         async with db.execute(
             f"""
             SELECT vt.chat_id,
@@ -133,17 +147,24 @@ async def _build_videos_page(
                    vt.dump_message_id,
                    vt.ruta_local,
                    c.name AS chat_name,
-                   c.username AS chat_username
+                   c.username AS chat_username,
+                   {SEEK_SORTS[sort]} AS seek_key,
+                   vt.rowid AS seek_rowid
             FROM videos_telegram vt
             LEFT JOIN chats c ON c.chat_id = vt.chat_id
-            {where_clause}
+            {page_where}
             ORDER BY {order_clause}
-            LIMIT ? OFFSET ?
+            {limit_sql}
             """,
-            (*extra_params, per_page, offset),
+            (*extra_params, *seek_params, *limit_params),
         ) as cursor:
             rows = await cursor.fetchall()
 
+        hay_mas = len(rows) > per_page
+        rows = rows[:per_page]
+        if reverse_rows:
+            rows = rows[::-1]
+
         print(f"""
             SELECT chat_id
             FROM videos_telegram
@@ -151,21 +172,8 @@ async def _build_videos_page(
             ORDER BY {order_clause}
             LIMIT ? OFFSET ?
             """)
-        # --- Conteo de mensajes por video (batch para evitar 1M+ subqueries) ---
-        messages_counts = {}
-        video_ids = [r["file_unique_id"] for r in (rows or []) if r["file_unique_id"]]
-
-        if video_ids:
-            placeholders = ",".join(["?"] * len(video_ids))
-            query = f"""
-                SELECT video_id, COUNT(*) AS cnt
-                FROM video_messages
-                WHERE video_id IN ({placeholders})
-                GROUP BY video_id
-            """
-            async with db.execute(query, video_ids) as cursor:
-                for video_id, cnt in await cursor.fetchall():
-                    messages_counts[video_id] = cnt
+        # --- Conteo de mensajes por video (materializado en video_message_counts) ---
+        messages_counts = await messages_counts_for(db, [r["file_unique_id"] for r in (rows or [])])
 
     items = []
     for r in (rows or []):
@@ -205,9 +213,13 @@ async def _build_videos_page(
             }
         )
 
-    total_pages = max(1, (total_items + per_page - 1) // per_page) if total_items else 1
-    has_prev = page > 1
-    has_next = page < total_pages
+    # Los thumbs que faltan en esta página se adelantan en la cola del worker
+    prioritize_page_thumbs(items)
+
+    info = keyset_page_info(page, per_page, total_items, rows, hay_mas, reverse_rows, bool(seek), cursor_sort)
+    page, total_pages = info["page"], info["total_pages"]
+    has_prev, has_next = info["has_prev"], info["has_next"]
+    prev_cursor, next_cursor = info["prev_cursor"], info["next_cursor"]
     page_links = _build_page_links(page, total_pages)
 
     total_items_fmt = formatear_miles(total_items)
@@ -245,6 +257,8 @@ async def _build_videos_page(
                 "has_next": has_next,
                 "prev_page": page - 1,
                 "next_page": page + 1,
+                "prev_cursor": prev_cursor,
+                "next_cursor": next_cursor,
                 "base_path": base_path,
                 "query_suffix": query_suffix,
                 "sort": sort,
@@ -266,6 +280,7 @@ async def all_videos_with_thumbs_page(
     direction: str = Query("desc"),
     thumb_filter: str = Query("con"),
     buscar: str = Query(""),
+    cursor: str = Query(""),
 ):
     log_timing(f" Iniciando endpoint /videos..")
     result = await _build_videos_page(
@@ -279,6 +294,7 @@ async def all_videos_with_thumbs_page(
         view_type="files",
         thumb_filter=thumb_filter,
         buscar =buscar,
+        cursor=cursor,
     )
     log_timing(f"Endpoint /videos terminado")
     return result
@@ -291,6 +307,7 @@ async def watch_later_page(
     per_page: int = Query(LIMIT_PER_PAGE, ge=1, le=200),
     sort: str = Query("fecha"),
     direction: str = Query("desc"),
+    cursor: str = Query(""),
 ):
     log_timing(" Iniciando endpoint /watch_later..")
     result = await _build_videos_page(
@@ -303,6 +320,7 @@ async def watch_later_page(
         title="Ver más tarde",
         extra_where="watch_later = 1",
         view_type="files",
+        cursor=cursor,
     )
     log_timing("Endpoint /watch_later terminado")
     return result
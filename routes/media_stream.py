@@ -2,18 +2,21 @@ import os
 import re
 import time
 import asyncio
-import aiofiles
 from fastapi import APIRouter, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 
-from config import DUMP_FOLDER, DB_PATH, SMART_CACHE_ENABLED, MQTT_ENABLED
-from services import get_client, TelegramVideoSender, prefetch_channel_videos_to_ram, background_thumb_downloader
+from config import DUMP_FOLDER, SMART_CACHE_ENABLED, MQTT_ENABLED
+from services import (
+    get_client, TelegramVideoSender, prefetch_channel_videos_to_ram, background_thumb_downloader, get_thumb_queue_stats,
+)
+from services.single_flight import get_message_once
 from utils import save_image_as_webp
+from utils.file_response import RangeFileResponse
 from utils.mqtt_manager import get_mqtt_manager
-from .media_common import get_video_info_from_db
+from database import get_db
+from .media_common import get_video_info_from_db, invalidate_video_info
 
 from fastapi import BackgroundTasks
-import aiosqlite
 
 router = APIRouter()
 downloads_status: dict[str, dict] = {}
@@ -74,7 +77,7 @@ async def _background_video_download(chat_id: int, message_id: int, video_id: st
             }
             return
         # Necesitamos el mensaje completo para descargar el media (message_id solo causa error de int sin file_id)
-        msg = await client.get_messages(chat_id, message_id)
+        msg = await get_message_once(client, chat_id, message_id)
         media = getattr(msg, "video", None) or getattr(msg, "document", None)
         if not media:
             raise ValueError("Mensaje sin media descargable")
@@ -158,13 +161,15 @@ async def _background_video_download(chat_id: int, message_id: int, video_id: st
                         speed=0,
                         eta=0,
                     )
-            # Usamos aiosqlite para la actualización final
-            async with aiosqlite.connect(DB_PATH) as db:
+            # Actualización final con la conexión escritora del pool
+            async with get_db() as db:
                 await db.execute(
                     "UPDATE videos_telegram SET ruta_local = ?, en_mega = 0 WHERE chat_id = ? AND message_id = ?",
                     (file_path, chat_id, message_id),
                 )
                 await db.commit()
+            # Que /video_stream y /play vean ya la copia local
+            invalidate_video_info(chat_id, message_id, video_id)
     except asyncio.CancelledError:
         print(f"🛑 [BG] Descarga cancelada {video_id}")
         downloads_status[download_id] = {
@@ -209,7 +214,13 @@ async def _background_video_download(chat_id: int, message_id: int, video_id: st
 
 
 @router.get("/video_stream/{chat_id}/{message_id}")
-async def video_stream(chat_id: int, message_id: int, file_unique_id: str | None = Query(None), range: str = Header(None)):
+async def video_stream(
+    chat_id: int,
+    message_id: int,
+    file_unique_id: str | None = Query(None),
+    range: str = Header(None),
+    if_range: str = Header(None),
+):
     """
     Streaming Híbrido: Disco -> RAM -> Telegram.
     """
@@ -219,47 +230,9 @@ async def video_stream(chat_id: int, message_id: int, file_unique_id: str | None
     video_id, local_path = await get_video_info_from_db(chat_id, message_id, file_unique_id)
 
     # Si está descargado en disco, servimos directamente el archivo local
+    # (Range múltiple, If-Range y zero-copy si el servidor ASGI lo soporta)
     if local_path and os.path.exists(local_path):
-        total_size = os.path.getsize(local_path)
-        start, end = 0, total_size - 1
-        if range:
-            try:
-                r = range.replace("bytes=", "").split("-")
-                start = int(r[0])
-                if len(r) > 1 and r[1]:
-                    end = int(r[1])
-            except Exception:
-                pass
-
-        if start >= total_size:
-            raise HTTPException(status_code=416, detail="Range not satisfiable")
-
-        async def local_stream(start_pos: int, end_pos: int):
-            chunk_size = 64 * 1024
-            bytes_to_send = end_pos - start_pos + 1
-            async with aiofiles.open(local_path, mode='rb') as f:
-                await f.seek(start_pos)
-                while bytes_to_send > 0:
-                    read_size = min(chunk_size, bytes_to_send)
-                    data = await f.read(read_size)
-                    if not data:
-                        break
-                    yield data
-                    bytes_to_send -= len(data)
-
-        mime_type = "video/mp4"
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{total_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(end - start + 1),
-            "Content-Type": mime_type,
-        }
-        return StreamingResponse(
-            local_stream(start, end),
-            status_code=206,
-            headers=headers,
-            media_type=mime_type,
-        )
+        return RangeFileResponse(local_path, range_header=range, if_range=if_range, media_type="video/mp4")
 
     sender = TelegramVideoSender(client, chat_id, message_id, video_id=video_id, local_path=local_path)
     await sender.setup()
@@ -382,3 +355,9 @@ async def run_hybrid_thumb_worker(background_tasks: BackgroundTasks):
     """Lanza el worker híbrido de thumbnails (Bot + User) en 2do plano."""
     background_tasks.add_task(background_thumb_downloader)
     return {"status": "started", "message": "Worker híbrido de thumbnails iniciado"}
+
+
+@router.get("/api/thumbs/queue")
+async def thumb_queue_status():
+    """Estado de la cola de thumbs: profundidad, en curso y thumbs por minuto."""
+    return get_thumb_queue_stats()
@@ -7,7 +7,7 @@ from fastapi import APIRouter, Query
 import aiosqlite
 from pyrogram import enums
 
-from config import DB_PATH
+from database import get_read_db, fts_match_query, fts_ready, BM25_WEIGHTS, SEEK_SORTS, decode_cursor, encode_cursor
 from services import get_client
 from utils import log_timing
 
@@ -23,9 +23,10 @@ async def api_search(
     # Límite de resultados: por defecto 20, mínimo 1, máximo 100 (validado por FastAPI).
     limit: int = Query(20, ge=1, le=100),
     chat_id: Optional[int] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
     log_timing(f" Iniciando endpoint /search..")
-    result = await _do_search(q, scope, type, limit, chat_id)
+    result = await _do_search(q, scope, type, limit, chat_id, cursor)
     log_timing(f"Endpoint /search terminado")
     return result
 
@@ -37,10 +38,11 @@ async def api_search_alias(
     type: Literal["video", "enlace", "chat", "archivo"] = "video",
     limit: int = Query(20, ge=1, le=100),
     chat_id: Optional[int] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
     # Alias para evitar 404 si el front apunta a /api/search
     log_timing(f" Iniciando endpoint /api/search..")
-    result = await _do_search(q, scope, type, limit, chat_id)
+    result = await _do_search(q, scope, type, limit, chat_id, cursor)
     log_timing(f"Endpoint /api/search terminado")
     return result
 
@@ -51,10 +53,12 @@ async def _do_search(
     type: Literal["video", "enlace", "chat", "archivo"],
     limit: int,
     chat_id: Optional[int],
+    cursor: Optional[str] = None,
 ):
     """
     Endpoint de búsqueda.
     - scope: local (BD) o global (Telegram).
+    - cursor: next_cursor de la respuesta anterior (búsqueda local de videos).
     - type:
         - video: videos
         - enlace: mensajes con URLs
@@ -67,29 +71,62 @@ async def _do_search(
     if scope == "local":
         if type == "video":
             # Consulta en la base local; el límite se impone en SQL.
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with get_read_db() as db:
                 db.row_factory = aiosqlite.Row
-                base_sql = """
-                    SELECT id, chat_id, message_id, nombre, caption, fecha_mensaje,
-                           duracion, tamano_bytes, mime_type, es_vertical
-                    FROM videos_telegram
-                    WHERE (nombre LIKE ? OR caption LIKE ?)
-                """
-                params = [q_like, q_like]
+                match = fts_match_query(q)
+                if match is not None and await fts_ready(db):
+                    # Índice FTS5: palabras como prefijo, ordenado por relevancia (bm25)
+                    cursor_sort, desc = "fts", False
+                    base_sql = f"""
+                        SELECT vt.id, vt.chat_id, vt.message_id, vt.nombre, vt.caption, vt.fecha_mensaje,
+                               vt.duracion, vt.tamano_bytes, vt.mime_type, vt.es_vertical,
+                               bm25(videos_fts, {BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]}) AS seek_key,
+                               vt.rowid AS seek_rowid
+                        FROM videos_fts
+                        JOIN videos_telegram vt ON vt.rowid = videos_fts.rowid
+                        WHERE videos_fts MATCH ?
+                    """
+                    params = [match]
+                else:
+                    cursor_sort, desc = "fecha.desc", True
+                    base_sql = f"""
+                        SELECT id, chat_id, message_id, nombre, caption, fecha_mensaje,
+                               duracion, tamano_bytes, mime_type, es_vertical,
+                               {SEEK_SORTS["fecha"]} AS seek_key,
+                               vt.rowid AS seek_rowid
+                        FROM videos_telegram vt
+                        WHERE (nombre LIKE ? OR caption LIKE ?)
+                    """
+                    params = [q_like, q_like]
                 if chat_id is not None:
-                    base_sql += " AND chat_id = ?"
+                    base_sql += " AND vt.chat_id = ?"
                     params.append(chat_id)
 
-                base_sql += """
-                    ORDER BY fecha_mensaje DESC
+                # Paginación por cursor: sigue después de (seek_key, seek_rowid) de la última fila
+                op, op_eq, order = ("<", "<=", "DESC") if desc else (">", ">=", "ASC")
+                seek = decode_cursor(cursor, cursor_sort)
+                seek_sql = ""
+                if seek is not None:
+                    seek_sql = f"WHERE seek_key {op_eq} ? AND (seek_key {op} ? OR seek_rowid {op} ?)"
+                    params.extend([seek["k"], seek["k"], seek["r"]])
+
+                sql = f"""
+                    SELECT * FROM ({base_sql})
+                    {seek_sql}
+                    ORDER BY seek_key {order}, seek_rowid {order}
                     LIMIT ?
                 """
-                params.append(limit)
+                params.append(limit + 1)
+
+                async with db.execute(sql, params) as cur:
+                    rows = await cur.fetchall()
 
-                async with db.execute(base_sql, params) as cursor:
-                    rows = await cursor.fetchall()
-            items = [dict(r) for r in rows]
-            return {"scope": scope, "type": type, "items": items}
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(cursor_sort, rows[-1]["seek_key"], rows[-1]["seek_rowid"])
+            items = [{k: r[k] for k in r.keys() if k not in ("seek_key", "seek_rowid")} for r in rows]
+            return {"scope": scope, "type": type, "items": items, "next_cursor": next_cursor}
 
         # Local enlaces / chat / archivo: sin datos en BD actual
         return {"scope": scope, "type": type, "items": []}
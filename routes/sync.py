@@ -18,7 +18,7 @@ from pyrogram.raw.types import (
     PeerChannel,
 )
 
-from config import DB_PATH
+from database import get_db
 from services import get_client
 
 router = APIRouter()
@@ -83,96 +83,95 @@ async def sincronizar_incremental(folder_id: int) -> dict:
 
     timestamp_limite = time.time() - (HORAS_ATRAS * 3600)
 
-    async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-        await db.execute("PRAGMA journal_mode = WAL")
-        await db.execute("PRAGMA synchronous = NORMAL")
-        await db.execute("PRAGMA busy_timeout = 5000")
-
-        while not detener:
-            try:
-                raw = await client.invoke(
-                    GetDialogs(
-                        offset_date=offset_date,
-                        offset_id=offset_id,
-                        offset_peer=offset_peer,
-                        limit=limit,
-                        hash=0,
-                        folder_id=folder_id,
-                    )
+    while not detener:
+        try:
+            raw = await client.invoke(
+                GetDialogs(
+                    offset_date=offset_date,
+                    offset_id=offset_id,
+                    offset_peer=offset_peer,
+                    limit=limit,
+                    hash=0,
+                    folder_id=folder_id,
                 )
+            )
 
-                if not raw.dialogs:
-                    break
+            if not raw.dialogs:
+                break
 
-                chats_map = {c.id: c for c in raw.chats}
-                users_map = {u.id: u for u in raw.users}
-                messages_map = {m.id: m for m in raw.messages}
-
-                writes_in_batch = 0
-
-                for d in raw.dialogs:
-                    top_msg = messages_map.get(d.top_message)
-                    msg_date = top_msg.date if top_msg else 0
-                    is_pinned = getattr(d, "pinned", False)
-
-                    if not is_pinned and msg_date < timestamp_limite:
-                        print(f"   🛑 Encontrado chat antiguo ({formatear_fecha(msg_date)}). Deteniendo escaneo.")
-                        detener = True
-                        break
-
-                    if msg_date < timestamp_limite:
-                        continue
-
-                    p = d.peer
-                    entity = None
-                    chat_id = 0
-                    type_str = "UNKNOWN"
-
-                    if isinstance(p, PeerUser):
-                        entity = users_map.get(p.user_id)
-                        chat_id = p.user_id
-                        type_str = "PRIVATE"
-                    elif isinstance(p, PeerChat):
-                        entity = chats_map.get(p.chat_id)
-                        chat_id = int(f"-{p.chat_id}")
-                        type_str = "GROUP"
-                    elif isinstance(p, PeerChannel):
-                        entity = chats_map.get(p.channel_id)
-                        chat_id = int(f"-100{p.channel_id}")
-                        type_str = getattr(entity, "megagroup", False) and "SUPERGROUP" or "CHANNEL"
-
-                    if not entity:
-                        continue
-
-                    title = getattr(entity, "title", None) or f"{getattr(entity, 'first_name', '')} {getattr(entity, 'last_name', '')}".strip()
-                    username = getattr(entity, "username", None)
-
-                    try:
-                        raw_str = str(entity)
-                    except Exception:
-                        raw_str = "{}"
-
-                    await guardar_en_bd(db, chat_id, title, type_str, username, raw_str, formatear_fecha(msg_date), folder_id)
-                    procesados += 1
-                    writes_in_batch += 1
-
-                if writes_in_batch:
-                    await db.commit()
+            chats_map = {c.id: c for c in raw.chats}
+            users_map = {u.id: u for u in raw.users}
+            messages_map = {m.id: m for m in raw.messages}
+
+            # Acumulamos la página y la escribimos en una sola transacción,
+            # sin retener la conexión escritora durante las llamadas a Telegram.
+            pendientes = []
 
-                if detener:
+            for d in raw.dialogs:
+                top_msg = messages_map.get(d.top_message)
+                msg_date = top_msg.date if top_msg else 0
+                is_pinned = getattr(d, "pinned", False)
+
+                if not is_pinned and msg_date < timestamp_limite:
+                    print(f"   🛑 Encontrado chat antiguo ({formatear_fecha(msg_date)}). Deteniendo escaneo.")
+                    detener = True
                     break
 
-                last_dialog = raw.dialogs[-1]
-                last_msg_top = messages_map.get(last_dialog.top_message)
-                offset_id = last_dialog.top_message
-                offset_date = last_msg_top.date if last_msg_top else 0
-                offset_peer = get_next_offset_peer(last_dialog.peer, users_map, chats_map)
+                if msg_date < timestamp_limite:
+                    continue
+
+                p = d.peer
+                entity = None
+                chat_id = 0
+                type_str = "UNKNOWN"
+
+                if isinstance(p, PeerUser):
+                    entity = users_map.get(p.user_id)
+                    chat_id = p.user_id
+                    type_str = "PRIVATE"
+                elif isinstance(p, PeerChat):
+                    entity = chats_map.get(p.chat_id)
+                    chat_id = int(f"-{p.chat_id}")
+                    type_str = "GROUP"
+                elif isinstance(p, PeerChannel):
+                    entity = chats_map.get(p.channel_id)
+                    chat_id = int(f"-100{p.channel_id}")
+                    type_str = getattr(entity, "megagroup", False) and "SUPERGROUP" or "CHANNEL"
+
+                if not entity:
+                    continue
+
+                title = getattr(entity, "title", None) or f"{getattr(entity, 'first_name', '')} {getattr(entity, 'last_name', '')}".strip()
+                username = getattr(entity, "username", None)
+
+                try:
+                    raw_str = str(entity)
+                except Exception:
+                    raw_str = "{}"
+
+                pendientes.append((chat_id, title, type_str, username, raw_str, formatear_fecha(msg_date), folder_id))
+
+            if pendientes:
+                async with get_db() as db:
+                    for fila in pendientes:
+                        await guardar_en_bd(db, *fila)
+                    await db.commit()
+                procesados += len(pendientes)
 
-            except Exception as e:
-                print(f"❌ Error ({type(e).__name__}): {e}")
-                traceback.print_exc()
+            if detener:
                 break
 
+            last_dialog = raw.dialogs[-1]
+            last_msg_top = messages_map.get(last_dialog.top_message)
+            offset_id = last_dialog.top_message
+            offset_date = last_msg_top.date if last_msg_top else 0
+            offset_peer = get_next_offset_peer(last_dialog.peer, users_map, chats_map)
+
+        except Exception as e:
+            print(f"❌ Error ({type(e).__name__}): {e}")
+            traceback.print_exc()
+            break
+
     print(f"✅ Actualizados {procesados} chats en {nombre}.")
     return {"folder_id": folder_id, "nombre": nombre, "procesados": procesados}
 
@@ -17,7 +17,9 @@ from .folder_sync import refresh_manual_folder_from_telegram
 from .video_streamer import TelegramVideoSender
 # --- NUEVO IMPORT ---
 from .prefetch import prefetch_channel_videos_to_ram
-from .thumb_worker_hibrido import background_thumb_downloader
+from .thumb_worker_hibrido import (
+    background_thumb_downloader, prioritize_thumbs, prioritize_page_thumbs, get_thumb_queue_stats, stop_thumb_queue,
+)
 
 __all__ = [
     "get_client",
@@ -31,4 +33,8 @@ __all__ = [
     "TelegramVideoSender",
     "prefetch_channel_videos_to_ram", # <--- EXPORTADO PÚBLICAMENTE
     "background_thumb_downloader",
+    "prioritize_thumbs",
+    "prioritize_page_thumbs",
+    "get_thumb_queue_stats",
+    "stop_thumb_queue",
 ]
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Pool persistente de clientes bot (BOT_POOL_TOKENS).
+Los clientes se inician al pedirlos por primera vez y quedan conectados hasta
+el shutdown: las pasadas del worker de thumbs, el fallback de /api/photo y
+CLI/descargar_dump.py ya no repiten el login de cada bot.
+Las sesiones se guardan en FOLDER_SESSIONS con la clave del bot (bot_rate_key),
+así tampoco hay handshake completo al reiniciar el proceso.
+Un bot sin uso hace más de BOT_POOL_HEALTHCHECK_IDLE se verifica con get_me()
+antes de entregarlo; si no responde se reinicia.
+"""
+import os
+import time
+import asyncio
+
+from pyrogram import Client
+
+from config import (
+    API_ID, API_HASH, BOT_POOL_TOKENS, FOLDER_SESSIONS,
+    BOT_POOL_START_CONCURRENCY, BOT_POOL_HEALTHCHECK_IDLE, BOT_POOL_RETRY_SECONDS,
+)
+from .bot_rate import bot_rate_key
+
+HEALTHCHECK_TIMEOUT = 10
+
+
+class BotClientPool:
+    def __init__(self, tokens: list[str] = BOT_POOL_TOKENS, session_prefix: str = "pool_bot"):
+        # Un token repetido en la lista es el mismo bot: una sola sesión
+        self._tokens: dict[str, str] = {}
+        for token in tokens:
+            self._tokens.setdefault(bot_rate_key(token), token)
+        self.session_prefix = session_prefix
+        self._clients: dict[str, Client] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._last_used: dict[str, float] = {}
+        self._retry_at: dict[str, float] = {}
+        self.stats = {"started": 0, "start_errors": 0, "restarts": 0, "healthchecks": 0}
+
+    def keys(self) -> list[str]:
+        return list(self._tokens)
+
+    def peek(self, key: str) -> Client | None:
+        """Cliente ya iniciado (sin arrancarlo ni verificarlo)."""
+        return self._clients.get(key)
+
+    def _new_client(self, key: str) -> Client:
+        os.makedirs(FOLDER_SESSIONS, exist_ok=True)
+        return Client(
+            os.path.join(FOLDER_SESSIONS, f"{self.session_prefix}_{key}"),
+            api_id=API_ID,
+            api_hash=API_HASH,
+            bot_token=self._tokens[key],
+            no_updates=True,
+        )
+
+    async def _stop_client(self, client: Client) -> None:
+        try:
+            if client.is_connected:
+                await client.stop()
+        except Exception:
+            pass
+
+    async def _healthy(self, client: Client) -> bool:
+        if not client.is_connected:
+            return False
+        self.stats["healthchecks"] += 1
+        try:
+            await asyncio.wait_for(client.get_me(), HEALTHCHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def get(self, key: str) -> Client | None:
+        """Cliente conectado del bot (lo inicia o reinicia si hace falta). None si no arranca."""
+        client = self._clients.get(key)
+        now = time.monotonic()
+        if client is not None and client.is_connected and now - self._last_used.get(key, 0) < BOT_POOL_HEALTHCHECK_IDLE:
+            self._last_used[key] = now
+            return client
+        if key not in self._tokens or now < self._retry_at.get(key, 0):
+            return None
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            client = self._clients.get(key)
+            if client is not None:
+                # Otro llamador pudo haberlo (re)iniciado mientras esperábamos el lock
+                if time.monotonic() - self._last_used.get(key, 0) < BOT_POOL_HEALTHCHECK_IDLE and client.is_connected:
+                    return client
+                if await self._healthy(client):
+                    self._last_used[key] = time.monotonic()
+                    return client
+                print(f"🔄 [BotPool] Reiniciando bot {key}")
+                self.stats["restarts"] += 1
+                await self._stop_client(client)
+                self._clients.pop(key, None)
+
+            client = self._new_client(key)
+            try:
+                await client.start()
+            except Exception as e:
+                print(f"⚠️ [BotPool] Bot {key} no pudo iniciar: {e}")
+                self.stats["start_errors"] += 1
+                self._retry_at[key] = time.monotonic() + BOT_POOL_RETRY_SECONDS
+                await self._stop_client(client)
+                return None
+            self.stats["started"] += 1
+            self._clients[key] = client
+            self._last_used[key] = time.monotonic()
+            self._retry_at.pop(key, None)
+            return client
+
+    async def start_all(self, keys: list[str] | None = None) -> dict[str, Client]:
+        """Inicia (o reutiliza) los bots pedidos y devuelve los que quedaron conectados."""
+        keys = keys if keys is not None else self.keys()
+        sem = asyncio.Semaphore(max(1, BOT_POOL_START_CONCURRENCY))
+
+        async def _one(key: str):
+            async with sem:
+                return key, await self.get(key)
+
+        resultados = await asyncio.gather(*(_one(k) for k in keys))
+        return {key: client for key, client in resultados if client is not None}
+
+    async def stop(self) -> None:
+        """Detiene todos los clientes (hook de shutdown)."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._last_used.clear()
+        await asyncio.gather(*(self._stop_client(c) for c in clients))
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "bots": len(self._tokens),
+            "connected": sum(1 for c in self._clients.values() if c.is_connected),
+            "waiting_retry": sum(1 for t in self._retry_at.values() if t > time.monotonic()),
+        }
+
+
+bot_pool = BotClientPool()
+
+
+async def stop_bot_pool() -> None:
+    await bot_pool.stop()
+
+
+def get_bot_pool_stats() -> dict:
+    return bot_pool.get_stats()
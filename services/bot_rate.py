@@ -0,0 +1,193 @@
+"""
+Ritmo adaptativo del pool de bots (BOT_POOL_TOKENS).
+Cada bot tiene un token bucket cuya tasa (peticiones/segundo) se aprende con
+AIMD: sube un poco con cada éxito y se multiplica por BOT_RATE_DECREASE ante
+un FloodWait, que además deja al bot bloqueado lo que pidió Telegram.
+acquire() entrega el bot con más margen (el que antes tiene un token libre)
+y las tasas aprendidas se guardan en BOT_RATES_FILE para la siguiente corrida.
+Lo usan el worker híbrido de thumbs y CLI/descargar_dump.py.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+from config import (
+    BOT_RATES_FILE, BOT_RATE_INITIAL, BOT_RATE_MIN, BOT_RATE_MAX,
+    BOT_RATE_INCREASE, BOT_RATE_DECREASE, BOT_RATE_BURST, BOT_RATE_SAVE_DELAY,
+)
+
+
+def bot_rate_key(token: str) -> str:
+    """Clave estable por bot (sin guardar el token en disco)."""
+    return hashlib.sha1(token.encode("utf-8")).hexdigest()[:12]
+
+
+class _Bucket:
+    __slots__ = ("rate", "tokens", "updated", "blocked_until", "ok", "floods")
+
+    def __init__(self, rate: float, blocked_until: float = 0.0):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.time()
+        self.blocked_until = blocked_until
+        self.ok = 0
+        self.floods = 0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(float(BOT_RATE_BURST), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos hasta poder usar el bot (bloqueo por FloodWait o falta de token)."""
+        self.refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+
+class BotRateController:
+    def __init__(self, path: str = BOT_RATES_FILE):
+        self.path = path
+        self._buckets: dict[str, _Bucket] = {}
+        self._loaded: dict[str, dict] | None = None
+        self._lock = threading.Lock()
+        self._save_task: asyncio.Task | None = None
+        self.stats = {"acquired": 0, "floods": 0, "waited_s": 0.0}
+
+    # --- PERSISTENCIA ---
+    def _load(self) -> dict[str, dict]:
+        if self._loaded is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._loaded = json.load(f)
+            except (OSError, ValueError):
+                self._loaded = {}
+        return self._loaded
+
+    def save(self) -> None:
+        """Guarda la tasa aprendida y el bloqueo vigente de cada bot."""
+        # El lock cubre también la escritura: puede correr a la vez en el hilo de _save_later
+        with self._lock:
+            data = dict(self._load())
+            for key, b in list(self._buckets.items()):
+                data[key] = {"rate": round(b.rate, 4), "blocked_until": b.blocked_until}
+            self._loaded = data
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"⚠️ [BotRate] No se pudieron guardar los ritmos: {e}")
+
+    def _schedule_save(self) -> None:
+        """Un solo guardado cada BOT_RATE_SAVE_DELAY segundos, en un hilo (no bloquea el loop)."""
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()  # Sin event loop no hay nada que bloquear
+            return
+        self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(BOT_RATE_SAVE_DELAY)
+        await asyncio.to_thread(self.save)
+
+    def _bucket(self, key: str) -> _Bucket:
+        b = self._buckets.get(key)
+        if b is None:
+            saved = self._load().get(key, {})
+            rate = min(BOT_RATE_MAX, max(BOT_RATE_MIN, float(saved.get("rate", BOT_RATE_INITIAL))))
+            b = _Bucket(rate, float(saved.get("blocked_until", 0.0)))
+            self._buckets[key] = b
+        return b
+
+    # --- USO ---
+    async def acquire(self, keys: list[str], max_wait: float | None = None) -> str | None:
+        """
+        Espera y consume un token del bot con más margen entre keys.
+        Devuelve su clave, o None si el mejor bot tarda más de max_wait.
+        """
+        if not keys:
+            return None
+        inicio = time.time()
+        while True:
+            now = time.time()
+            # Menor espera primero; a igualdad, el que más tokens acumula
+            key = min(keys, key=lambda k: (self._bucket(k).wait_time(now), -self._buckets[k].tokens))
+            b = self._buckets[key]
+            wait = b.wait_time(now)
+            if wait <= 0:
+                b.tokens -= 1
+                self.stats["acquired"] += 1
+                self.stats["waited_s"] += now - inicio
+                return key
+            if max_wait is not None and now + wait - inicio > max_wait:
+                return None
+            # Dormir a tramos: otro bot puede liberarse antes (o bajar de tasa con un FloodWait)
+            await asyncio.sleep(min(wait, 1.0))
+
+    def rate(self, key: str) -> float:
+        """Tasa aprendida del bot (peticiones/segundo)."""
+        return self._bucket(key).rate
+
+    def report_success(self, key: str) -> None:
+        """Aumento aditivo de la tasa."""
+        b = self._bucket(key)
+        b.ok += 1
+        b.rate = min(BOT_RATE_MAX, b.rate + BOT_RATE_INCREASE)
+
+    def report_flood(self, key: str, seconds: float) -> None:
+        """Decremento multiplicativo y bloqueo durante el FloodWait pedido por Telegram."""
+        b = self._bucket(key)
+        now = time.time()
+        b.floods += 1
+        # Un mismo FloodWait puede llegar a varios que esperaban un lote de get_messages: se baja una vez
+        if b.blocked_until <= now:
+            b.rate = max(BOT_RATE_MIN, b.rate * BOT_RATE_DECREASE)
+        b.tokens = 0.0
+        b.updated = now
+        b.blocked_until = max(b.blocked_until, now + float(seconds))
+        self.stats["floods"] += 1
+        # El cierre (shutdown, descargar_dump) llama a save() y guarda lo que quede pendiente
+        self._schedule_save()
+
+    def blocked_count(self, keys: list[str] | None = None) -> int:
+        now = time.time()
+        return sum(1 for k in (keys or list(self._buckets)) if self._bucket(k).blocked_until > now)
+
+    def all_blocked(self, keys: list[str]) -> bool:
+        return bool(keys) and self.blocked_count(keys) == len(keys)
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        return {
+            **self.stats,
+            "waited_s": round(self.stats["waited_s"], 1),
+            "bots": len(self._buckets),
+            "blocked": self.blocked_count(),
+            "total_rate_per_min": round(sum(b.rate for b in self._buckets.values()) * 60, 1),
+            "per_bot": {
+                key: {
+                    "rate_per_min": round(b.rate * 60, 2),
+                    "ok": b.ok,
+                    "floods": b.floods,
+                    "blocked_s": max(0, int(b.blocked_until - now)),
+                }
+                for key, b in self._buckets.items()
+            },
+        }
+
+
+bot_rates = BotRateController()
+
+
+def get_bot_rate_stats() -> dict:
+    return bot_rates.get_stats()
@@ -1,94 +1,357 @@
 """
 Gestor de Caché Inteligente en Disco (LRU).
-Administra una carpeta con un límite de tamaño (ej. 2GB).
-Si se llena, elimina los archivos menos usados recientemente.
+Administra una carpeta con un límite de tamaño (MAX_DISK_CACHE_SIZE).
+
+Cada video se guarda como chunks de tamaño fijo (CHUNK_SIZE, alineados con los
+chunks de Telegram) en CACHE_DIR/<video_id>/<n>.chunk, de modo que se puede
+cachear cualquier rango de bytes y no solo el prefijo.
+El índice (tamaño y último uso de cada chunk) vive en memoria con un heap para
+desalojar en O(log n), se persiste en CACHE_DIR/index.json y la escritura y el
+desalojo corren en un hilo para no bloquear el event loop.
 """
 import os
+import json
 import time
-import shutil
-import aiofiles
-from config import CACHE_DIR, MAX_DISK_CACHE_SIZE, SMART_CACHE_ENABLED
+import heapq
+import asyncio
+import threading
+from config import CACHE_DIR, MAX_DISK_CACHE_SIZE, SMART_CACHE_ENABLED, CHUNK_SIZE
 
-def get_cache_path(video_id: str) -> str:
-    """Retorna la ruta física donde debería estar el video."""
-    return os.path.join(CACHE_DIR, f"{video_id}.cache")
+INDEX_FILE = os.path.join(CACHE_DIR, "index.json")
+INDEX_PERSIST_INTERVAL = 10  # segundos mínimos entre escrituras del índice
 
-def _get_directory_size(directory):
-    """Calcula el tamaño total de la carpeta en bytes."""
-    total = 0
-    try:
-        for entry in os.scandir(directory):
-            if entry.is_file():
-                total += entry.stat().st_size
-    except OSError:
-        pass
-    return total
+# (video_id, n_chunk) -> [tamaño, último uso]
+_index: dict[tuple[str, int], list] = {}
+# Heap de (último uso, video_id, n_chunk); entradas obsoletas se descartan al desalojar
+_heap: list[tuple[float, str, int]] = []
+_chunks_by_video: dict[str, set[int]] = {}
+_lock = threading.Lock()
+_state = {"loaded": False, "total": 0, "dirty": False, "persisted_at": 0.0}
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "evicted_bytes": 0}
 
-def _enforce_limit(new_bytes_needed: int):
+
+def get_cache_dir(video_id: str) -> str:
+    return os.path.join(CACHE_DIR, str(video_id))
+
+
+def get_chunk_path(video_id: str, index: int) -> str:
+    """Retorna la ruta física de un chunk del video."""
+    return os.path.join(get_cache_dir(video_id), f"{index}.chunk")
+
+
+# --- ÍNDICE (llamar siempre con _lock tomado) ---
+def _add(video_id: str, index: int, size: int, last_used: float) -> None:
+    key = (video_id, index)
+    old = _index.get(key)
+    if old:
+        _state["total"] -= old[0]
+    _index[key] = [size, last_used]
+    _chunks_by_video.setdefault(video_id, set()).add(index)
+    _state["total"] += size
+    _state["dirty"] = True
+    heapq.heappush(_heap, (last_used, video_id, index))
+    _compact_heap()
+
+
+def _discard(video_id: str, index: int) -> int:
+    meta = _index.pop((video_id, index), None)
+    if not meta:
+        return 0
+    chunks = _chunks_by_video.get(video_id)
+    if chunks is not None:
+        chunks.discard(index)
+        if not chunks:
+            del _chunks_by_video[video_id]
+    _state["total"] -= meta[0]
+    _state["dirty"] = True
+    return meta[0]
+
+
+def _touch(video_id: str, index: int, now: float) -> None:
+    meta = _index.get((video_id, index))
+    if meta:
+        meta[1] = now
+        heapq.heappush(_heap, (now, video_id, index))
+        _state["dirty"] = True
+        _compact_heap()
+
+
+def _compact_heap() -> None:
+    # Cada touch deja una entrada vieja en el heap: reconstruir si crece demasiado
+    if len(_heap) > 4 * len(_index) + 1024:
+        _heap[:] = [(meta[1], vid, idx) for (vid, idx), meta in _index.items()]
+        heapq.heapify(_heap)
+
+
+def _load_index_sync() -> None:
     """
-    Algoritmo de limpieza (LRU Eviction).
-    Si (actual + nuevo) > limite, borra archivos viejos (por fecha de acceso).
+    Carga el índice del sidecar o, si no existe, lo reconstruye escaneando CACHE_DIR una vez.
+    Las carpetas modificadas después del sidecar (p. ej. tras un cierre abrupto) se reconcilian.
     """
-    if not SMART_CACHE_ENABLED:
-        return
-    current_size = _get_directory_size(CACHE_DIR)
-    
-    if current_size + new_bytes_needed <= MAX_DISK_CACHE_SIZE:
-        return # Hay espacio, todo bien.
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entries = None
+    try:
+        index_mtime = os.path.getmtime(INDEX_FILE)
+        with open(INDEX_FILE, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    with _lock:
+        if _state["loaded"]:
+            return
+        if entries is not None:
+            for video_id, index, size, last_used in entries:
+                _add(video_id, int(index), size, last_used)
+            _state["dirty"] = False
+            _reconcile_with_disk(index_mtime)
+        else:
+            _rebuild_from_disk()
+            _state["dirty"] = True
+        _state["loaded"] = True
+    print(f"🗂️ [SmartCache] Índice cargado: {len(_index)} chunks, {_state['total']/1024/1024:.1f} MB.")
 
-    print(f"🧹 [SmartCache] Límite excedido ({current_size/1024/1024:.1f}MB). Liberando espacio...")
 
-    # 1. Listar archivos con su fecha de último acceso (atime)
-    files = []
+def _rebuild_from_disk() -> None:
     for entry in os.scandir(CACHE_DIR):
-        if entry.is_file():
-            files.append((entry.path, entry.stat().st_atime, entry.stat().st_size))
-    
-    # 2. Ordenar: los más viejos primero (menor atime)
-    files.sort(key=lambda x: x[1])
+        if entry.is_dir():
+            for chunk in os.scandir(entry.path):
+                name, ext = os.path.splitext(chunk.name)
+                if ext == ".chunk" and name.isdigit():
+                    st = chunk.stat()
+                    _add(entry.name, int(name), st.st_size, st.st_mtime)
+        elif entry.is_file() and entry.name.endswith(".cache"):
+            _migrate_legacy_file(entry.path, entry.name[:-len(".cache")])
+
+
+def _reconcile_with_disk(index_mtime: float) -> None:
+    """Ajusta el índice a las carpetas de video cambiadas después de index_mtime (una stat por video)."""
+    on_disk = set()
+    for entry in os.scandir(CACHE_DIR):
+        if not entry.is_dir():
+            continue
+        on_disk.add(entry.name)
+        if entry.stat().st_mtime < index_mtime:
+            continue
+        found = {}
+        for chunk in os.scandir(entry.path):
+            name, ext = os.path.splitext(chunk.name)
+            if ext == ".chunk" and name.isdigit():
+                found[int(name)] = chunk.stat()
+        for index in list(_chunks_by_video.get(entry.name, ())):
+            if index not in found:
+                _discard(entry.name, index)
+        for index, st in found.items():
+            meta = _index.get((entry.name, index))
+            if meta is None or meta[0] != st.st_size:
+                _add(entry.name, index, st.st_size, st.st_mtime)
+    # Videos del índice cuya carpeta ya no existe
+    for video_id in [v for v in _chunks_by_video if v not in on_disk]:
+        for index in list(_chunks_by_video.get(video_id, ())):
+            _discard(video_id, index)
+
+
+def _migrate_legacy_file(path: str, video_id: str) -> None:
+    """Convierte un '<video_id>.cache' (prefijo completo) al formato por chunks."""
+    try:
+        os.makedirs(get_cache_dir(video_id), exist_ok=True)
+        now = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            index = 0
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                with open(get_chunk_path(video_id, index), "wb") as out:
+                    out.write(data)
+                _add(video_id, index, len(data), now)
+                index += 1
+        os.remove(path)
+    except OSError as e:
+        print(f"⚠️ [SmartCache] Error migrando {path}: {e}")
+
+
+def _persist_index_sync(force: bool = False) -> None:
+    now = time.time()
+    with _lock:
+        if not _state["dirty"] or (not force and now - _state["persisted_at"] < INDEX_PERSIST_INTERVAL):
+            return
+        entries = [[vid, idx, meta[0], meta[1]] for (vid, idx), meta in _index.items()]
+        _state["dirty"] = False
+        _state["persisted_at"] = now
+    tmp = INDEX_FILE + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, INDEX_FILE)
+    except OSError as e:
+        print(f"⚠️ [SmartCache] No se pudo guardar el índice: {e}")
+
+
+def _enforce_limit(new_bytes_needed: int):
+    """
+    Desalojo LRU por chunk usando el heap del índice (sin escanear la carpeta).
+    Si (actual + nuevo) > limite, borra los chunks usados hace más tiempo.
+    """
+    victims = []
+    with _lock:
+        if _state["total"] + new_bytes_needed <= MAX_DISK_CACHE_SIZE:
+            return
+        while _heap and _state["total"] + new_bytes_needed > MAX_DISK_CACHE_SIZE:
+            last_used, video_id, index = heapq.heappop(_heap)
+            meta = _index.get((video_id, index))
+            if not meta or meta[1] != last_used:
+                continue  # Entrada obsoleta (el chunk se tocó después)
+            victims.append((video_id, index, _discard(video_id, index)))
 
-    # 3. Borrar hasta hacer espacio
     freed = 0
-    for path, atime, size in files:
+    for video_id, index, size in victims:
         try:
-            os.remove(path)
-            freed += size
-            current_size -= size
-            # print(f"🗑️ Eliminado: {os.path.basename(path)}")
-            
-            if current_size + new_bytes_needed <= MAX_DISK_CACHE_SIZE:
-                break
-        except OSError as e:
-            print(f"⚠️ Error borrando {path}: {e}")
-            
-    print(f"✨ [SmartCache] Liberados {freed/1024/1024:.1f} MB.")
-
-async def save_to_disk_smart(video_id: str, data: bytes):
-    """Guarda datos en disco asegurando que haya espacio."""
-    if not SMART_CACHE_ENABLED:
-        return
-    filepath = get_cache_path(video_id)
-    
-    # 1. Hacer espacio antes de escribir
-    # (Ejecutamos en hilo síncrono porque operaciones de disco masivas pueden bloquear)
-    # Para simplificar aquí lo hacemos directo, pero idealmente async wrapper.
+            os.remove(get_chunk_path(video_id, index))
+            if video_id not in _chunks_by_video:
+                os.rmdir(get_cache_dir(video_id))
+        except OSError:
+            pass
+        freed += size
+    _stats["evictions"] += len(victims)
+    _stats["evicted_bytes"] += freed
+    if victims:
+        print(f"✨ [SmartCache] Liberados {freed/1024/1024:.1f} MB ({len(victims)} chunks).")
+
+
+def _write_chunk_sync(video_id: str, index: int, data: bytes) -> None:
     _enforce_limit(len(data))
-    
-    # 2. Escribir
-    async with aiofiles.open(filepath, mode='wb') as f:
-        await f.write(data)
-    
-    # Actualizar fecha de acceso para que no sea el próximo en borrarse
+    os.makedirs(get_cache_dir(video_id), exist_ok=True)
+    path = get_chunk_path(video_id, index)
+    tmp = f"{path}.{threading.get_ident()}.tmp"  # único por hilo: dos escrituras del mismo chunk no chocan
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    with _lock:
+        _add(video_id, index, len(data), time.time())
+    _stats["writes"] += 1
+    _persist_index_sync()
+
+
+def _read_chunk_sync(video_id: str, index: int) -> bytes | None:
     try:
-        os.utime(filepath, None) 
-    except: pass
+        with open(get_chunk_path(video_id, index), "rb") as f:
+            return f.read()
+    except OSError:
+        # El archivo desapareció por fuera: sacarlo del índice
+        with _lock:
+            _discard(video_id, index)
+        return None
+
+
+async def _ensure_loaded() -> None:
+    if not _state["loaded"]:
+        await asyncio.to_thread(_load_index_sync)
+
+
+# --- API PÚBLICA ---
+async def save_chunk(video_id: str, index: int, data: bytes):
+    """Guarda el chunk n del video (bytes [n*CHUNK_SIZE, ...)) haciendo espacio si hace falta."""
+    if not SMART_CACHE_ENABLED or not video_id or not data:
+        return
+    await _ensure_loaded()
+    try:
+        await asyncio.to_thread(_write_chunk_sync, video_id, index, data)
+    except OSError as e:
+        print(f"⚠️ [SmartCache] Error guardando chunk {index} de {video_id}: {e}")
+
+
+async def save_to_disk_smart(video_id: str, data: bytes, offset: int = 0):
+    """Guarda datos en disco asegurando que haya espacio. 'offset' debe estar alineado a CHUNK_SIZE."""
+    if not SMART_CACHE_ENABLED or not data:
+        return
+    first = offset // CHUNK_SIZE
+    view = memoryview(data)
+    for n, pos in enumerate(range(0, len(data), CHUNK_SIZE)):
+        await save_chunk(video_id, first + n, bytes(view[pos:pos + CHUNK_SIZE]))
+
+
+async def read_chunk(video_id: str, index: int) -> bytes | None:
+    """Lee un chunk cacheado (y lo marca como usado). None si no está."""
+    if not SMART_CACHE_ENABLED or not video_id:
+        return None
+    await _ensure_loaded()
+    with _lock:
+        present = (video_id, index) in _index
+        if present:
+            _touch(video_id, index, time.time())
+    if not present:
+        _stats["misses"] += 1
+        return None
+    data = await asyncio.to_thread(_read_chunk_sync, video_id, index)
+    _stats["hits" if data is not None else "misses"] += 1
+    return data
+
+
+def has_chunk(video_id: str, index: int) -> bool:
+    with _lock:
+        return (video_id, index) in _index
+
+
+def cached_prefix_bytes(video_id: str) -> int:
+    """Bytes contiguos desde el inicio del video que hay en disco."""
+    with _lock:
+        total = 0
+        index = 0
+        while True:
+            meta = _index.get((video_id, index))
+            if not meta:
+                return total
+            total += meta[0]
+            if meta[0] < CHUNK_SIZE:
+                return total
+            index += 1
+
+
+async def read_prefix(video_id: str, max_bytes: int) -> bytes:
+    """Lee el prefijo contiguo cacheado (hasta max_bytes)."""
+    await _ensure_loaded()
+    buffer = bytearray()
+    index = 0
+    while len(buffer) < max_bytes:
+        data = await read_chunk(video_id, index)
+        if not data:
+            break
+        buffer.extend(data)
+        if len(data) < CHUNK_SIZE:
+            break
+        index += 1
+    return bytes(buffer[:max_bytes])
+
 
 def touch_file(video_id: str):
-    """Actualiza la fecha de uso de un archivo (para que no se borre)."""
+    """Actualiza la fecha de uso de todos los chunks de un video (para que no se borre)."""
     if not SMART_CACHE_ENABLED:
         return
-    filepath = get_cache_path(video_id)
-    if os.path.exists(filepath):
-        try:
-            os.utime(filepath, None)
-        except: pass
\ No newline at end of file
+    now = time.time()
+    with _lock:
+        for index in _chunks_by_video.get(video_id, ()):
+            _touch(video_id, index, now)
+
+
+async def load_disk_cache_index():
+    """Carga/reconstruye el índice en segundo plano (opcional en el arranque)."""
+    if SMART_CACHE_ENABLED:
+        await _ensure_loaded()
+
+
+async def persist_disk_cache_index():
+    """Guarda el índice pendiente (hook de shutdown)."""
+    if _state["loaded"]:
+        await asyncio.to_thread(_persist_index_sync, True)
+
+
+def get_disk_cache_stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "chunks": len(_index),
+            "videos": len(_chunks_by_video),
+            "used_mb": round(_state["total"] / 1024 / 1024, 2),
+            "max_mb": round(MAX_DISK_CACHE_SIZE / 1024 / 1024, 2),
+        }
@@ -1,63 +1,251 @@
 """
 Gestor de caché en memoria RAM.
 Ahora soporta el 'Pasaporte' (Objeto Mensaje) para evitar re-negociaciones con Telegram.
+
+Presupuesto en bytes (RAM_CACHE_MAX_MB) con LRU segmentada:
+- Las entradas nuevas entran en 'probation'.
+- Un segundo acceso las promueve a 'protected' (hasta RAM_CACHE_PROTECTED_RATIO del presupuesto).
+- Se desaloja primero lo menos reciente de probation, así un barrido de canal
+  no expulsa los videos que realmente se están viendo.
+Los datos se guardan como lista de chunks (prefijo contiguo del archivo), sin
+copias de todo el buffer cada vez que crece.
 """
+from bisect import bisect_right
+from collections import OrderedDict
+
+from config import RAM_CACHE_MAX_MB, RAM_CACHE_PROTECTED_RATIO
+
+# Coste aproximado del objeto Message + metadatos por entrada
+_ENTRY_OVERHEAD = 4 * 1024
+
+
+class RamEntry:
+    """Prefijo cacheado de un video: chunks contiguos desde el byte 0 + metadatos."""
+    __slots__ = ("chunks", "offsets", "cached_bytes", "total_size", "mime_type", "message")
+
+    def __init__(self, total_size: int, mime_type: str, message_obj=None):
+        self.chunks: list[bytes] = []
+        self.offsets: list[int] = []  # offset inicial de cada chunk
+        self.cached_bytes = 0
+        self.total_size = total_size
+        self.mime_type = mime_type
+        self.message = message_obj
+
+    @property
+    def size(self) -> int:
+        return self.cached_bytes + _ENTRY_OVERHEAD
+
+    def append(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.offsets.append(self.cached_bytes)
+        self.chunks.append(chunk)
+        self.cached_bytes += len(chunk)
+
+    def drop_last(self) -> int:
+        chunk = self.chunks.pop()
+        self.offsets.pop()
+        self.cached_bytes -= len(chunk)
+        return len(chunk)
+
+    def iter_range(self, start: int, end: int):
+        """Genera los trozos de [start, end) que estén en RAM, sin concatenarlos."""
+        end = min(end, self.cached_bytes)
+        if start >= end:
+            return
+        idx = bisect_right(self.offsets, start) - 1
+        pos = start
+        while pos < end and idx < len(self.chunks):
+            chunk_start = self.offsets[idx]
+            chunk = self.chunks[idx]
+            lo = pos - chunk_start
+            hi = min(len(chunk), end - chunk_start)
+            yield chunk if (lo == 0 and hi == len(chunk)) else chunk[lo:hi]
+            pos = chunk_start + hi
+            idx += 1
+
+    def read(self, start: int, end: int) -> bytes:
+        return b"".join(self.iter_range(start, end))
+
+
+class SegmentedLRUCache:
+    def __init__(self, max_bytes: int, protected_ratio: float = 0.8):
+        self.max_bytes = max(1, max_bytes)
+        self.protected_max = int(self.max_bytes * protected_ratio)
+        self._probation: OrderedDict[str, RamEntry] = OrderedDict()
+        self._protected: OrderedDict[str, RamEntry] = OrderedDict()
+        self._protected_bytes = 0
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.promotions = 0
+
+    def peek(self, video_id: str) -> RamEntry | None:
+        """Consulta sin contar acceso ni mover la entrada."""
+        return self._protected.get(video_id) or self._probation.get(video_id)
+
+    def get(self, video_id: str) -> RamEntry | None:
+        entry = self._protected.get(video_id)
+        if entry is not None:
+            self._protected.move_to_end(video_id)
+            self.hits += 1
+            return entry
+        entry = self._probation.pop(video_id, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        # Segundo acceso: promoción al segmento protegido
+        self._protected[video_id] = entry
+        self._protected_bytes += entry.size
+        self.promotions += 1
+        self.hits += 1
+        self._rebalance()
+        return entry
+
+    def get_or_create(self, video_id: str, total_size: int, mime_type: str, message_obj=None) -> RamEntry:
+        entry = self.peek(video_id)
+        if entry is None:
+            entry = RamEntry(total_size, mime_type, message_obj)
+            self._probation[video_id] = entry
+            self.used_bytes += entry.size
+        return entry
+
+    def append(self, video_id: str, entry: RamEntry, chunk: bytes) -> None:
+        before = entry.size
+        entry.append(chunk)
+        self._account(video_id, entry.size - before)
+        self._evict(keep=video_id)
+        # Si ni vaciando el resto cabe, recortamos su cola
+        while self.used_bytes > self.max_bytes and entry.chunks:
+            self._account(video_id, -entry.drop_last())
+
+    def _account(self, video_id: str, delta: int) -> None:
+        self.used_bytes += delta
+        if video_id in self._protected:
+            self._protected_bytes += delta
+
+    def _rebalance(self) -> None:
+        # El exceso del segmento protegido vuelve a probation como lo más reciente
+        while self._protected_bytes > self.protected_max and len(self._protected) > 1:
+            video_id, entry = self._protected.popitem(last=False)
+            self._protected_bytes -= entry.size
+            self._probation[video_id] = entry
+
+    def _evict(self, keep: str | None = None) -> None:
+        for segment in (self._probation, self._protected):
+            for video_id in list(segment):
+                if self.used_bytes <= self.max_bytes:
+                    return
+                if video_id == keep:
+                    continue
+                self.remove(video_id, evicted=True)
+
+    def remove(self, video_id: str, evicted: bool = False) -> None:
+        entry = self._probation.pop(video_id, None)
+        if entry is None:
+            entry = self._protected.pop(video_id, None)
+            if entry is None:
+                return
+            self._protected_bytes -= entry.size
+        self.used_bytes -= entry.size
+        if evicted:
+            self.evictions += 1
+            self.evicted_bytes += entry.cached_bytes
+
+    def clear(self) -> int:
+        count = len(self)
+        self._probation.clear()
+        self._protected.clear()
+        self._protected_bytes = 0
+        self.used_bytes = 0
+        return count
+
+    def __len__(self) -> int:
+        return len(self._probation) + len(self._protected)
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "probation_entries": len(self._probation),
+            "protected_entries": len(self._protected),
+            "used_mb": round(self.used_bytes / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "promotions": self.promotions,
+            "evictions": self.evictions,
+            "evicted_mb": round(self.evicted_bytes / 1024 / 1024, 2),
+        }
+
+
+_RAM_CACHE = SegmentedLRUCache(RAM_CACHE_MAX_MB * 1024 * 1024, RAM_CACHE_PROTECTED_RATIO)
 
-# Estructura: 
-# { 
-#   "video_id": {
-#       "data": bytes, 
-#       "total_size": int, 
-#       "mime_type": str,
-#       "message": object  <-- ¡ESTO ES LO NUEVO!
-#    } 
-# }
-_RAM_CACHE = {}
 
 def store_in_ram(video_id: str, data: bytes, total_size: int, mime_type: str, message_obj=None):
     """
-    Guarda el chunk, los metadatos y el objeto mensaje (pasaporte).
+    Guarda el prefijo acumulado, los metadatos y el objeto mensaje (pasaporte).
+    'data' es el buffer desde el byte 0: solo se añade la parte que aún no estaba en RAM.
     """
     if not video_id:
         return
-    
-    # Si ya existe, actualizamos
-    if video_id in _RAM_CACHE:
-        entry = _RAM_CACHE[video_id]
-        
-        # Concatenamos datos si estamos añadiendo más buffer
-        # (OJO: aquí asumimos que 'data' es el buffer acumulado completo, 
-        # como lo hace tu prefetch.py actual. Si fuera solo un chunk nuevo, habría que hacer append).
-        # Dado tu prefetch actual: buffer.extend(chunk) -> store_in_ram(..., bytes(buffer)...)
-        # Significa que 'data' SIEMPRE trae todo lo acumulado.
-        
-        # Solo actualizamos si el nuevo buffer es más grande (progresivo)
-        if len(data) > len(entry["data"]):
-            entry["data"] = data
-            
-        # Si nos pasan el mensaje y no lo teníamos (o para actualizarlo), lo guardamos
-        if message_obj:
-            entry["message"] = message_obj
-
-    else:
-        # Entrada nueva
-        _RAM_CACHE[video_id] = {
-            "data": data,
-            "total_size": total_size,
-            "mime_type": mime_type,
-            "message": message_obj
-        }
 
-def get_from_ram(video_id: str) -> dict | None:
-    """Recupera el objeto completo de la caché."""
+    entry = _RAM_CACHE.get_or_create(video_id, total_size, mime_type, message_obj)
+    if total_size:
+        entry.total_size = total_size
+    if mime_type:
+        entry.mime_type = mime_type
+    if message_obj:
+        entry.message = message_obj
+
+    if data and len(data) > entry.cached_bytes:
+        view = memoryview(data)
+        chunk_size = 1024 * 1024
+        for pos in range(entry.cached_bytes, len(data), chunk_size):
+            _RAM_CACHE.append(video_id, entry, bytes(view[pos:pos + chunk_size]))
+
+
+def append_to_ram(video_id: str, chunk: bytes, offset: int | None = None):
+    """
+    Añade un chunk al final del prefijo cacheado (la entrada debe existir).
+    Con 'offset' solo se añade si el chunk continúa exactamente el prefijo.
+    """
+    if not video_id:
+        return
+    entry = _RAM_CACHE.peek(video_id)
+    if entry is not None and (offset is None or offset == entry.cached_bytes):
+        _RAM_CACHE.append(video_id, entry, chunk)
+
+
+def update_ram_metadata(video_id: str, total_size: int, mime_type: str, message_obj=None):
+    """Completa los metadatos de una entrada ya cacheada (sin tocar los datos)."""
+    entry = _RAM_CACHE.peek(video_id) if video_id else None
+    if entry is None:
+        return
+    entry.total_size = total_size
+    entry.mime_type = mime_type
+    if message_obj:
+        entry.message = message_obj
+
+
+def get_from_ram(video_id: str) -> RamEntry | None:
+    """Recupera la entrada de la caché (cuenta como acceso para la LRU)."""
     return _RAM_CACHE.get(video_id)
 
+
 def clear_ram_cache():
     """Limpia toda la caché."""
-    count = len(_RAM_CACHE)
-    _RAM_CACHE.clear()
+    count = _RAM_CACHE.clear()
     print(f"🧹 [RAM] Caché vaciada. {count} items eliminados.")
 
+
 def get_ram_usage_count():
     """Retorna cuántos videos hay cacheados."""
-    return len(_RAM_CACHE)
\ No newline at end of file
+    return len(_RAM_CACHE)
+
+
+def get_ram_cache_stats() -> dict:
+    return _RAM_CACHE.get_stats()
@@ -0,0 +1,160 @@
+"""
+Lotes de get_messages.
+Las búsquedas de mensajes sueltos se agrupan por (cliente, chat) durante
+MESSAGE_BATCH_WINDOW_MS y salen en una sola llamada de hasta MESSAGE_BATCH_MAX
+ids. Quien conoce los próximos ids (cola de thumbs, prefetch, descargar_dump)
+los pasa como lookahead: viajan en el mismo lote y quedan en una caché corta
+por cliente, así los siguientes pedidos no tocan Telegram.
+La caché es por cliente porque los file_id de un bot no sirven a otro; el
+cliente se identifica por su nombre de sesión (estable aunque el pool de bots
+lo reinicie) y solo se retiene mientras tiene un lote pendiente.
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Iterable
+
+from config import MESSAGE_BATCH_WINDOW_MS, MESSAGE_BATCH_MAX, MESSAGE_BATCH_CACHE_TTL
+
+_CACHE_MAX = 20000
+
+
+class MessageBatcher:
+    def __init__(
+        self,
+        window_ms: int = MESSAGE_BATCH_WINDOW_MS,
+        max_ids: int = MESSAGE_BATCH_MAX,
+        cache_ttl: float = MESSAGE_BATCH_CACHE_TTL,
+    ):
+        self.window = window_ms / 1000
+        self.max_ids = max(1, max_ids)
+        self.cache_ttl = cache_ttl
+        # (clave del cliente, chat_id) -> {message_id: [futures]} (lista vacía = solo lookahead)
+        self._pending: dict[tuple[str, int], dict[int, list[asyncio.Future]]] = {}
+        self._timers: dict[tuple[str, int], asyncio.TimerHandle] = {}
+        # Cliente que hará el get_messages de cada lote pendiente (el último que pidió)
+        self._batch_clients: dict[tuple[str, int], object] = {}
+        self._cache: OrderedDict[tuple[str, int, int], tuple[float, object]] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"requests": 0, "hits": 0, "rpcs": 0, "ids_fetched": 0, "errors": 0}
+
+    # --- CACHÉ ---
+    @staticmethod
+    def _client_key(client) -> str:
+        """Nombre de sesión de pyrogram; id() se reutiliza si un cliente se detiene y se crea otro."""
+        name = getattr(client, "name", None) or getattr(client, "session_name", None)
+        return str(name) if name else f"id:{id(client)}"
+
+    def _cached(self, client_id: str, chat_id: int, message_id: int):
+        key = (client_id, chat_id, message_id)
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.cache_ttl:
+            del self._cache[key]
+            return None
+        return item
+
+    def is_cached(self, client, chat_id: int, message_id: int) -> bool:
+        return client is not None and self._cached(self._client_key(client), chat_id, message_id) is not None
+
+    def invalidate(self, client, chat_id: int, message_id: int) -> None:
+        self._cache.pop((self._client_key(client), chat_id, message_id), None)
+
+    def _store(self, client_id: str, chat_id: int, message_id: int, msg) -> None:
+        self._cache[(client_id, chat_id, message_id)] = (time.monotonic(), msg)
+        while len(self._cache) > _CACHE_MAX:
+            self._cache.popitem(last=False)
+
+    # --- LOTES ---
+    async def get(self, client, chat_id: int, message_id: int, lookahead: Iterable[int] = (), fresh: bool = False):
+        """
+        Mensaje message_id de chat_id vía client, agrupado con otros pedidos del mismo
+        (cliente, chat). lookahead: ids que probablemente se pidan después (se precargan).
+        fresh=True ignora la caché (p. ej. tras FileReferenceExpired).
+        """
+        self.stats["requests"] += 1
+        client_id = self._client_key(client)
+        if fresh:
+            self._cache.pop((client_id, chat_id, message_id), None)
+        else:
+            item = self._cached(client_id, chat_id, message_id)
+            if item is not None:
+                self.stats["hits"] += 1
+                return item[1]
+
+        key = (client_id, chat_id)
+        self._batch_clients[key] = client
+        batch = self._pending.setdefault(key, {})
+        fut = asyncio.get_running_loop().create_future()
+        batch.setdefault(message_id, []).append(fut)
+        for mid in lookahead:
+            if len(batch) >= self.max_ids:
+                break
+            if mid and mid not in batch and self._cached(client_id, chat_id, mid) is None:
+                batch[mid] = []
+
+        if len(batch) >= self.max_ids:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        return await fut
+
+    def _flush(self, key: tuple[str, int]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        client = self._batch_clients.pop(key, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._fetch(client, key[1], batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, client, chat_id: int, batch: dict[int, list[asyncio.Future]]) -> None:
+        ids = list(batch)
+        self.stats["rpcs"] += 1
+        self.stats["ids_fetched"] += len(ids)
+        try:
+            msgs = await client.get_messages(chat_id, ids)
+        except BaseException as e:
+            # FloodWait y compañía llegan a todos los que esperaban este lote
+            self.stats["errors"] += 1
+            for futures in batch.values():
+                for fut in futures:
+                    if not fut.done():
+                        fut.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+
+        if not isinstance(msgs, list):
+            msgs = [msgs]
+        por_id = {getattr(m, "id", None): m for m in msgs if m is not None}
+        client_id = self._client_key(client)
+        for mid, futures in batch.items():
+            msg = por_id.get(mid)
+            self._store(client_id, chat_id, mid, msg)
+            for fut in futures:
+                if not fut.done():
+                    fut.set_result(msg)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "ids_per_rpc": round(self.stats["ids_fetched"] / self.stats["rpcs"], 1) if self.stats["rpcs"] else 0,
+            "cached": len(self._cache),
+            "pending_batches": len(self._pending),
+        }
+
+
+message_batcher = MessageBatcher()
+
+
+async def get_message_batched(client, chat_id: int, message_id: int, lookahead: Iterable[int] = (), fresh: bool = False):
+    return await message_batcher.get(client, chat_id, message_id, lookahead, fresh)
+
+
+def get_message_batcher_stats() -> dict:
+    return message_batcher.get_stats()
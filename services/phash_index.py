@@ -0,0 +1,120 @@
+"""
+Índice en memoria de los pHash de toda la biblioteca (videos visibles con thumb).
+Se carga de thumb_phash64 (INTEGER) y se recarga pasado PHASH_INDEX_TTL o al
+invalidarlo (p. ej. al ocultar duplicados). Las filas que solo tienen el hex
+de thumb_phash se convierten y se guardan en thumb_phash64 al cargar.
+Los grupos por radio de Hamming se calculan en un hilo y quedan en caché por
+distancia hasta la próxima recarga.
+"""
+import time
+import asyncio
+
+from config import PHASH_INDEX_TTL
+from database import get_db, get_read_db, transaction
+from utils.database_helpers import ensure_column
+from utils.phash import phash_to_int, cluster_phashes, hamming_within, numpy_available
+from .single_flight import SingleFlight
+
+try:
+    import numpy as np
+except Exception:
+    np = None  # type: ignore
+
+_LOAD_SQL = """
+    SELECT chat_id, message_id, thumb_phash64, thumb_phash
+    FROM videos_telegram
+    WHERE oculto = 0 AND has_thumb > 0
+      AND thumb_phash IS NOT NULL AND thumb_phash <> ''
+"""
+
+
+class PhashIndex:
+    def __init__(self, ttl: float = PHASH_INDEX_TTL):
+        self.ttl = ttl
+        self._keys: list[tuple[int, int]] = []
+        self._hashes = []
+        self._loaded_at = 0.0
+        self._clusters: dict[int, list[int]] = {}
+        self._flight = SingleFlight("phash_index")
+        self.stats = {"loads": 0, "backfilled": 0, "load_ms": 0, "cluster_runs": 0, "cluster_ms": 0}
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    async def _load(self) -> None:
+        inicio = time.perf_counter()
+        async with get_db() as db:
+            await ensure_column(db, "videos_telegram", "thumb_phash64", "INTEGER")
+
+        keys, hashes, backfill = [], [], []
+        async with get_read_db() as db:
+            async with db.execute(_LOAD_SQL) as cursor:
+                async for chat_id, message_id, h64, hex_ in cursor:
+                    if h64 is None:
+                        h64 = phash_to_int(hex_)
+                        if h64 is None:
+                            continue
+                        backfill.append((h64, chat_id, message_id))
+                    keys.append((int(chat_id), int(message_id)))
+                    hashes.append(int(h64))
+
+        if backfill:
+            async with get_db() as db:
+                async with transaction(db) as cursor:
+                    await cursor.executemany(
+                        "UPDATE videos_telegram SET thumb_phash64 = ? WHERE chat_id = ? AND message_id = ?",
+                        backfill,
+                    )
+            self.stats["backfilled"] += len(backfill)
+            print(f"🧮 [PhashIndex] {len(backfill)} phash convertidos a thumb_phash64")
+
+        self._keys = keys
+        self._hashes = np.array(hashes, dtype=np.int64) if np is not None else hashes
+        self._clusters = {}
+        self._loaded_at = time.monotonic()
+        self.stats["loads"] += 1
+        self.stats["load_ms"] = int((time.perf_counter() - inicio) * 1000)
+
+    async def ensure_loaded(self) -> None:
+        if time.monotonic() - self._loaded_at > self.ttl:
+            await self._flight.do("load", self._load)
+
+    async def clusters(self, max_distance: int, min_size: int = 2) -> list[list[tuple[int, int]]]:
+        """Grupos de (chat_id, message_id) unidos a distancia <= max_distance, de mayor a menor."""
+        await self.ensure_loaded()
+        labels = self._clusters.get(max_distance)
+        if labels is None:
+            inicio = time.perf_counter()
+            labels = await asyncio.to_thread(cluster_phashes, self._hashes, max_distance)
+            self._clusters[max_distance] = labels
+            self.stats["cluster_runs"] += 1
+            self.stats["cluster_ms"] = int((time.perf_counter() - inicio) * 1000)
+
+        grupos: dict[int, list[tuple[int, int]]] = {}
+        for key, label in zip(self._keys, labels):
+            grupos.setdefault(label, []).append(key)
+        out = [g for g in grupos.values() if len(g) >= min_size]
+        out.sort(key=len, reverse=True)
+        return out
+
+    async def neighbors(self, phash: int, max_distance: int) -> list[tuple[int, int]]:
+        """(chat_id, message_id) de los videos a distancia <= max_distance de phash."""
+        await self.ensure_loaded()
+        idxs = await asyncio.to_thread(hamming_within, self._hashes, phash, max_distance)
+        return [self._keys[i] for i in idxs]
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "rows": len(self._keys),
+            "numpy": numpy_available(),
+            "age_s": int(time.monotonic() - self._loaded_at) if self._loaded_at else None,
+            "cached_distances": sorted(self._clusters),
+        }
+
+
+phash_index = PhashIndex()
+
+
+def get_phash_index_stats() -> dict:
+    return phash_index.get_stats()
@@ -3,29 +3,29 @@ Servicio de Pre-carga optimizado con Smart Disk Cache y aiosqlite.
 Descarga 5MB por video y deja que el DiskManager administre el espacio.
 """
 import asyncio
-import aiosqlite 
-import os
-import aiofiles
 from .telegram_client import get_client
-from .memory_cache import store_in_ram, clear_ram_cache
-from .disk_cache import save_to_disk_smart, get_cache_path, touch_file
-from config import DB_PATH, TARGET_VIDEO_CACHE_SIZE, SMART_CACHE_ENABLED
+from .memory_cache import store_in_ram, append_to_ram
+from .disk_cache import save_chunk, has_chunk, cached_prefix_bytes, read_prefix, touch_file, load_disk_cache_index
+from .single_flight import get_message_once
+from .video_streamer import fetch_telegram_chunk
+from config import TARGET_VIDEO_CACHE_SIZE, SMART_CACHE_ENABLED, MESSAGE_BATCH_MAX
+from database.connection import get_read_db
 
 CONCURRENT_LIMIT = 4 
 
 async def prefetch_channel_videos_to_ram(chat_id: int):
     if not SMART_CACHE_ENABLED:
         return
-    # Limpiamos RAM (La RAM es volátil, el Disco es persistente)
-    clear_ram_cache()
+    # La RAM ya no se vacía al cambiar de canal: la LRU con presupuesto desaloja lo menos usado
+    await load_disk_cache_index()
 
     # --- Consulta DB 100% Asíncrona ---
     video_list = []
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with get_read_db() as db:
             async with db.execute("SELECT message_id, id FROM videos_telegram WHERE chat_id = ?", (chat_id,)) as cursor:
                 rows = await cursor.fetchall()
-                video_list = [{'msg_id': r[0], 'vid_id': r[1]} for r in rows]
+                video_list = [{'msg_id': r[0], 'vid_id': r[1], 'idx': i} for i, r in enumerate(rows)]
     except Exception as e:
         print(f"⚠️ Error leyendo DB en prefetch: {e}")
         return
@@ -37,17 +37,19 @@ async def prefetch_channel_videos_to_ram(chat_id: int):
     
     client = get_client()
     sem = asyncio.Semaphore(CONCURRENT_LIMIT)
+    msg_ids = [v['msg_id'] for v in video_list]
     
     async def load_one_video(vid_data):
         async with sem:
             msg_id = vid_data['msg_id']
             vid_id = vid_data['vid_id']
-            disk_path = get_cache_path(vid_id)
+            idx = vid_data['idx']
             
             try:
                 # A. OBTENER METADATOS
-                # Usamos get_messages (Pyrogram cachea esto internamente si ya se vio)
-                msg = await client.get_messages(chat_id, msg_id)
+                # En lote: los próximos mensajes del canal viajan en el mismo get_messages
+                lookahead = msg_ids[idx + 1 : idx + MESSAGE_BATCH_MAX]
+                msg = await get_message_once(client, chat_id, msg_id, lookahead)
                 if not msg: return False
 
                 media = msg.video or msg.document
@@ -57,30 +59,33 @@ async def prefetch_channel_videos_to_ram(chat_id: int):
                 mime_type = getattr(media, "mime_type", "video/mp4") or "video/mp4"
                 
                 # B. VERIFICAR SI YA ESTÁ EN DISCO (CACHE HIT)
-                if os.path.exists(disk_path) and os.path.getsize(disk_path) >= TARGET_VIDEO_CACHE_SIZE:
+                if cached_prefix_bytes(vid_id) >= min(TARGET_VIDEO_CACHE_SIZE, total_size or TARGET_VIDEO_CACHE_SIZE):
                     # Le hacemos "touch" para marcarlo como reciente
                     touch_file(vid_id)
                     
                     # Lo cargamos a RAM para acceso ultra-rápido
-                    async with aiofiles.open(disk_path, mode='rb') as f:
-                        data = await f.read(TARGET_VIDEO_CACHE_SIZE)
-                        store_in_ram(vid_id, data, total_size, mime_type, message_obj=msg)
+                    data = await read_prefix(vid_id, TARGET_VIDEO_CACHE_SIZE)
+                    store_in_ram(vid_id, data, total_size, mime_type, message_obj=msg)
                     return True
 
                 # C. MISS -> DESCARGAR DE TELEGRAM
-                buffer = bytearray()
-                chunks_needed = (TARGET_VIDEO_CACHE_SIZE // (1024*1024)) + 1
-                
-                async for chunk in client.stream_media(msg, limit=chunks_needed):
-                    buffer.extend(chunk)
-                    if len(buffer) >= TARGET_VIDEO_CACHE_SIZE:
-                        break 
-                
-                # Guardamos en DISCO (El gestor borrará otros antiguos si hace falta espacio)
-                await save_to_disk_smart(vid_id, bytes(buffer))
-                
-                # Y también en RAM para esta sesión
-                store_in_ram(vid_id, bytes(buffer), total_size, mime_type, message_obj=msg)
+                # Chunk a chunk y por single-flight: si el reproductor está pidiendo el
+                # mismo chunk a la vez, se comparte la descarga
+                downloaded = 0
+                index = 0
+
+                # En RAM chunk a chunk para esta sesión (sin copiar el buffer acumulado)
+                store_in_ram(vid_id, b"", total_size, mime_type, message_obj=msg)
+                while downloaded < min(TARGET_VIDEO_CACHE_SIZE, total_size or TARGET_VIDEO_CACHE_SIZE):
+                    chunk = await fetch_telegram_chunk(client, msg, vid_id, index)
+                    if not chunk:
+                        break
+                    append_to_ram(vid_id, chunk, offset=downloaded)
+                    # Y en DISCO con el mismo índice de chunk de Telegram (el gestor hace espacio si hace falta)
+                    if not has_chunk(vid_id, index):
+                        await save_chunk(vid_id, index, chunk)
+                    downloaded += len(chunk)
+                    index += 1
                 
                 return True
             except asyncio.CancelledError:
@@ -0,0 +1,76 @@
+"""
+Single-flight: peticiones simultáneas con la misma clave comparten una sola
+llamada en curso en lugar de repetirla contra Telegram.
+Si todos los que esperan se cancelan (seek, navegador cerrado), la llamada
+compartida también se cancela.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from .message_batcher import message_batcher
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "shared": 0, "cancelled": 0}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(k, c))
+            self.stats["calls"] += 1
+        else:
+            self.stats["shared"] += 1
+
+        call.waiters += 1
+        try:
+            # shield: cancelar a un solicitante no cancela la llamada de los demás
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self.stats["cancelled"] += 1
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "in_flight": len(self._calls)}
+
+
+# Mensajes por (chat_id, message_id) y chunks de video por (video_id, n_chunk)
+message_flight = SingleFlight("get_messages")
+chunk_flight = SingleFlight("chunks")
+
+
+async def get_message_once(client, chat_id: int, message_id: int, lookahead: Iterable[int] = ()):
+    """
+    client.get_messages deduplicado: llamadas simultáneas al mismo mensaje comparten resultado.
+    Con lookahead (próximos ids del chat) el pedido sale en lote por message_batcher.
+    """
+    if lookahead:
+        factory = lambda: message_batcher.get(client, chat_id, message_id, lookahead)
+    else:
+        factory = lambda: client.get_messages(chat_id, message_id)
+    return await message_flight.do((chat_id, message_id), factory)
+
+
+def get_single_flight_stats() -> dict:
+    return {
+        "get_messages": message_flight.get_stats(),
+        "chunks": chunk_flight.get_stats(),
+    }
@@ -0,0 +1,229 @@
+"""
+Almacén empaquetado de thumbs (opcional, THUMB_PACK_ENABLED).
+En lugar de un .webp por video, los thumbs se añaden a archivos pack
+(pack_00000.bin, ...) de hasta THUMB_PACK_MAX_MB, y un índice SQLite guarda
+(chat_id, file_unique_id) -> (pack, offset, length).
+Cada registro lleva una cabecera propia, así el índice se puede reconstruir
+escaneando los packs. La lectura es un slice de un mmap del pack.
+Reemplazar un thumb deja los bytes viejos como espacio muerto (append-only).
+"""
+import os
+import mmap
+import struct
+import sqlite3
+import threading
+
+from config import THUMB_PACK_FOLDER, THUMB_PACK_MAX_MB
+
+# Cabecera de registro: magic, chat_id, largo de la clave, largo de los datos
+_RECORD = struct.Struct("<4sqHI")
+_MAGIC = b"TPK1"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS thumbs (
+        chat_id INTEGER NOT NULL,
+        file_unique_id TEXT NOT NULL,
+        pack INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, file_unique_id)
+    ) WITHOUT ROWID
+"""
+
+
+def pack_path(pack: int, folder: str = THUMB_PACK_FOLDER) -> str:
+    return os.path.join(folder, f"pack_{pack:05d}.bin")
+
+
+class ThumbPackStore:
+    def __init__(self, folder: str = THUMB_PACK_FOLDER, max_pack_bytes: int = THUMB_PACK_MAX_MB * 1024 * 1024):
+        self.folder = folder
+        self.max_pack_bytes = max_pack_bytes
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._maps: dict[int, mmap.mmap] = {}
+        self._files: dict[int, object] = {}
+        self._writer = None
+        self._writer_pack = -1
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "remaps": 0}
+
+    # --- APERTURA ---
+    def _open(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.folder, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.folder, "index.db"), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(SCHEMA)
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _open_writer(self, needed: int):
+        """Pack activo para añadir; rota a uno nuevo si no cabe el registro."""
+        if self._writer is None:
+            packs = self.list_packs()
+            self._writer_pack = packs[-1] if packs else 0
+            self._writer = open(pack_path(self._writer_pack, self.folder), "ab")
+        if self._writer.tell() and self._writer.tell() + needed > self.max_pack_bytes:
+            # Lo ya escrito en este pack puede estar en el lote que se indexa a continuación
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+            self._writer_pack += 1
+            self._writer = open(pack_path(self._writer_pack, self.folder), "ab")
+        return self._writer
+
+    def list_packs(self) -> list[int]:
+        if not os.path.isdir(self.folder):
+            return []
+        packs = []
+        for name in os.listdir(self.folder):
+            if name.startswith("pack_") and name.endswith(".bin"):
+                packs.append(int(name[5:-4]))
+        return sorted(packs)
+
+    # --- LECTURA ---
+    def _slice(self, pack: int, offset: int, length: int) -> bytes | None:
+        m = self._maps.get(pack)
+        if m is None or offset + length > len(m):
+            # Primer acceso o el pack creció desde que se mapeó
+            if m is not None:
+                m.close()
+                self.stats["remaps"] += 1
+            f = self._files.get(pack)
+            if f is None:
+                f = open(pack_path(pack, self.folder), "rb")
+                self._files[pack] = f
+            if os.fstat(f.fileno()).st_size < offset + length:
+                return None
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[pack] = m
+        return m[offset:offset + length]
+
+    def get(self, chat_id: int, file_unique_id: str) -> bytes | None:
+        """Bytes del thumb o None si no está empaquetado."""
+        with self._lock:
+            row = self._open().execute(
+                "SELECT pack, offset, length FROM thumbs WHERE chat_id = ? AND file_unique_id = ?",
+                (chat_id, file_unique_id),
+            ).fetchone()
+            data = self._slice(*row) if row else None
+        self.stats["hits" if data is not None else "misses"] += 1
+        return data
+
+    def contains(self, chat_id: int, file_unique_id: str) -> bool:
+        with self._lock:
+            return self._open().execute(
+                "SELECT 1 FROM thumbs WHERE chat_id = ? AND file_unique_id = ?", (chat_id, file_unique_id)
+            ).fetchone() is not None
+
+    def keys(self) -> set[tuple[int, str]]:
+        with self._lock:
+            return set(self._open().execute("SELECT chat_id, file_unique_id FROM thumbs").fetchall())
+
+    # --- ESCRITURA ---
+    def _append(self, chat_id: int, file_unique_id: str, data: bytes) -> tuple:
+        key = file_unique_id.encode("utf-8")
+        header = _RECORD.pack(_MAGIC, chat_id, len(key), len(data))
+        f = self._open_writer(len(header) + len(key) + len(data))
+        start = f.tell()
+        f.write(header)
+        f.write(key)
+        f.write(data)
+        return (chat_id, file_unique_id, self._writer_pack, start + len(header) + len(key), len(data))
+
+    def put_many(self, items: list[tuple[int, str, bytes]]) -> int:
+        """Añade varios thumbs [(chat_id, file_unique_id, webp)] en una sola transacción del índice."""
+        if not items:
+            return 0
+        with self._lock:
+            db = self._open()
+            rows = [self._append(chat_id, uid, data) for chat_id, uid, data in items]
+            # Los datos deben llegar al disco (fsync) antes de que el índice apunte a ellos:
+            # empaquetar_thumbs --borrar elimina los .webp apenas vuelve el commit
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            db.executemany(
+                "INSERT OR REPLACE INTO thumbs (chat_id, file_unique_id, pack, offset, length) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            db.commit()
+        self.stats["writes"] += len(rows)
+        return len(rows)
+
+    def put(self, chat_id: int, file_unique_id: str, data: bytes) -> None:
+        self.put_many([(chat_id, file_unique_id, data)])
+
+    # --- MANTENIMIENTO ---
+    def rebuild_index(self) -> int:
+        """Reconstruye el índice escaneando las cabeceras de todos los packs (el último registro gana)."""
+        with self._lock:
+            db = self._open()
+            db.execute("DELETE FROM thumbs")
+            total = 0
+            for pack in self.list_packs():
+                rows = []
+                with open(pack_path(pack, self.folder), "rb") as f:
+                    while True:
+                        start = f.tell()
+                        header = f.read(_RECORD.size)
+                        if len(header) < _RECORD.size:
+                            break
+                        magic, chat_id, key_len, data_len = _RECORD.unpack(header)
+                        if magic != _MAGIC:
+                            print(f"⚠️ [ThumbPack] Registro corrupto en pack {pack} @ {start}, se ignora el resto.")
+                            break
+                        key = f.read(key_len).decode("utf-8")
+                        offset = start + _RECORD.size + key_len
+                        f.seek(data_len, os.SEEK_CUR)
+                        if f.tell() > os.fstat(f.fileno()).st_size:
+                            break  # Registro truncado (escritura interrumpida)
+                        rows.append((chat_id, key, pack, offset, data_len))
+                db.executemany(
+                    "INSERT OR REPLACE INTO thumbs (chat_id, file_unique_id, pack, offset, length) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                total += len(rows)
+            db.commit()
+        return total
+
+    def close(self) -> None:
+        with self._lock:
+            for m in self._maps.values():
+                m.close()
+            for f in self._files.values():
+                f.close()
+            self._maps.clear()
+            self._files.clear()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            db = self._open()
+            entries, live = db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM thumbs").fetchone()
+        packs = self.list_packs()
+        disk = sum(os.path.getsize(pack_path(p, self.folder)) for p in packs)
+        return {
+            **self.stats,
+            "entries": entries,
+            "packs": len(packs),
+            "live_mb": round(live / 1024 / 1024, 2),
+            "disk_mb": round(disk / 1024 / 1024, 2),
+        }
+
+
+thumb_pack = ThumbPackStore()
+
+
+def get_packed_thumb(chat_id: int, file_unique_id: str) -> bytes | None:
+    return thumb_pack.get(chat_id, file_unique_id)
+
+
+def close_thumb_pack() -> None:
+    thumb_pack.close()
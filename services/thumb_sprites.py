@@ -0,0 +1,148 @@
+"""
+Hojas de sprites de thumbs por página de grilla.
+La página registra sus thumbs y recibe la URL de un sprite y la posición CSS
+de cada tarjeta: el navegador descarga una sola imagen en lugar de una
+petición /api/photo por tarjeta. El sprite se arma al pedirlo (en el pool de
+procesos de utils.thumb_encoder) y queda en una LRU por clave de página.
+"""
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+from config import (
+    THUMB_FOLDER, THUMB_PACK_ENABLED, THUMB_SPRITE_ENABLED, THUMB_SPRITE_COLS,
+    THUMB_SPRITE_TILE_WIDTH, THUMB_SPRITE_QUALITY, THUMB_SPRITE_CACHE_SIZE,
+)
+from database.write_queue import db_enqueue_thumb_ready
+from utils.thumb_encoder import encode_sprite
+from .thumb_pack import thumb_pack
+from .single_flight import SingleFlight
+
+# Páginas registradas recientes (clave -> thumbs) y sprites ya generados (clave -> webp)
+_MAX_PAGES = 256
+_pages: OrderedDict[str, list[tuple[int, str]]] = OrderedDict()
+_sprites: OrderedDict[str, bytes] = OrderedDict()
+_sprite_flight = SingleFlight("sprites")
+_stats = {"registered": 0, "hits": 0, "misses": 0, "built": 0, "unknown": 0}
+
+
+def _tile_size() -> tuple[int, int]:
+    return THUMB_SPRITE_TILE_WIDTH, THUMB_SPRITE_TILE_WIDTH * 9 // 16
+
+
+def _thumb_path(chat_id: int, file_unique_id: str) -> str:
+    return os.path.join(THUMB_FOLDER, str(chat_id), f"{file_unique_id}.webp")
+
+
+def _has_thumb(chat_id: int, file_unique_id: str) -> bool:
+    if THUMB_PACK_ENABLED and thumb_pack.contains(chat_id, file_unique_id):
+        return True
+    return os.path.exists(_thumb_path(chat_id, file_unique_id))
+
+
+def _read_tiles(tiles: list[tuple[int, str]]) -> list[bytes | None]:
+    datos = []
+    for chat_id, uid in tiles:
+        data = thumb_pack.get(chat_id, uid) if THUMB_PACK_ENABLED else None
+        if data is None:
+            try:
+                with open(_thumb_path(chat_id, uid), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+        datos.append(data)
+    return datos
+
+
+def _manifest(key: str, tiles: list[tuple[int, str]]) -> dict:
+    cols = min(THUMB_SPRITE_COLS, len(tiles))
+    rows = -(-len(tiles) // cols)
+    positions = {}
+    for i, (_, uid) in enumerate(tiles):
+        col, row = i % cols, i // cols
+        # background-position en %: 0% = primera celda, 100% = última
+        x = col * 100 / (cols - 1) if cols > 1 else 0
+        y = row * 100 / (rows - 1) if rows > 1 else 0
+        positions[uid] = f"{x:.4f}% {y:.4f}%"
+    return {
+        "key": key,
+        "url": f"/api/thumbs/sprite/{key}.webp",
+        "cols": cols,
+        "rows": rows,
+        "tile": list(_tile_size()),
+        "size": f"{cols * 100}% {rows * 100}%",
+        "positions": positions,
+    }
+
+
+async def register_thumb_sprite(items: list[dict]) -> dict | None:
+    """
+    Registra los thumbs de una página (items con chat_id, video_id, photo_id y has_thumb)
+    y devuelve la URL del sprite con la posición de cada video_id.
+    Solo entran los thumbs que ya están en disco; el resto sigue por /api/photo.
+    """
+    if not THUMB_SPRITE_ENABLED:
+        return None
+    candidatos, vistos = [], set()
+    for item in items:
+        chat_id, uid = item.get("chat_id"), item.get("video_id")
+        if not item.get("photo_id") or chat_id is None or not uid or uid in vistos:
+            continue
+        vistos.add(uid)
+        candidatos.append((int(chat_id), str(uid), item.get("has_thumb")))
+
+    presentes = await asyncio.to_thread(lambda: [c for c in candidatos if _has_thumb(c[0], c[1])])
+    if len(presentes) < 2:
+        return None
+
+    tiles = [(chat_id, uid) for chat_id, uid, _ in presentes]
+    key = hashlib.sha1("|".join(f"{c}:{u}" for c, u in tiles).encode("utf-8")).hexdigest()[:20]
+    _pages[key] = tiles
+    _pages.move_to_end(key)
+    while len(_pages) > _MAX_PAGES:
+        _pages.popitem(last=False)
+    _stats["registered"] += 1
+
+    # Estas tarjetas ya no pasan por /api/photo: la marca has_thumb se encola aquí
+    for _, uid, has_thumb in presentes:
+        if not has_thumb:
+            await db_enqueue_thumb_ready(uid)
+
+    return _manifest(key, tiles)
+
+
+async def _build_sprite(key: str, tiles: list[tuple[int, str]]) -> bytes:
+    datos = await asyncio.to_thread(_read_tiles, tiles)
+    tile_w, tile_h = _tile_size()
+    sprite = await encode_sprite(datos, min(THUMB_SPRITE_COLS, len(tiles)), tile_w, tile_h, THUMB_SPRITE_QUALITY)
+    _sprites[key] = sprite
+    while len(_sprites) > max(1, THUMB_SPRITE_CACHE_SIZE):
+        _sprites.popitem(last=False)
+    _stats["built"] += 1
+    return sprite
+
+
+async def get_thumb_sprite(key: str) -> bytes | None:
+    """WebP del sprite de una página registrada (None si la clave no se conoce)."""
+    sprite = _sprites.get(key)
+    if sprite is not None:
+        _sprites.move_to_end(key)
+        _stats["hits"] += 1
+        return sprite
+    tiles = _pages.get(key)
+    if tiles is None:
+        _stats["unknown"] += 1
+        return None
+    _stats["misses"] += 1
+    # Varias pestañas pidiendo la misma página comparten una sola generación
+    return await _sprite_flight.do(key, lambda: _build_sprite(key, tiles))
+
+
+def get_thumb_sprite_stats() -> dict:
+    return {
+        **_stats,
+        "pages": len(_pages),
+        "cached": len(_sprites),
+        "cached_mb": round(sum(map(len, _sprites.values())) / 1024 / 1024, 2),
+    }
@@ -2,47 +2,88 @@
 Worker Híbrido INTELIGENTE:
 1. Intenta descargar con el BOT (Rápido, sin límites).
 2. Si el Bot no tiene acceso, usa el USERBOT (Lento, modo seguro).
+
+Los pendientes pasan por una cola con prioridad (ThumbQueue): el backlog se lee
+de la BD por páginas (has_thumb = 0, en orden de rowid) y los videos de las
+páginas que se están viendo (canal, /videos, duplicados) se adelantan.
+Un número fijo de workers consume la cola: no hay una tarea por fila.
 """
 import os
+import time
+import heapq
 import asyncio
-import aiosqlite
-from contextlib import AsyncExitStack
-from pyrogram import Client
+import itertools
+from collections import OrderedDict, deque
 from pyrogram.errors import FloodWait, ChannelPrivate, ChatAdminRequired, PeerIdInvalid, FileReferenceExpired
 
-from config import DB_PATH, THUMB_FOLDER, API_ID, API_HASH, BOT_POOL_TOKENS, CACHE_DUMP_VIDEOS_CHANNEL_ID
+from config import (
+    THUMB_FOLDER, BOT_POOL_TOKENS, CACHE_DUMP_VIDEOS_CHANNEL_ID, THUMB_PACK_ENABLED,
+    THUMB_QUEUE_PAGE_SIZE, THUMB_QUEUE_IDLE_SECONDS, MESSAGE_BATCH_MAX,
+)
 from .telegram_client import get_client
+from database.connection import get_read_db
+from database.write_queue import db_enqueue_thumb_ready
+from .thumb_pack import thumb_pack
+from .bot_rate import bot_rates
+from .bot_pool import bot_pool
+from .message_batcher import message_batcher
 
-from utils import save_image_as_webp
+from utils.thumb_encoder import save_thumb_as_webp
 
 # Configuración
 CONCURRENCY_BOT = 10     # El Bot puede ir rápido
 CONCURRENCY_USER = 1     # El Usuario debe ir lento (Modo Seguro)
+PRIORIDAD_VISTA = 0      # Videos de una página abierta
+PRIORIDAD_BACKLOG = 1    # Resto de pendientes
+REFILL_SECONDS = 5       # Con el backlog agotado, cada cuánto se buscan filas nuevas (escaneo en curso)
+PREFER_WAIT = 3          # Segundos que se espera al bot que ya tiene el mensaje precargado
+_RECENT_MAX = 10000
+
+_PENDIENTES_SQL = """
+    SELECT rowid, id, file_unique_id, dump_message_id, chat_id, message_id
+    FROM videos_telegram
+    WHERE has_thumb = 0
+      AND (dump_fail IS NULL OR dump_fail = 0)
+"""
 
-async def _get_videos_pendientes() -> list[tuple]:
-    async with aiosqlite.connect(DB_PATH) as db:
+async def _get_videos_pendientes(after_rowid: int = 0, limit: int = THUMB_QUEUE_PAGE_SIZE) -> list[tuple]:
+    """Página de pendientes con rowid > after_rowid (keyset, sin OFFSET)."""
+    async with get_read_db() as db:
         async with db.execute(
-            """
-            SELECT id, file_unique_id, dump_message_id, chat_id, message_id
-            FROM videos_telegram
-            WHERE has_thumb = 0
-              AND (dump_fail IS NULL OR dump_fail = 0)
-            """
+            _PENDIENTES_SQL + " AND rowid > ? ORDER BY rowid LIMIT ?", (after_rowid, limit)
         ) as cursor:
             return await cursor.fetchall()
 
+async def _get_pendientes_por_id(video_ids: list[str]) -> list[tuple]:
+    filas = []
+    async with get_read_db() as db:
+        for i in range(0, len(video_ids), 500):
+            chunk = video_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            async with db.execute(
+                _PENDIENTES_SQL + f" AND file_unique_id IN ({placeholders})", chunk
+            ) as cursor:
+                filas.extend(await cursor.fetchall())
+    return filas
+
 async def _marcar_listo(video_id):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("UPDATE videos_telegram SET has_thumb = 1 WHERE id = ?", (video_id,))
-            await db.commit()
+        await db_enqueue_thumb_ready(video_id)
     except: pass
 
-async def _descargar_con_cliente(client, chat_id, message_id, file_unique_id, folder, final_path, es_bot=False):
-    """Lógica genérica de descarga para reusar en Bot y User."""
-
-    async def _intentar_descarga():
-        msg = await client.get_messages(chat_id, message_id)
+async def _descargar_con_cliente(
+    client, chat_id, message_id, file_unique_id, folder, final_path, es_bot=False, rate_key=None, lookahead=(),
+):
+    """
+    Lógica genérica de descarga para reusar en Bot y User.
+    Con rate_key (bot del pool) el FloodWait se reporta a bot_rates y devuelve "FLOOD"
+    sin dormir: el trabajo pasa a otro bot y este queda bloqueado en el controlador.
+    El mensaje se pide por message_batcher; lookahead son los próximos message_id del
+    mismo chat, que viajan en el mismo get_messages.
+    """
+
+    async def _intentar_descarga(fresh=False):
+        msg = await message_batcher.get(client, chat_id, message_id, lookahead, fresh=fresh)
         if not msg:
             return False
 
@@ -55,18 +96,12 @@ async def _descargar_con_cliente(client, chat_id, message_id, file_unique_id, fo
         if not thumb:
             return False
 
-        tmp_dir = os.path.join(THUMB_FOLDER, "_tmp")
-        os.makedirs(tmp_dir, exist_ok=True)
-        tmp_path = os.path.join(tmp_dir, f"{chat_id}_{message_id}_{file_unique_id}_{'bot' if es_bot else 'user'}.jpg")
-
-        down_path = await client.download_media(thumb.file_id, file_name=tmp_path)
-        if not down_path:
+        # Descarga en memoria: sin archivo temporal en THUMB_FOLDER/_tmp
+        buffer = await client.download_media(thumb.file_id, in_memory=True)
+        if not buffer:
             return False
 
-        await asyncio.to_thread(save_image_as_webp, down_path, final_path)
-
-        if os.path.exists(down_path):
-            os.remove(down_path)
+        await save_thumb_as_webp(buffer.getvalue(), final_path)
 
         if os.path.exists(final_path) and os.path.getsize(final_path) > 100:
             return True
@@ -76,12 +111,16 @@ async def _descargar_con_cliente(client, chat_id, message_id, file_unique_id, fo
     try:
         res = await _intentar_descarga()
         if res is True:
+            if rate_key is not None:
+                bot_rates.report_success(rate_key)
             return True
     except FileReferenceExpired:
-        # Refrescar file_id reobteniendo el mensaje y reintentando una vez
+        # Refrescar file_id reobteniendo el mensaje (sin caché) y reintentando una vez
         try:
-            res = await _intentar_descarga()
+            res = await _intentar_descarga(fresh=True)
             if res is True:
+                if rate_key is not None:
+                    bot_rates.report_success(rate_key)
                 return True
         except FileReferenceExpired:
             return False
@@ -91,6 +130,9 @@ async def _descargar_con_cliente(client, chat_id, message_id, file_unique_id, fo
         return "SIN_ACCESO"  # Señal para cambiar de estrategia
     except FloodWait as e:
         print(f"⏳ FloodWait ({'BOT' if es_bot else 'USER'}) {e.value}s")
+        if rate_key is not None:
+            bot_rates.report_flood(rate_key, e.value)
+            return "FLOOD"
         await asyncio.sleep(e.value)
         return False
     except Exception:
@@ -98,7 +140,8 @@ async def _descargar_con_cliente(client, chat_id, message_id, file_unique_id, fo
 
     return False
 
-async def _procesar_hibrido(sem_bot, bot_clients, row, idx):
+async def _procesar_hibrido(sem_bot, bot_keys: list[str], row) -> bool | None:
+    """True si el thumb quedó listo, False si falló y None si solo hubo FloodWait (reintentar)."""
     id_video, file_unique_id, dump_message_id, chat_origin, message_id = row
     folder = os.path.join(THUMB_FOLDER, str(chat_origin))
     final_path = os.path.join(folder, f"{file_unique_id}.webp")
@@ -108,14 +151,32 @@ async def _procesar_hibrido(sem_bot, bot_clients, row, idx):
     # Si ya existe, saltar
     if os.path.exists(final_path) and os.path.getsize(final_path) > 1000:
         await _marcar_listo(id_video)
-        return
+        return True
+    if THUMB_PACK_ENABLED and await asyncio.to_thread(thumb_pack.contains, chat_origin, file_unique_id):
+        await _marcar_listo(id_video)
+        return True
 
     # Si tenemos dump_message_id (>0) usamos los bots contra el canal de dump
-    if dump_message_id and dump_message_id > 0 and bot_clients:
-        start_at = idx % len(bot_clients)
-        ordered_bots = bot_clients[start_at:] + bot_clients[:start_at]
-
-        for bot_client in ordered_bots:
+    if dump_message_id and dump_message_id > 0 and bot_keys:
+        # Cada intento va al bot con más margen según bot_rates; uno que falla no se repite.
+        # Si un bot ya precargó este mensaje en un lote, se le da preferencia un momento
+        lookahead = thumb_queue.peek_dump_ids()
+        pendientes = list(bot_keys)
+        floods = 0
+        while pendientes:
+            key = None
+            preferidos = [
+                k for k in pendientes
+                if message_batcher.is_cached(bot_pool.peek(k), CACHE_DUMP_VIDEOS_CHANNEL_ID, dump_message_id)
+            ]
+            if preferidos:
+                key = await bot_rates.acquire(preferidos, max_wait=PREFER_WAIT)
+            if key is None:
+                key = await bot_rates.acquire(pendientes)
+            pendientes.remove(key)
+            bot_client = await bot_pool.get(key)
+            if bot_client is None:
+                continue
             async with sem_bot:
                 res = await _descargar_con_cliente(
                     bot_client,
@@ -125,15 +186,19 @@ async def _procesar_hibrido(sem_bot, bot_clients, row, idx):
                     folder,
                     final_path,
                     es_bot=True,
+                    rate_key=key,
+                    lookahead=lookahead,
                 )
 
             if res is True:
                 await _marcar_listo(id_video)
                 print(f"🤖 [BOT] Thumb OK: {file_unique_id}")
-                return
+                return True
+            if res == "FLOOD":
+                floods += 1
 
         # Si llega acá, fallaron todos los bots para este dump_message_id.
-        return
+        return None if floods == len(bot_keys) else False
 
     # Sin dump_message_id: usar userbot directo al chat original
     try:
@@ -154,49 +219,270 @@ async def _procesar_hibrido(sem_bot, bot_clients, row, idx):
         if res is True:
             await _marcar_listo(id_video)
             print(f"👤 [USER] Thumb OK: {file_unique_id}")
+            return True
     except Exception as e:
         print(f"⚠️ [USER] No se pudo descargar thumb {file_unique_id}: {e}")
+    return False
 
-async def background_thumb_downloader():
-    print("🚀 Iniciando Worker Híbrido (Bot + User)...")
-    try:
-        filas = await _get_videos_pendientes()
-        if not filas:
-            print("✅ No hay pendientes.")
-            return
-        
-        async with AsyncExitStack() as stack:
-            bot_clients: list[Client] = []
-            for i, token in enumerate(BOT_POOL_TOKENS, start=1):
-                try:
-                    bot_client = Client(
-                        f"worker_bot_{i}",
-                        api_id=API_ID,
-                        api_hash=API_HASH,
-                        bot_token=token,
-                        in_memory=True,
-                        no_updates=True,
-                    )
-                    await stack.enter_async_context(bot_client)
-                    bot_clients.append(bot_client)
-                except Exception as e:
-                    print(f"⚠️ [BOT {i}] No pudo iniciar: {e}")
-
-            if not bot_clients:
+class ThumbQueue:
+    """
+    Cola de thumbs pendientes con prioridad.
+    Heap de (prioridad, secuencia, fila); _queued guarda la mejor prioridad de cada
+    (chat_id, message_id) para deduplicar y descartar entradas viejas del heap.
+    El backlog se pide a la BD por páginas cuando la cola baja de media página.
+    Una pasada (run) toma los bots del pool persistente, la consumen N workers
+    y termina tras THUMB_QUEUE_IDLE_SECONDS sin trabajo (los bots siguen conectados).
+    """
+
+    def __init__(self, page_size: int = THUMB_QUEUE_PAGE_SIZE, idle_seconds: int = THUMB_QUEUE_IDLE_SECONDS):
+        self.page_size = max(1, page_size)
+        self.idle_seconds = idle_seconds
+        self._heap: list[tuple[int, int, tuple]] = []
+        self._queued: dict[tuple[int, int], int] = {}
+        self._in_flight: set[tuple[int, int]] = set()
+        self._failed: set[tuple[int, int]] = set()
+        # Hechos hace poco: la marca has_thumb puede no estar confirmada todavía en la BD
+        self._recent: OrderedDict[tuple[int, int], None] = OrderedDict()
+        self._seq = itertools.count()
+        self._cursor = 0
+        self._exhausted = False
+        self._last_fill = 0.0
+        self._fill_lock: asyncio.Lock | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._workers = 0
+        self._drained = False
+        self._done_times: deque[float] = deque()
+        self.stats = {"runs": 0, "done": 0, "failed": 0, "prioritized": 0, "pages": 0}
+
+    @staticmethod
+    def _key(row: tuple) -> tuple[int, int]:
+        return (row[3], row[4])
+
+    # --- COLA ---
+    def _push(self, row: tuple, prioridad: int) -> bool:
+        key = self._key(row)
+        if key in self._in_flight or key in self._failed or key in self._recent:
+            return False
+        actual = self._queued.get(key)
+        if actual is not None and actual <= prioridad:
+            return False
+        self._queued[key] = prioridad
+        heapq.heappush(self._heap, (prioridad, next(self._seq), row))
+        return True
+
+    def _pop(self) -> tuple | None:
+        while self._heap:
+            prioridad, _, row = heapq.heappop(self._heap)
+            key = self._key(row)
+            if self._queued.get(key) != prioridad:
+                continue  # Entrada superada por una de mayor prioridad
+            del self._queued[key]
+            return row
+        return None
+
+    def peek_dump_ids(self, n: int = MESSAGE_BATCH_MAX) -> list[int]:
+        """dump_message_id de las próximas filas de la cola (para precargar sus mensajes en lote)."""
+        ids = []
+        for prioridad, _, row in heapq.nsmallest(n, self._heap):
+            if row[2] and row[2] > 0 and self._queued.get(self._key(row)) == prioridad:
+                ids.append(row[2])
+        return ids
+
+    async def _fill(self) -> None:
+        """Carga la siguiente página del backlog si la cola está baja."""
+        async with self._fill_lock:
+            if self._exhausted or len(self._queued) >= self.page_size // 2:
+                return
+            self._last_fill = time.monotonic()
+            try:
+                filas = await _get_videos_pendientes(self._cursor, self.page_size)
+            except Exception as e:
+                print(f"⚠️ [ThumbQueue] Error leyendo pendientes: {e}")
+                self._exhausted = True
+                return
+            self.stats["pages"] += 1
+            if len(filas) < self.page_size:
+                self._exhausted = True
+            for fila in filas:
+                self._cursor = fila[0]
+                self._push(tuple(fila[1:]), PRIORIDAD_BACKLOG)
+
+    async def _next_row(self) -> tuple | None:
+        idle_desde = time.monotonic()
+        while True:
+            if not self._exhausted and len(self._queued) < self.page_size // 2:
+                await self._fill()
+            row = self._pop()
+            if row is not None:
+                return row
+            if time.monotonic() - idle_desde >= self.idle_seconds:
+                return None
+            self._wakeup.clear()
+            if self._heap:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), REFILL_SECONDS)
+            except asyncio.TimeoutError:
+                # Volver a mirar la BD: el escaneo de un canal puede haber insertado filas nuevas
+                if time.monotonic() - self._last_fill >= REFILL_SECONDS:
+                    self._exhausted = False
+
+    # --- EJECUCIÓN ---
+    async def _worker(self, sem_bot, bot_keys: list[str]) -> None:
+        while True:
+            row = await self._next_row()
+            if row is None:
+                return
+            key = self._key(row)
+            self._in_flight.add(key)
+            try:
+                ok = await _procesar_hibrido(sem_bot, bot_keys, row)
+            except Exception:
+                ok = False
+            finally:
+                self._in_flight.discard(key)
+            if ok is None:
+                # Todos los bots en FloodWait: vuelve a la cola; acquire() esperará al primero libre
+                self._push(row, PRIORIDAD_BACKLOG)
+            elif ok:
+                self.stats["done"] += 1
+                self._done_times.append(time.monotonic())
+                self._recent[key] = None
+                if len(self._recent) > _RECENT_MAX:
+                    self._recent.popitem(last=False)
+            else:
+                # No se reintenta en esta pasada (ni aunque la página se vuelva a ver)
+                self.stats["failed"] += 1
+                self._failed.add(key)
+
+    async def _run(self) -> None:
+        print("🚀 Iniciando Worker Híbrido (Bot + User)...")
+        self._cursor, self._exhausted = 0, False
+        self._failed.clear()
+        self._drained = False
+        self.stats["runs"] += 1
+        try:
+            await self._fill()
+            if not self._heap:
+                print("✅ No hay pendientes.")
+                return
+
+            # Pool persistente: tras la primera pasada los bots ya están conectados
+            bot_keys = list(await bot_pool.start_all())
+            if not bot_keys:
                 print("❌ No hay bots disponibles para descargar thumbs.")
                 return
 
-            sem_bot = asyncio.Semaphore(CONCURRENCY_BOT * len(bot_clients))
+            self._workers = CONCURRENCY_BOT * len(bot_keys)
+            sem_bot = asyncio.Semaphore(self._workers)
+            await asyncio.gather(*(self._worker(sem_bot, bot_keys) for _ in range(self._workers)))
+            self._drained = True
+
+            bot_rates.save()
+            print(f"🏁 Worker Híbrido finalizado ({self.stats['done']} ok, {self.stats['failed']} fallidos).")
+        except asyncio.CancelledError:
+            # Salir silenciosamente en apagados del servidor o cancelaciones explícitas
+            print("⚠️ Worker Híbrido cancelado.")
+        except Exception as e:
+            print(f"❌ Worker Híbrido error: {e}")
+        finally:
+            self._workers = 0
+
+    def _on_run_done(self, task: asyncio.Task) -> None:
+        # Prioridades que llegaron mientras la pasada terminaba
+        if self._drained and self._heap:
+            self.ensure_running()
+
+    def ensure_running(self) -> asyncio.Task | None:
+        """Arranca una pasada si no hay una en curso (sin bots configurados no hace nada)."""
+        if not BOT_POOL_TOKENS:
+            return None
+        if self._task is None or self._task.done():
+            if self._fill_lock is None:
+                self._fill_lock = asyncio.Lock()
+                self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._on_run_done)
+        return self._task
+
+    async def run(self) -> None:
+        """Arranca o se suma a la pasada en curso y espera a que termine."""
+        task = self.ensure_running()
+        if task is not None:
+            # shield: cancelar a quien espera no corta la pasada compartida
+            await asyncio.shield(task)
+
+    def prioritize(self, filas: list[tuple]) -> int:
+        n = sum(self._push(tuple(fila[1:]), PRIORIDAD_VISTA) for fila in filas)
+        if n:
+            self.stats["prioritized"] += n
+            if self._wakeup is not None:
+                self._wakeup.set()
+            self.ensure_running()
+        return n
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> dict:
+        ahora = time.monotonic()
+        while self._done_times and ahora - self._done_times[0] > 60:
+            self._done_times.popleft()
+        return {
+            **self.stats,
+            "running": self._task is not None and not self._task.done(),
+            "workers": self._workers,
+            "queued": len(self._queued),
+            "queued_priority": sum(1 for p in self._queued.values() if p == PRIORIDAD_VISTA),
+            "in_flight": len(self._in_flight),
+            "failed_this_run": len(self._failed),
+            "throughput_per_min": len(self._done_times),
+            "backlog_cursor": self._cursor,
+            "backlog_exhausted": self._exhausted,
+        }
+
+
+thumb_queue = ThumbQueue()
+_prioritize_tasks: set[asyncio.Task] = set()
+
+
+async def background_thumb_downloader():
+    """Procesa los thumbs pendientes (se suma a la pasada en curso si ya hay una)."""
+    await thumb_queue.run()
 
-            tasks = []
-            for idx, row in enumerate(filas):
-                tasks.append(_procesar_hibrido(sem_bot, bot_clients, row, idx))
 
-            await asyncio.gather(*tasks)
-        
-        print("🏁 Worker Híbrido finalizado.")
-    except asyncio.CancelledError:
-        # Salir silenciosamente en apagados del servidor o cancelaciones explícitas
-        print("⚠️ Worker Híbrido cancelado.")
+async def prioritize_thumbs(video_ids: list[str]) -> int:
+    """Adelanta en la cola los pendientes de estos file_unique_id. Devuelve cuántos se encolaron."""
+    ids = list(dict.fromkeys(v for v in video_ids if v))
+    if not ids:
+        return 0
+    try:
+        return thumb_queue.prioritize(await _get_pendientes_por_id(ids))
     except Exception as e:
-        print(f"❌ Worker Híbrido error: {e}")
\ No newline at end of file
+        print(f"⚠️ [ThumbQueue] No se pudo priorizar: {e}")
+        return 0
+
+
+def prioritize_page_thumbs(items: list[dict]) -> None:
+    """Desde una página: adelanta en 2do plano los thumbs que faltan (items con video_id y has_thumb)."""
+    ids = [item.get("video_id") for item in items if not item.get("has_thumb")]
+    if not any(ids) or not BOT_POOL_TOKENS:
+        return
+    task = asyncio.create_task(prioritize_thumbs(ids[:THUMB_QUEUE_PAGE_SIZE]))
+    _prioritize_tasks.add(task)
+    task.add_done_callback(_prioritize_tasks.discard)
+
+
+def get_thumb_queue_stats() -> dict:
+    return thumb_queue.get_stats()
+
+
+async def stop_thumb_queue() -> None:
+    """Cancela la pasada en curso (hook de shutdown)."""
+    await thumb_queue.stop()
@@ -1,9 +1,7 @@
 import json
 from typing import Optional
 
-import aiosqlite
-
-from config import DB_PATH
+from database.connection import get_read_db
 from database.videos import (
     db_add_video_file_id,
     db_upsert_video,
@@ -12,10 +10,15 @@ from database.videos import (
     db_bulk_upsert_video_messages,
     db_bulk_add_video_file_ids,
 )
+from database.write_queue import (
+    db_enqueue_video,
+    db_enqueue_video_file_id,
+    db_enqueue_video_message,
+)
 
 
 async def existe_video_en_bd(file_unique_id: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         async with db.execute(
             "SELECT 1 FROM videos_telegram WHERE file_unique_id = ? LIMIT 1",
             (file_unique_id,),
@@ -25,7 +28,7 @@ async def existe_video_en_bd(file_unique_id: str) -> bool:
 
 
 async def existe_mensaje_en_bd(chat_id: int, message_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         async with db.execute(
             "SELECT 1 FROM video_messages WHERE chat_id = ? AND message_id = ? LIMIT 1",
             (chat_id, message_id),
@@ -34,6 +37,78 @@ async def existe_mensaje_en_bd(chat_id: int, message_id: int) -> bool:
             return row is not None
 
 
+def _datos_desde_mensaje(message, origen: str = "generic") -> tuple[dict, dict, tuple]:
+    """Construye (video_data, message_data, fila de file_id) a partir de un mensaje de Pyrogram."""
+    video = message.video
+    unique_id = video.file_unique_id
+
+    video_data = {
+        "file_unique_id": unique_id,
+        "chat_id": message.chat.id,
+        "message_id": message.id,
+        "file_id": video.file_id,
+        "nombre": video.file_name or f"vid_{message.id}.mp4",
+        "caption": message.caption,
+        "tamano_bytes": video.file_size,
+        "fecha_mensaje": message.date.isoformat() if message.date else None,
+        "duracion": video.duration or 0,
+        "ancho": video.width or 0,
+        "alto": video.height or 0,
+        "mime_type": video.mime_type,
+        "views": message.views or 0,
+        "outgoing": message.outgoing,
+    }
+
+    from_user = getattr(message, "from_user", None)
+    forward_from_chat = getattr(message, "forward_from_chat", None)
+
+    message_data = {
+        "video_id": unique_id,
+        "chat_id": message.chat.id,
+        "message_id": message.id,
+        "date": message.date.isoformat() if message.date else None,
+        "from_user": {
+            "id": getattr(from_user, "id", None),
+            "username": getattr(from_user, "username", None),
+            "is_bot": getattr(from_user, "is_bot", None),
+        } if from_user else {},
+        "media": "video",
+        "views": message.views or 0,
+        "forwards": message.forwards or 0,
+        "outgoing": message.outgoing,
+        "reply_to_message_id": getattr(message, "reply_to_message_id", None),
+        "forward_from_chat": {
+            "id": getattr(forward_from_chat, "id", None),
+            "title": getattr(forward_from_chat, "title", None),
+        } if forward_from_chat else {},
+        "forward_from_message_id": getattr(message, "forward_from_message_id", None),
+        "forward_date": (
+            message.forward_date.isoformat() if getattr(message, "forward_date", None) else None
+        ),
+        "caption": message.caption,
+    }
+
+    return video_data, message_data, (unique_id, video.file_id, unique_id, origen)
+
+
+async def encolar_mensajes_video(messages: list, origen: str = "generic") -> int:
+    """
+    Envía los mensajes de video a la cola de escritura única (write-behind).
+    No espera al commit: usar db_flush_writes() cuando se necesite leer lo escrito.
+    Retorna cuántos mensajes se encolaron.
+    """
+    encolados = 0
+    for message in messages:
+        if not message.video:
+            continue
+        video_data, message_data, file_id_row = _datos_desde_mensaje(message, origen)
+        await db_enqueue_video(video_data)
+        await db_enqueue_video_file_id(*file_id_row)
+        await db_enqueue_video_message(message_data)
+        encolados += 1
+    return encolados
+
+
 async def procesar_mensajes_video_batch(messages: list, origen: str = "generic") -> list[dict]:
     """
     Procesa múltiples mensajes de video en batch para reducir overhead de DB.
@@ -43,7 +118,7 @@ async def procesar_mensajes_video_batch(messages: list, origen: str = "generic")
         return []
 
     resultados = []
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_read_db() as db:
         # Pre-cargar existencia de videos y mensajes en una sola query
         unique_ids = [m.video.file_unique_id for m in messages if m.video]
         chat_msg_pairs = [(m.chat.id, m.id) for m in messages if m.video]
@@ -87,55 +162,10 @@ async def procesar_mensajes_video_batch(messages: list, origen: str = "generic")
             video_existia = unique_id in videos_existentes
             mensaje_existia = (message.chat.id, message.id) in mensajes_existentes
 
-            video_data = {
-                "file_unique_id": unique_id,
-                "chat_id": message.chat.id,
-                "message_id": message.id,
-                "file_id": video.file_id,
-                "nombre": video.file_name or f"vid_{message.id}.mp4",
-                "caption": message.caption,
-                "tamano_bytes": video.file_size,
-                "fecha_mensaje": message.date.isoformat() if message.date else None,
-                "duracion": video.duration or 0,
-                "ancho": video.width or 0,
-                "alto": video.height or 0,
-                "mime_type": video.mime_type,
-                "views": message.views or 0,
-                "outgoing": message.outgoing,
-            }
+            video_data, message_data, file_id_row = _datos_desde_mensaje(message, origen)
             videos_batch.append(video_data)
-
-            from_user = getattr(message, "from_user", None)
-            forward_from_chat = getattr(message, "forward_from_chat", None)
-
-            message_data = {
-                "video_id": unique_id,
-                "chat_id": message.chat.id,
-                "message_id": message.id,
-                "date": message.date.isoformat() if message.date else None,
-                "from_user": {
-                    "id": getattr(from_user, "id", None),
-                    "username": getattr(from_user, "username", None),
-                    "is_bot": getattr(from_user, "is_bot", None),
-                } if from_user else {},
-                "media": "video",
-                "views": message.views or 0,
-                "forwards": message.forwards or 0,
-                "outgoing": message.outgoing,
-                "reply_to_message_id": getattr(message, "reply_to_message_id", None),
-                "forward_from_chat": {
-                    "id": getattr(forward_from_chat, "id", None),
-                    "title": getattr(forward_from_chat, "title", None),
-                } if forward_from_chat else {},
-                "forward_from_message_id": getattr(message, "forward_from_message_id", None),
-                "forward_date": (
-                    message.forward_date.isoformat() if getattr(message, "forward_date", None) else None
-                ),
-                "caption": message.caption,
-            }
             messages_batch.append(message_data)
-            
-            file_ids_batch.append((unique_id, video.file_id, unique_id, origen))
+            file_ids_batch.append(file_id_row)
 
             resultados.append({
                 "procesado": True,
@@ -179,60 +209,12 @@ async def procesar_mensaje_video(message, origen: str = "generic", incluir_raw_j
     video_existia = await existe_video_en_bd(unique_id)
     mensaje_existia = await existe_mensaje_en_bd(message.chat.id, message.id)
 
-    video_data = {
-        "file_unique_id": unique_id,
-        "chat_id": message.chat.id,
-        "message_id": message.id,
-        "file_id": video.file_id,
-        "nombre": video.file_name or f"vid_{message.id}.mp4",
-        "caption": message.caption,
-        "tamano_bytes": video.file_size,
-        "fecha_mensaje": message.date.isoformat() if message.date else None,
-        "duracion": video.duration or 0,
-        "ancho": video.width or 0,
-        "alto": video.height or 0,
-        "mime_type": video.mime_type,
-        "views": message.views or 0,
-        "outgoing": message.outgoing,
-    }
+    video_data, message_data, _ = _datos_desde_mensaje(message)
 
     try:
         await db_upsert_video(video_data)
         await db_add_video_file_id(unique_id, video.file_id, unique_id, origen=origen)
 
-        from_user = getattr(message, "from_user", None)
-        forward_from_chat = getattr(message, "forward_from_chat", None)
-
-        message_data = {
-            "video_id": unique_id,
-            "chat_id": message.chat.id,
-            "message_id": message.id,
-            "date": message.date.isoformat() if message.date else None,
-            "from_user": {
-                "id": getattr(from_user, "id", None),
-                "username": getattr(from_user, "username", None),
-                "is_bot": getattr(from_user, "is_bot", None),
-            }
-            if from_user
-            else {},
-            "media": "video",
-            "views": message.views or 0,
-            "forwards": message.forwards or 0,
-            "outgoing": message.outgoing,
-            "reply_to_message_id": getattr(message, "reply_to_message_id", None),
-            "forward_from_chat": {
-                "id": getattr(forward_from_chat, "id", None),
-                "title": getattr(forward_from_chat, "title", None),
-            }
-            if forward_from_chat
-            else {},
-            "forward_from_message_id": getattr(message, "forward_from_message_id", None),
-            "forward_date": (
-                message.forward_date.isoformat() if getattr(message, "forward_date", None) else None
-            ),
-            "caption": message.caption,
-        }
-
         if incluir_raw_json:
             try:
                 msg_dict = json.loads(str(message))
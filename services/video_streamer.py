@@ -3,12 +3,76 @@ Servicio de streaming híbrido TOTAL: Disco Cacheado -> RAM -> Telegram.
 Versión CORREGIDA: Manejo de desconexiones (asyncio.CancelledError).
 """
 import os
+import math
+import time
 import asyncio
-import aiofiles
+from contextlib import aclosing
 from .telegram_client import ensure_connected, reconnect_client
-from .memory_cache import get_from_ram, store_in_ram
-from .disk_cache import get_cache_path, touch_file
-from config import SMART_CACHE_ENABLED
+from .memory_cache import get_from_ram, store_in_ram, update_ram_metadata, append_to_ram
+from .disk_cache import cached_prefix_bytes, read_prefix, touch_file, has_chunk, read_chunk, save_chunk
+from .single_flight import chunk_flight, get_message_once
+from config import SMART_CACHE_ENABLED, CHUNK_SIZE, STREAM_READAHEAD_MIN, STREAM_READAHEAD_MAX, STREAM_GLOBAL_FETCH_LIMIT
+from utils.file_response import iter_file_range
+
+# Escrituras a disco en curso (referencia fuerte para que no las recoja el GC)
+_pending_disk_writes: set[asyncio.Task] = set()
+
+# Tope global de chunks pidiéndose a Telegram a la vez (todos los streams)
+_global_fetch_sem = asyncio.Semaphore(STREAM_GLOBAL_FETCH_LIMIT)
+
+
+class ReadAheadWindow:
+    """
+    Ventana de read-ahead adaptativa.
+    Con la latencia media de un chunk (L) y el ritmo al que el cliente consume (I),
+    hacen falta ~L/I chunks en vuelo para que el siguiente esté listo al pedirlo.
+    """
+    _shared_latency = 0.0  # EWMA global: la latencia al DC es común a todos los streams
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.interval = 0.0
+
+    @classmethod
+    def record_latency(cls, seconds: float, alpha: float = 0.3) -> None:
+        cls._shared_latency = seconds if not cls._shared_latency else (
+            alpha * seconds + (1 - alpha) * cls._shared_latency
+        )
+
+    def record_interval(self, seconds: float) -> None:
+        self.interval = seconds if not self.interval else (
+            self.alpha * seconds + (1 - self.alpha) * self.interval
+        )
+
+    @property
+    def size(self) -> int:
+        latency = ReadAheadWindow._shared_latency
+        if not latency or not self.interval:
+            return STREAM_READAHEAD_MIN
+        wanted = math.ceil(latency / max(self.interval, 1e-3)) + 1
+        return max(STREAM_READAHEAD_MIN, min(STREAM_READAHEAD_MAX, wanted))
+
+async def fetch_telegram_chunk(client, message, video_id: str | None, index: int) -> bytes:
+    """
+    Baja un único chunk (CHUNK_SIZE) de Telegram.
+    Con video_id, las peticiones simultáneas del mismo chunk (varios Range del
+    navegador, prefetch) comparten una sola descarga.
+    """
+    async def _download() -> bytes:
+        async with _global_fetch_sem:
+            started = time.monotonic()
+            data = b""
+            async with aclosing(client.stream_media(message, offset=index, limit=1)) as stream:
+                async for chunk in stream:
+                    data = chunk
+                    break
+            ReadAheadWindow.record_latency(time.monotonic() - started)
+            return data
+
+    if not video_id:
+        return await _download()
+    return await chunk_flight.do((video_id, index), _download)
+
 
 class TelegramVideoSender:
     def __init__(self, client, chat_id: int, message_id: int, video_id: str = None, local_path: str = None):
@@ -32,31 +96,32 @@ class TelegramVideoSender:
             return
 
         # 2. SMART CACHE (Disco Parcial)
-        # Revisamos si existe el archivo de caché generado automáticamente
-        smart_path = get_cache_path(self.video_id) if self.video_id else None
-        
-        if SMART_CACHE_ENABLED and smart_path and os.path.exists(smart_path):
-            touch_file(self.video_id) # Marcar como usado para que no se borre
-            # Cargamos ese pedazo a RAM al vuelo para usarlo
-            try:
-                async with aiofiles.open(smart_path, mode='rb') as f:
-                    data = await f.read()
+        # Revisamos si hay un prefijo cacheado por chunks (solo si la RAM aún no lo tiene)
+        if SMART_CACHE_ENABLED and self.video_id:
+            disk_bytes = cached_prefix_bytes(self.video_id)
+            ram_entry = get_from_ram(self.video_id)
+            ram_bytes = ram_entry.cached_bytes if ram_entry else 0
+            if disk_bytes > ram_bytes:
+                touch_file(self.video_id) # Marcar como usado para que no se borre
+                # Cargamos ese pedazo a RAM al vuelo para usarlo
+                try:
+                    data = await read_prefix(self.video_id, disk_bytes)
                     # Guardamos en RAM temporalmente (sin metadatos aún, se actualizarán)
                     store_in_ram(self.video_id, data, 0, "", None)
-            except Exception as e:
-                print(f"⚠️ Error leyendo SmartCache: {e}")
+                except Exception as e:
+                    print(f"⚠️ Error leyendo SmartCache: {e}")
 
         # 3. RAM CACHE
         if self.video_id:
             cached = get_from_ram(self.video_id)
             if cached:
                 # Si tiene metadatos completos, usamos la RAM
-                if cached.get('total_size', 0) > 0 and cached.get('message'):
-                     self.total_size = cached['total_size']
-                     self.mime_type = cached['mime_type']
-                     self.message = cached['message']
+                if cached.total_size > 0 and cached.message:
+                     self.total_size = cached.total_size
+                     self.mime_type = cached.mime_type
+                     self.message = cached.message
                      
-                     ram_size = len(cached['data'])
+                     ram_size = cached.cached_bytes
                      if ram_size >= self.total_size:
                          self.is_fully_cached = True
                          print(f"🧠 [Stream] Video 100% en CACHE. Telegram OFF.")
@@ -72,7 +137,7 @@ class TelegramVideoSender:
         for attempt in range(max_retries):
             try:
                 await ensure_connected()
-                self.message = await self.client.get_messages(self.chat_id, self.message_id)
+                self.message = await get_message_once(self.client, self.chat_id, self.message_id)
                 if self.message:
                     media = self.message.video or self.message.document
                     if not media:
@@ -82,9 +147,8 @@ class TelegramVideoSender:
                     self.mime_type = getattr(media, "mime_type", "video/mp4") or "video/mp4"
                     
                     # ACTUALIZAR CACHE CON METADATOS
-                    if self.video_id and get_from_ram(self.video_id):
-                        cached = get_from_ram(self.video_id)
-                        store_in_ram(self.video_id, cached['data'], self.total_size, self.mime_type, self.message)
+                    if self.video_id:
+                        update_ram_metadata(self.video_id, self.total_size, self.mime_type, self.message)
                     
                     print(f" [Stream] Setup LENTO desde TELEGRAM (ID: {self.message_id})")
                     print(f"☁️ [Stream] Setup LENTO desde TELEGRAM (ID: {self.message_id})")
@@ -98,6 +162,94 @@ class TelegramVideoSender:
                 raise e
         if last_error: raise last_error
 
+    def _is_complete_chunk(self, index: int, data: bytes | None) -> bool:
+        """Un chunk cacheado vale si está entero (o es el último del archivo)."""
+        if not data:
+            return False
+        return len(data) == CHUNK_SIZE or index * CHUNK_SIZE + len(data) >= self.total_size
+
+    async def _read_cached_chunk(self, index: int) -> bytes | None:
+        if not (SMART_CACHE_ENABLED and self.video_id):
+            return None
+        data = await read_chunk(self.video_id, index)
+        return data if self._is_complete_chunk(index, data) else None
+
+    def _write_through(self, index: int, data: bytes) -> None:
+        """Guarda en RAM (si extiende el prefijo) y en disco un chunk recién bajado de Telegram."""
+        if not (SMART_CACHE_ENABLED and self.video_id) or not self._is_complete_chunk(index, data):
+            return
+        offset = index * CHUNK_SIZE
+        if offset == 0 and not get_from_ram(self.video_id):
+            store_in_ram(self.video_id, data, self.total_size, self.mime_type, self.message)
+        else:
+            append_to_ram(self.video_id, data, offset=offset)
+        if has_chunk(self.video_id, index):
+            return  # Otro stream que compartió la descarga ya lo guardó
+        task = asyncio.create_task(save_chunk(self.video_id, index, data))
+        _pending_disk_writes.add(task)
+        task.add_done_callback(_pending_disk_writes.discard)
+
+    async def _iter_chunks(self, first_index: int, last_index: int):
+        """
+        Genera los chunks [first_index, last_index] en orden.
+        Los que están en caché se leen de disco; cada hueco contiguo se pide a
+        Telegram con read-ahead paralelo y se escribe de vuelta a la caché.
+        """
+        index = first_index
+        while index <= last_index:
+            data = await self._read_cached_chunk(index)
+            if data is not None:
+                yield data
+                index += 1
+                continue
+
+            # Hueco: hasta el siguiente chunk ya cacheado (o el final del rango)
+            gap_end = index
+            while gap_end < last_index and not (self.video_id and has_chunk(self.video_id, gap_end + 1)):
+                gap_end += 1
+
+            async with aclosing(self._fetch_gap(index, gap_end)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+                    index += 1
+            if index <= gap_end:
+                return  # Telegram no devolvió más datos (fin de archivo o desconexión)
+
+    async def _fetch_chunk(self, index: int) -> bytes:
+        """Baja un único chunk de Telegram y lo escribe en la caché."""
+        data = await fetch_telegram_chunk(self.client, self.message, self.video_id, index)
+        self._write_through(index, data)
+        return data
+
+    async def _fetch_gap(self, first_index: int, last_index: int):
+        """
+        Pipeline de read-ahead: mantiene hasta 'window.size' chunks pidiéndose en
+        paralelo y los entrega en orden. Al cerrarse el generador (seek o
+        desconexión del navegador) se cancelan los que sigan en vuelo.
+        """
+        window = ReadAheadWindow()
+        pending: dict[int, asyncio.Task] = {}
+        next_index = first_index
+        try:
+            for index in range(first_index, last_index + 1):
+                # Verificar conexión antes de pedir más
+                if not self.client.is_connected:
+                    print("⚠️ Cliente de Telegram desconectado durante stream.")
+                    return
+                while next_index <= last_index and len(pending) < window.size:
+                    pending[next_index] = asyncio.create_task(self._fetch_chunk(next_index))
+                    next_index += 1
+
+                data = await pending.pop(index)
+                if not data:
+                    return
+                yielded_at = time.monotonic()
+                yield data
+                window.record_interval(time.monotonic() - yielded_at)
+        finally:
+            for task in pending.values():
+                task.cancel()
+
     def get_headers(self, start: int, end: int) -> dict:
         return {
             "Content-Range": f"bytes {start}-{end}/{self.total_size}",
@@ -110,16 +262,9 @@ class TelegramVideoSender:
         try:
             # CASO A: LOCAL COMPLETO
             if self.local_path and os.path.exists(self.local_path):
-                chunk_size = 64 * 1024
-                async with aiofiles.open(self.local_path, mode='rb') as f:
-                    await f.seek(start)
-                    bytes_to_send = end - start + 1
-                    while bytes_to_send > 0:
-                        read_size = min(chunk_size, bytes_to_send)
-                        data = await f.read(read_size)
-                        if not data: break
-                        yield data
-                        bytes_to_send -= len(data)
+                # Bloques grandes leídos en un hilo (menos saltos al event loop que 64 KB con aiofiles)
+                async for data in iter_file_range(self.local_path, start, end):
+                    yield data
                 return
 
             # CASO B: HÍBRIDO (RAM/Disk -> Telegram)
@@ -131,59 +276,43 @@ class TelegramVideoSender:
             if self.video_id:
                 cached = get_from_ram(self.video_id)
                 if cached:
-                    ram_data = cached['data']
-                    ram_size = len(ram_data)
-                    
-                    if start < ram_size:
-                        end_in_ram = min(start + bytes_to_send, ram_size)
-                        chunk = ram_data[start:end_in_ram]
-                        
+                    # Se sirve chunk a chunk, sin copiar el prefijo completo
+                    for chunk in cached.iter_range(start, start + bytes_to_send):
                         yield chunk
-                        sent_len = len(chunk)
-                        bytes_sent += sent_len
-                        current_offset += sent_len
-                        
-                        if bytes_sent >= bytes_to_send:
-                            return
+                        bytes_sent += len(chunk)
+                        current_offset += len(chunk)
+
+                    if bytes_sent >= bytes_to_send:
+                        return
 
             if self.is_fully_cached: return 
 
-            # 2. Transición a Telegram
+            # 2. Caché de chunks (disco) y, solo para los huecos, Telegram
             if not self.message:
                 await self._fetch_from_telegram_with_retries(3)
 
-            # Loop Telegram con manejo de cancelación
-            TG_CHUNK_SIZE = 1024 * 1024
-            chunk_index = current_offset // TG_CHUNK_SIZE
-            offset_in_chunk = current_offset % TG_CHUNK_SIZE
-            
-            async for chunk in self.client.stream_media(self.message, offset=chunk_index):
-                # Verificar conexión antes de procesar
-                if not self.client.is_connected:
-                    print("⚠️ Cliente de Telegram desconectado durante stream.")
-                    break
+            first_index = current_offset // CHUNK_SIZE
+            last_index = (start + bytes_to_send - 1) // CHUNK_SIZE
+            offset_in_chunk = current_offset % CHUNK_SIZE
 
-                # Recorte inicial
-                if offset_in_chunk > 0:
-                    if len(chunk) <= offset_in_chunk:
-                        offset_in_chunk -= len(chunk)
-                        chunk_index += 1
-                        continue
-                    chunk = chunk[offset_in_chunk:]
-                    offset_in_chunk = 0
-                
-                # Recorte final
-                remaining = bytes_to_send - bytes_sent
-                if len(chunk) > remaining:
-                    chunk = chunk[:remaining]
-                
-                if chunk:
-                    yield chunk
-                    bytes_sent += len(chunk)
-                
-                chunk_index += 1
-                if bytes_sent >= bytes_to_send:
-                    break
+            async with aclosing(self._iter_chunks(first_index, last_index)) as chunks:
+                async for chunk in chunks:
+                    # Recorte inicial
+                    if offset_in_chunk > 0:
+                        chunk = chunk[offset_in_chunk:]
+                        offset_in_chunk = 0
+
+                    # Recorte final
+                    remaining = bytes_to_send - bytes_sent
+                    if len(chunk) > remaining:
+                        chunk = chunk[:remaining]
+
+                    if chunk:
+                        yield chunk
+                        bytes_sent += len(chunk)
+
+                    if bytes_sent >= bytes_to_send:
+                        break
 
         except asyncio.CancelledError:
             # El cliente (navegador) suele cancelar el stream al cambiar de rango o cerrar el modal.
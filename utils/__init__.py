@@ -8,6 +8,7 @@ from .helpers import (
     json_serial,
     serialize_pyrogram,
     save_image_as_webp,
+    encode_image_to_webp,
     force_resolve_peer,
     log_timing
 )
@@ -15,6 +16,8 @@ from .websocket import FolderWSManager, ws_manager
 from .mqtt_manager import MQTTManager, get_mqtt_manager, init_mqtt_manager
 from .database_helpers import ensure_column, ensure_columns, table_exists
 from .telegram_helpers import handle_floodwait, safe_telegram_operation
+from .thumb_encoder import save_thumb_as_webp, shutdown_thumb_encoder, get_thumb_encoder_stats
+from .file_response import RangeFileResponse, iter_file_range, parse_range_header
 
 __all__ = [
     "obtener_id_limpio",
@@ -23,6 +26,10 @@ __all__ = [
     "json_serial",
     "serialize_pyrogram",
     "save_image_as_webp",
+    "encode_image_to_webp",
+    "save_thumb_as_webp",
+    "shutdown_thumb_encoder",
+    "get_thumb_encoder_stats",
     "force_resolve_peer",
     "FolderWSManager",
     "ws_manager",
@@ -30,4 +37,7 @@ __all__ = [
     "MQTTManager",
     "get_mqtt_manager",
     "init_mqtt_manager",
+    "RangeFileResponse",
+    "iter_file_range",
+    "parse_range_header",
 ]
@@ -0,0 +1,205 @@
+"""
+Respuesta de archivo local con soporte de Range para el reproductor.
+- Range simple y múltiple (multipart/byteranges), 416 e If-Range.
+- Zero-copy cuando el servidor ASGI lo ofrece: 'http.response.zerocopysend'
+  (el servidor hace os.sendfile sobre el descriptor) o 'http.response.pathsend'
+  (archivo completo). Si no, lectura en bloques grandes en un hilo.
+"""
+import os
+import asyncio
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.responses import Response
+
+# Bloque de lectura del modo sin zero-copy (antes 64 KB con aiofiles)
+FILE_BLOCK_SIZE = 1024 * 1024
+
+_ZEROCOPY = "http.response.zerocopysend"
+_PATHSEND = "http.response.pathsend"
+
+
+def parse_range_header(range_header: str, file_size: int) -> list[tuple[int, int]] | None:
+    """
+    Convierte 'bytes=a-b,c-,-n' en rangos inclusivos [(start, end), ...].
+    Retorna None si la cabecera no es válida (se ignora y se sirve completo)
+    y [] si ningún rango es satisfacible (416).
+    """
+    if not range_header or not range_header.strip().lower().startswith("bytes="):
+        return None
+    ranges = []
+    for part in range_header.split("=", 1)[1].split(","):
+        part = part.strip()
+        if not part or "-" not in part:
+            return None
+        first, last = part.split("-", 1)
+        try:
+            if first == "":
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(file_size - suffix, 0), file_size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else file_size - 1
+        except ValueError:
+            return None
+        if start > end and last:
+            return None  # 'a-b' con b < a: cabecera inválida
+        if start >= file_size:
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+    return _merge_ranges(ranges)
+
+
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Une rangos solapados/contiguos (evita servir los mismos bytes varias veces)."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _if_range_matches(if_range: str, etag: str, stat_result: os.stat_result) -> bool:
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range exige comparación fuerte
+        return if_range == etag
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) == int(stat_result.st_mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+async def iter_file_range(path: str, start: int, end: int, block_size: int = FILE_BLOCK_SIZE):
+    """Lee [start, end] del archivo en bloques grandes, cada lectura en un hilo."""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = await asyncio.to_thread(f.read, min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+class RangeFileResponse(Response):
+    """
+    Sirve un archivo local respetando Range / If-Range.
+    200 sin Range, 206 con uno o varios rangos, 416 si no hay rango satisfacible.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        media_type: str = "application/octet-stream",
+        stat_result: os.stat_result | None = None,
+    ):
+        self.path = path
+        self.stat_result = stat_result or os.stat(path)
+        self.background = None
+        self.media_type = media_type
+        file_size = self.stat_result.st_size
+        etag = make_etag(self.stat_result)
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(self.stat_result.st_mtime, usegmt=True),
+        }
+
+        ranges = parse_range_header(range_header, file_size) if range_header else None
+        if ranges is not None and if_range and not _if_range_matches(if_range, etag, self.stat_result):
+            ranges = None  # El archivo cambió: se sirve completo
+
+        self.ranges: list[tuple[int, int]] = []
+        self.boundary = None
+        self.part_headers: list[bytes] = []
+
+        if ranges is None:
+            self.status_code = 200
+            self.ranges = [(0, file_size - 1)] if file_size else []
+            headers["content-length"] = str(file_size)
+        elif not ranges:
+            self.status_code = 416
+            headers["content-range"] = f"bytes */{file_size}"
+            headers["content-length"] = "0"
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.ranges = ranges
+            headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            headers["content-length"] = str(end - start + 1)
+        else:
+            self.status_code = 206
+            self.ranges = ranges
+            self.boundary = secrets.token_hex(12)
+            self.part_headers = [
+                (
+                    f"--{self.boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+                ).encode("latin-1")
+                for start, end in ranges
+            ]
+            length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(self.part_headers, ranges))
+            length += len(f"--{self.boundary}--\r\n")
+            headers["content-length"] = str(length)
+            self.media_type = f"multipart/byteranges; boundary={self.boundary}"
+
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not self.ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if self.boundary is None:
+            start, end = self.ranges[0]
+            if self.status_code == 200 and _PATHSEND in extensions:
+                await send({"type": _PATHSEND, "path": self.path})
+                return
+            await self._send_range(send, extensions, start, end, more_body=False)
+            return
+
+        for header, (start, end) in zip(self.part_headers, self.ranges):
+            await send({"type": "http.response.body", "body": header, "more_body": True})
+            await self._send_range(send, extensions, start, end, more_body=True)
+            await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": f"--{self.boundary}--\r\n".encode(), "more_body": False})
+
+    async def _send_range(self, send, extensions: dict, start: int, end: int, more_body: bool) -> None:
+        if _ZEROCOPY in extensions:
+            # El servidor hace os.sendfile(socket, fd, offset, count): sin copias a espacio de usuario
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                await send({
+                    "type": _ZEROCOPY,
+                    "file": fd,
+                    "offset": start,
+                    "count": end - start + 1,
+                    "more_body": more_body,
+                })
+            finally:
+                os.close(fd)
+            return
+
+        async for data in iter_file_range(self.path, start, end):
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+        if not more_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
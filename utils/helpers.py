@@ -1,6 +1,7 @@
 """
 Funciones auxiliares y de conversión.
 """
+import io
 import os
 import datetime
 from PIL import Image
@@ -10,6 +11,8 @@ from pyrogram.raw.functions.messages import GetChats
 from pyrogram.raw.functions.users import GetUsers
 from datetime import datetime
 
+from config import THUMB_WEBP_QUALITY, THUMB_WEBP_METHOD
+
 def log_timing(msg: str, end: str = "\n"):
     now = datetime.now().strftime("%H:%M:%S.%f")[:-3]
     print(f"[{now}] {msg}", end=end)
@@ -74,18 +77,58 @@ def serialize_pyrogram(obj):
         return obj
 
 
-def save_image_as_webp(source_path: str, dest_path: str) -> str:
+def _webp_mode(img: Image.Image) -> Image.Image:
+    return img.convert("RGBA") if img.mode in ("RGBA", "LA") else img.convert("RGB")
+
+
+def save_image_as_webp(
+    source_path: str, dest_path: str, quality: int = THUMB_WEBP_QUALITY, method: int = THUMB_WEBP_METHOD
+) -> str:
     """Convierte una imagen temporal al formato WebP y la guarda en dest_path."""
     with Image.open(source_path) as img:
-        if img.mode in ("RGBA", "LA"):
-            converted = img.convert("RGBA")
-        else:
-            converted = img.convert("RGB")
+        converted = _webp_mode(img)
         os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        converted.save(dest_path, format="WEBP", quality=90, method=6)
+        converted.save(dest_path, format="WEBP", quality=quality, method=method)
     return dest_path
 
 
+def encode_image_to_webp(data: bytes, quality: int = THUMB_WEBP_QUALITY, method: int = THUMB_WEBP_METHOD) -> bytes:
+    """Decodifica una imagen desde memoria y la devuelve en WebP (sin archivos temporales)."""
+    out = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as img:
+        _webp_mode(img).save(out, format="WEBP", quality=quality, method=method)
+    return out.getvalue()
+
+
+def compose_sprite_webp(
+    tiles: list[bytes | None], cols: int, tile_w: int, tile_h: int,
+    quality: int = THUMB_WEBP_QUALITY, method: int = THUMB_WEBP_METHOD,
+) -> bytes:
+    """
+    Arma una hoja de sprites (fila por fila, 'cols' columnas) con cada imagen
+    encajada en su celda sobre fondo negro, como object-fit: contain.
+    Las celdas vacías o ilegibles quedan en negro.
+    """
+    rows = max(1, -(-len(tiles) // cols))
+    sheet = Image.new("RGB", (cols * tile_w, rows * tile_h), (0, 0, 0))
+    for i, data in enumerate(tiles):
+        if not data:
+            continue
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img.draft("RGB", (tile_w, tile_h))  # JPEG: decodifica ya reducido
+                tile = img.convert("RGB")
+        except Exception:
+            continue
+        tile.thumbnail((tile_w, tile_h))
+        x = (i % cols) * tile_w + (tile_w - tile.width) // 2
+        y = (i // cols) * tile_h + (tile_h - tile.height) // 2
+        sheet.paste(tile, (x, y))
+    out = io.BytesIO()
+    sheet.save(out, format="WEBP", quality=quality, method=method)
+    return out.getvalue()
+
+
 async def force_resolve_peer(client, raw_peer):
     """Intenta 'despertar' al peer usando Raw API con tipos correctos."""
     try:
@@ -0,0 +1,160 @@
+"""
+pHash de thumbs como enteros de 64 bits y búsqueda por distancia de Hamming.
+thumb_phash (hex de imagehash) se guarda también como INTEGER en thumb_phash64
+(con signo, que es lo que admite SQLite). Los grupos por radio usan
+multi-index hashing: si dos hashes difieren en <= r bits, al partirlos en r+1
+bloques al menos uno coincide exacto (palomar), así solo se comparan los que
+comparten algún bloque. Con numpy todo va vectorizado; sin numpy, en Python.
+"""
+try:
+    import numpy as np
+except Exception:
+    np = None  # type: ignore
+
+_MASK64 = (1 << 64) - 1
+
+if np is not None:
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def phash_to_int(value: str | None) -> int | None:
+    """Hex de 16 caracteres -> int64 con signo (None si no es un phash válido)."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        n = int(value, 16)
+    except ValueError:
+        return None
+    if n > _MASK64:
+        return None
+    return n - (1 << 64) if n >= 1 << 63 else n
+
+
+def phash_to_hex(value: int) -> str:
+    return f"{value & _MASK64:016x}"
+
+
+def _popcount(x):
+    """Bits en 1 de cada uint64 del array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def _as_uint64(hashes):
+    return np.asarray(hashes, dtype=np.int64).view(np.uint64)
+
+
+def _blocks(max_distance: int) -> list[tuple[int, int]]:
+    """(desplazamiento, máscara) de los max_distance+1 bloques en que se parte el hash."""
+    m = max(1, min(64, max_distance + 1))
+    bloques, shift = [], 0
+    for i in range(m):
+        bits = 64 // m + (1 if i < 64 % m else 0)
+        bloques.append((shift, (1 << bits) - 1))
+        shift += bits
+    return bloques
+
+
+def hamming_within(hashes, target: int, max_distance: int) -> list[int]:
+    """Índices de hashes a distancia <= max_distance de target (recorrido completo)."""
+    if np is not None:
+        arr = _as_uint64(hashes)
+        t = np.array([target], dtype=np.int64).view(np.uint64)[0]
+        return np.nonzero(_popcount(arr ^ t) <= max_distance)[0].tolist()
+    t = target & _MASK64
+    return [i for i, h in enumerate(hashes) if ((h & _MASK64) ^ t).bit_count() <= max_distance]
+
+
+def _pairs_numpy(uniq, max_distance: int):
+    """Pares (i, j) de valores únicos a distancia <= max_distance."""
+    pares_a, pares_b = [], []
+    for shift, mask in _blocks(max_distance):
+        keys = (uniq >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind="stable")
+        keys_s, vals_s = keys[order], uniq[order]
+        # Compara cada posición con la que está k lugares después mientras compartan bloque
+        for k in range(1, len(order)):
+            same = keys_s[k:] == keys_s[:-k]
+            if not same.any():
+                break
+            cerca = same & (_popcount(vals_s[k:] ^ vals_s[:-k]) <= max_distance)
+            if cerca.any():
+                pares_a.append(order[:-k][cerca])
+                pares_b.append(order[k:][cerca])
+    if not pares_a:
+        return None, None
+    return np.concatenate(pares_a), np.concatenate(pares_b)
+
+
+def _labels_numpy(n: int, a, b):
+    """Componentes conexas por propagación de la etiqueta mínima."""
+    labels = np.arange(n)
+    if a is None:
+        return labels
+    while True:
+        m = np.minimum(labels[a], labels[b])
+        nuevas = labels.copy()
+        np.minimum.at(nuevas, a, m)
+        np.minimum.at(nuevas, b, m)
+        while True:
+            saltos = nuevas[nuevas]
+            if np.array_equal(saltos, nuevas):
+                break
+            nuevas = saltos
+        if np.array_equal(nuevas, labels):
+            return labels
+        labels = nuevas
+
+
+def _labels_python(uniq: list[int], max_distance: int) -> list[int]:
+    parent = list(range(len(uniq)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for shift, mask in _blocks(max_distance):
+        buckets: dict[int, list[int]] = {}
+        for i, h in enumerate(uniq):
+            buckets.setdefault((h >> shift) & mask, []).append(i)
+        for idxs in buckets.values():
+            for p, i in enumerate(idxs):
+                for j in idxs[p + 1:]:
+                    if (uniq[i] ^ uniq[j]).bit_count() <= max_distance:
+                        ri, rj = find(i), find(j)
+                        if ri != rj:
+                            parent[rj] = ri
+    return [find(i) for i in range(len(uniq))]
+
+
+def cluster_phashes(hashes: list[int], max_distance: int) -> list[int]:
+    """
+    Agrupa hashes unidos por cadenas de distancia <= max_distance.
+    Devuelve un id de grupo (0..n-1, compacto) por cada hash de entrada.
+    """
+    if len(hashes) == 0:
+        return []
+    max_distance = max(0, min(63, int(max_distance)))
+    if np is not None:
+        # Los iguales se resuelven con unique; solo se comparan los valores distintos
+        uniq, inverse = np.unique(_as_uint64(hashes), return_inverse=True)
+        if max_distance == 0 or len(uniq) == 1:
+            return inverse.tolist()
+        a, b = _pairs_numpy(uniq, max_distance)
+        _, compact = np.unique(_labels_numpy(len(uniq), a, b), return_inverse=True)
+        return compact[inverse].tolist()
+
+    unsigned = [h & _MASK64 for h in hashes]
+    uniq_py = sorted(set(unsigned))
+    pos = {h: i for i, h in enumerate(uniq_py)}
+    roots = _labels_python(uniq_py, max_distance) if max_distance else list(range(len(uniq_py)))
+    compact_py: dict[int, int] = {}
+    return [compact_py.setdefault(roots[pos[h]], len(compact_py)) for h in unsigned]
+
+
+def numpy_available() -> bool:
+    return np is not None
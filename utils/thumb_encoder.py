@@ -0,0 +1,107 @@
+"""
+Codificación de thumbs a WebP sin archivos temporales.
+Los bytes descargados en memoria se decodifican y codifican en un pool de
+procesos acotado (THUMB_ENCODE_WORKERS): PIL es CPU puro y en hilos compite
+por el GIL con el event loop. Solo el .webp final se escribe a disco.
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import THUMB_WEBP_QUALITY, THUMB_WEBP_METHOD, THUMB_ENCODE_WORKERS
+from .helpers import encode_image_to_webp, compose_sprite_webp
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_stats = {"encoded": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0, "sprites": 0}
+
+
+def _get_executor() -> ProcessPoolExecutor | None:
+    global _executor
+    if THUMB_ENCODE_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=THUMB_ENCODE_WORKERS)
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _run(fn, *args):
+    executor = _get_executor()
+    if executor is None:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def encode_webp(data: bytes, quality: int = THUMB_WEBP_QUALITY, method: int = THUMB_WEBP_METHOD) -> bytes:
+    """Imagen en bytes (JPEG/PNG/...) -> WebP en bytes, fuera del event loop."""
+    try:
+        webp = await _run(encode_image_to_webp, data, quality, method)
+    except BrokenProcessPool:
+        # Un worker murió: se recrea el pool en la siguiente llamada
+        _reset_executor()
+        _stats["errors"] += 1
+        raise
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    _stats["encoded"] += 1
+    _stats["bytes_in"] += len(data)
+    _stats["bytes_out"] += len(webp)
+    return webp
+
+
+async def encode_sprite(
+    tiles: list[bytes | None], cols: int, tile_w: int, tile_h: int,
+    quality: int = THUMB_WEBP_QUALITY, method: int = THUMB_WEBP_METHOD,
+) -> bytes:
+    """Hoja de sprites WebP a partir de los thumbs en bytes (en el pool de procesos)."""
+    try:
+        sprite = await _run(compose_sprite_webp, tiles, cols, tile_w, tile_h, quality, method)
+    except BrokenProcessPool:
+        _reset_executor()
+        _stats["errors"] += 1
+        raise
+    _stats["sprites"] += 1
+    return sprite
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+async def save_thumb_as_webp(
+    data: bytes, dest_path: str, quality: int = THUMB_WEBP_QUALITY, method: int = THUMB_WEBP_METHOD
+) -> str:
+    """Codifica la imagen en memoria y escribe solo el .webp final en dest_path."""
+    webp = await encode_webp(data, quality, method)
+    await asyncio.to_thread(_write_atomic, dest_path, webp)
+    return dest_path
+
+
+def shutdown_thumb_encoder() -> None:
+    """Cierra el pool de procesos (hook de shutdown)."""
+    _reset_executor()
+
+
+def get_thumb_encoder_stats() -> dict:
+    return {
+        **_stats,
+        "workers": THUMB_ENCODE_WORKERS,
+        "quality": THUMB_WEBP_QUALITY,
+        "method": THUMB_WEBP_METHOD,
+    }